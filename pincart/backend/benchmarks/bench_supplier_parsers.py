@@ -0,0 +1,82 @@
+"""PinCart AI — Supplier parser micro-benchmark.
+
+Parses every page in ``tests/fixtures/suppliers`` with the streaming
+parsers, checks the output against ``expected.json`` and reports throughput.
+The previous whole-page regexes are timed alongside as a baseline.
+
+    python benchmarks/bench_supplier_parsers.py --iterations 200
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+
+from services.supplier_parsers import PARSERS, iter_chunks, parse_chunks
+
+CORPUS = BACKEND / "tests" / "fixtures" / "suppliers"
+
+# Regexes used by routers/match.py before the streaming parsers
+_LEGACY_ALI = re.compile(
+    r'"productId":"?(\d+)"?.*?"title":"([^"]*)".*?"salePrice":"?([0-9.]+)"?'
+)
+_LEGACY_CJ_PRICE = re.compile(r"\$([0-9]+\.?[0-9]*)")
+_LEGACY_CJ_TITLE = re.compile(r'title="([^"]{10,80})"')
+
+
+def _legacy(kind: str, text: str) -> list:
+    if kind == "aliexpress":
+        return _LEGACY_ALI.findall(text[:50000])[:5]
+    prices = _LEGACY_CJ_PRICE.findall(text[:30000])
+    titles = _LEGACY_CJ_TITLE.findall(text[:30000])
+    return list(zip(titles[:3], prices[:3]))
+
+
+def _time(fn, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    ap.add_argument("--iterations", type=int, default=100)
+    ap.add_argument("--chunk-size", type=int, default=16 * 1024)
+    ap.add_argument("--limit", type=int, default=10)
+    args = ap.parse_args()
+
+    expected = json.loads((CORPUS / "expected.json").read_text())
+    failures = 0
+    print(f"{'page':<30} {'KiB':>7} {'stream ms':>10} {'MiB/s':>8} {'legacy ms':>10}")
+    for page, case in sorted(expected.items()):
+        data = (CORPUS / page).read_bytes()
+        kind = case["parser"]
+
+        def stream(kind=kind, data=data):
+            return parse_chunks(
+                PARSERS[kind](limit=args.limit), iter_chunks(data, args.chunk_size)
+            )
+
+        if stream() != case["products"]:
+            failures += 1
+            print(f"{page}: output differs from expected.json")
+        text = data.decode("utf-8", "replace")
+        stream_s = _time(stream, args.iterations)
+        legacy_s = _time(
+            lambda kind=kind, text=text: _legacy(kind, text),
+            max(1, args.iterations // 10),
+        )
+        print(
+            f"{page:<30} {len(data) / 1024:>7.1f} {stream_s * 1000:>10.3f} "
+            f"{len(data) / stream_s / 2**20:>8.1f} {legacy_s * 1000:>10.3f}"
+        )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,19 @@
 """PinCart AI — Celery async task queue for Pinterest scraping."""
+import asyncio
+import datetime
 import os
+from collections.abc import Coroutine
+from typing import Any
 
 from celery import Celery
+from celery.result import AsyncResult
 
 REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+FRONTEND_URL: str = os.getenv("FRONTEND_URL", "http://localhost:3000")
+PREWARM_INTERVAL: int = int(os.getenv("PREWARM_INTERVAL_SECONDS", "900"))
+STRIPE_SWEEP_INTERVAL: int = int(
+    os.getenv("STRIPE_EVENT_SWEEP_INTERVAL_SECONDS", "300")
+)
 
 celery_app = Celery(
     "pincart",
@@ -22,13 +32,86 @@ celery_app.conf.update(
     worker_concurrency=2,
     task_acks_late=True,
     worker_prefetch_multiplier=1,
+    task_track_started=True,
+    result_expires=24 * 3600,
+    beat_schedule={
+        "prewarm-discover-cache": {
+            "task": "celery_worker.prewarm_discover_cache",
+            "schedule": PREWARM_INTERVAL,
+        },
+        "sweep-stripe-events": {
+            "task": "celery_worker.sweep_stripe_events",
+            "schedule": STRIPE_SWEEP_INTERVAL,
+        },
+    },
 )
 
 
+def _run_async(coro: Coroutine[Any, Any, Any]) -> Any:
+    """Run *coro* on a fresh event loop, closing loop-bound clients afterwards."""
+    from core.cache import close_redis
+    from services.http_client import close_http_clients
+
+    async def runner() -> Any:
+        try:
+            return await coro
+        finally:
+            # Let background writes (e.g. durable cache saves) finish first
+            pending = [
+                t for t in asyncio.all_tasks() if t is not asyncio.current_task()
+            ]
+            if pending:
+                await asyncio.wait(pending, timeout=30)
+            await close_http_clients()
+            await close_redis()
+
+    return asyncio.run(runner())
+
+
+def job_status(job_id: str) -> dict:
+    """Map a Celery task's state to the job payload returned by the API.
+
+    Celery reports unknown ids as ``PENDING``, so those show up as queued.
+    """
+    result = AsyncResult(job_id, app=celery_app)
+    state = result.state
+    payload: dict = {"job_id": job_id, "state": state}
+    if state == "SUCCESS":
+        payload.update(status="complete", result=result.result)
+    elif state == "FAILURE":
+        payload.update(status="failed", error=str(result.result))
+    elif state in ("STARTED", "RETRY"):
+        payload["status"] = "running"
+    else:
+        payload["status"] = "queued"
+    return payload
+
+
+async def _scrape_and_notify(keyword: str, notify_email: str | None) -> dict:
+    from routers.discover import _scrape_pinterest
+    from services.mailgun_client import render_template, send_email
+
+    results = await _scrape_pinterest(keyword, refresh=True)
+    if notify_email and results:
+        html = render_template(
+            "scraping_complete",
+            keyword=keyword,
+            count=len(results),
+            dashboard_url=f"{FRONTEND_URL}/dashboard",
+            year=datetime.date.today().year,
+        )
+        await send_email(notify_email, f'Your "{keyword}" products are ready', html)
+    return {"keyword": keyword, "count": len(results), "products": results}
+
+
 @celery_app.task(bind=True, max_retries=2, default_retry_delay=10)
-def scrape_pinterest_task(self, keyword: str) -> dict:
+def scrape_pinterest_task(
+    self, keyword: str, notify_email: str | None = None
+) -> dict:
     """Run Pinterest scraping as a background Celery task.
 
+    Results are written through the discover cache, so ``/discover`` serves
+    them afterwards. Emails *notify_email* when products were found.
     Requires the default prefork/solo pool (not gevent/eventlet).
 
     Usage::
@@ -36,11 +119,181 @@ def scrape_pinterest_task(self, keyword: str) -> dict:
         result = scrape_pinterest_task.delay("home decor")
         data = result.get(timeout=60)
     """
-    import asyncio
-    from routers.discover import _scrape_pinterest
-
     try:
-        results = asyncio.run(_scrape_pinterest(keyword))
-        return {"keyword": keyword, "count": len(results), "products": results}
+        return _run_async(_scrape_and_notify(keyword, notify_email))
     except Exception as exc:
         raise self.retry(exc=exc)
+
+
+@celery_app.task(bind=True, max_retries=1, default_retry_delay=10)
+def scrape_pinterest_batch_task(self, keywords: list[str]) -> dict:
+    """Scrape several keywords in one shared browser session.
+
+    Usage::
+
+        result = scrape_pinterest_batch_task.delay(["desk lamp", "cat bed"])
+    """
+    from routers.discover import _merge_batch, _scrape_batch
+
+    try:
+        results = _run_async(_scrape_batch(keywords))
+    except Exception as exc:
+        raise self.retry(exc=exc) from exc
+    return {
+        "results": {
+            keyword: {"count": len(pins), "products": pins}
+            for keyword, pins in results.items()
+        },
+        "unique_products": _merge_batch(results),
+    }
+
+
+@celery_app.task(
+    bind=True,
+    max_retries=1,
+    default_retry_delay=10,
+    soft_time_limit=600,  # titles queue on the per-supplier concurrency limit
+    time_limit=660,
+)
+def match_products_task(self, titles: list[str]) -> dict:
+    """Match a large batch of product titles against every supplier.
+
+    Usage::
+
+        result = match_products_task.delay(["led desk lamp", "cat bed"])
+    """
+    from routers.match import match_batch
+
+    try:
+        return _run_async(match_batch(titles))
+    except Exception as exc:
+        raise self.retry(exc=exc) from exc
+
+
+async def _generate_and_notify(
+    batch_id: str, index: int, item: dict, attempt: int, final_attempt: bool
+) -> dict:
+    from services.generation_batch import run_item
+    from services.mailgun_client import render_template, send_email
+
+    result = await run_item(batch_id, index, item, attempt, final_attempt)
+    batch = result["batch"]
+    if result["batch_done"] and batch["notify_email"]:
+        html = render_template(
+            "generation_complete",
+            completed=batch["completed"],
+            failed=batch["failed"],
+            total=batch["total"],
+            dashboard_url=f"{FRONTEND_URL}/dashboard",
+            year=datetime.date.today().year,
+        )
+        await send_email(
+            batch["notify_email"],
+            f"Your {batch['completed']} product pages are ready",
+            html,
+        )
+    return result
+
+
+@celery_app.task(bind=True, max_retries=6, default_retry_delay=30)
+def generate_page_task(self, batch_id: str, index: int, item: dict) -> dict:
+    """Generate one page of a ``/generate/batch`` batch.
+
+    Waits for the global OpenAI budget and retries 429s and transient API
+    errors with exponential backoff; after the last retry the item is
+    recorded as failed so the batch still completes.
+
+    Usage::
+
+        generate_page_task.delay(batch_id, 0, {"product_name": "Cat bed"})
+    """
+    from services.generation_batch import RetryLater
+
+    attempt = self.request.retries
+    try:
+        result = _run_async(
+            _generate_and_notify(
+                batch_id, index, item, attempt, attempt >= self.max_retries
+            )
+        )
+    except RetryLater as exc:
+        raise self.retry(countdown=exc.countdown)
+    except Exception as exc:
+        raise self.retry(exc=exc) from exc
+    return {
+        "batch_id": batch_id,
+        "index": index,
+        "status": result["status"],
+        "generation_id": result.get("generation_id"),
+    }
+
+
+@celery_app.task
+def prewarm_discover_cache() -> dict:
+    """Queue refreshes for hot keywords whose cache entry is about to expire.
+
+    Runs every ``PREWARM_INTERVAL_SECONDS`` via Celery beat; refreshes are
+    staggered across the interval instead of firing all at once.
+    """
+    from services.prewarm import plan_refreshes
+
+    plan = _run_async(plan_refreshes(PREWARM_INTERVAL))
+    for keyword, countdown in plan:
+        refresh_discover_keyword.apply_async((keyword,), countdown=countdown)
+    return {"queued": [keyword for keyword, _ in plan]}
+
+
+@celery_app.task(bind=True, max_retries=20, default_retry_delay=30)
+def refresh_discover_keyword(self, keyword: str) -> dict:
+    """Re-scrape one keyword under the global pre-warm concurrency cap."""
+    from services.prewarm import acquire_slot, release_slot
+
+    async def run() -> dict:
+        slot = await acquire_slot()
+        if slot is None:
+            return {"keyword": keyword, "deferred": True}
+        try:
+            return await _scrape_and_notify(keyword, None)
+        finally:
+            await release_slot(slot)
+
+    result = _run_async(run())
+    if result.get("deferred"):
+        raise self.retry()
+    return {"keyword": keyword, "count": result["count"]}
+
+
+@celery_app.task(bind=True, max_retries=8, default_retry_delay=15)
+def process_stripe_events_task(self, customer_id: str | None, event_id: str) -> dict:
+    """Apply a customer's stored Stripe webhook events in creation order.
+
+    Queued by ``/stripe-webhook`` after the event is stored. Retries while
+    another worker holds the customer, and with backoff when an event fails.
+
+    Usage::
+
+        process_stripe_events_task.delay("cus_123", "evt_123")
+    """
+    from services.stripe_events import CustomerBusy, process_events
+
+    try:
+        return _run_async(process_events(customer_id, event_id))
+    except CustomerBusy:
+        raise self.retry(countdown=2)
+    except Exception as exc:
+        raise self.retry(exc=exc, countdown=min(300, 15 * 2**self.request.retries)) from exc
+
+
+@celery_app.task
+def sweep_stripe_events() -> dict:
+    """Queue Stripe events that were stored but never processed.
+
+    Runs every ``STRIPE_EVENT_SWEEP_INTERVAL_SECONDS`` via Celery beat and
+    picks up events whose task could not be queued or ran out of retries.
+    """
+    from services.stripe_events import stuck_events
+
+    work = stuck_events()
+    for customer_id, event_id in work:
+        process_stripe_events_task.delay(customer_id, event_id)
+    return {"queued": len(work)}
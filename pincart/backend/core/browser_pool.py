@@ -0,0 +1,219 @@
+"""PinCart AI — Warm Chromium browser pool.
+
+Keeps a small number of headless Chromium processes alive for the lifetime
+of the app and hands out fresh, isolated ``BrowserContext``s from them.
+Browsers are recycled after serving a fixed number of contexts, or
+relaunched when they crash. Falls back to a one-shot browser when no pool
+has been started (e.g. inside a Celery task).
+"""
+import asyncio
+import os
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager, suppress
+from typing import Any
+
+from playwright.async_api import Browser, BrowserContext, async_playwright
+
+# Configurable via environment
+POOL_SIZE: int = int(os.getenv("BROWSER_POOL_SIZE", "2"))  # long-lived browsers
+POOL_MAX_CONTEXTS: int = int(os.getenv("BROWSER_POOL_MAX_CONTEXTS", "4"))
+POOL_MAX_PAGES: int = int(os.getenv("BROWSER_POOL_MAX_PAGES", "50"))  # recycle after
+POOL_PREWARM: bool = os.getenv("BROWSER_POOL_PREWARM", "true").lower() == "true"
+
+Launcher = Callable[[], Awaitable[Browser]]
+
+
+class _Slot:
+    """One long-lived browser and its usage counters."""
+
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.browser: Browser | None = None
+        self.active = 0
+        self.pages = 0
+        self.launched_at = 0.0
+
+    def healthy(self) -> bool:
+        return self.browser is not None and self.browser.is_connected()
+
+
+class BrowserPool:
+    """Fixed-size pool of headless browsers with capped concurrency."""
+
+    def __init__(
+        self,
+        size: int = POOL_SIZE,
+        max_contexts: int = POOL_MAX_CONTEXTS,
+        max_pages: int = POOL_MAX_PAGES,
+        launcher: Launcher | None = None,
+    ) -> None:
+        self.size = max(1, size)
+        self.max_contexts = max(1, max_contexts)
+        self.max_pages = max(1, max_pages)
+        self._launcher = launcher
+        self._playwright: Any = None
+        self._slots = [_Slot(i) for i in range(self.size)]
+        self._sem = asyncio.Semaphore(self.max_contexts)
+        self._lock = asyncio.Lock()
+        self._waiting = 0
+        self._closed = False
+        self._stats = {
+            "launches": 0,
+            "launch_failures": 0,
+            "recycles": 0,
+            "crashes": 0,
+            "contexts_served": 0,
+        }
+
+    async def _launch(self) -> Browser:
+        if self._launcher is not None:
+            return await self._launcher()
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        return await self._playwright.chromium.launch(headless=True)
+
+    async def _close_browser(self, slot: _Slot) -> None:
+        browser, slot.browser = slot.browser, None
+        slot.pages = 0
+        if browser is not None:
+            with suppress(Exception):
+                await browser.close()
+
+    async def _ensure(self, slot: _Slot) -> None:
+        """Make sure *slot* holds a connected browser (caller holds the lock)."""
+        if slot.browser is not None and not slot.browser.is_connected():
+            self._stats["crashes"] += 1
+            await self._close_browser(slot)
+        if slot.browser is None:
+            try:
+                slot.browser = await self._launch()
+            except Exception:
+                self._stats["launch_failures"] += 1
+                raise
+            slot.launched_at = time.time()
+            self._stats["launches"] += 1
+
+    async def start(self, prewarm: bool = POOL_PREWARM) -> None:
+        """Optionally launch every browser up front so the first request is warm."""
+        if not prewarm:
+            return
+        async with self._lock:
+            for slot in self._slots:
+                with suppress(Exception):  # Retried lazily on first use
+                    await self._ensure(slot)
+
+    async def _checkout(self) -> _Slot:
+        async with self._lock:
+            if self._closed:
+                raise RuntimeError("Browser pool is closed")
+            # Prefer a browser that is not due for recycling, then the least busy
+            candidates = sorted(
+                self._slots,
+                key=lambda s: (s.pages >= self.max_pages, s.active, s.index),
+            )
+            slot = candidates[0]
+            if slot.pages >= self.max_pages and slot.active == 0:
+                self._stats["recycles"] += 1
+                await self._close_browser(slot)
+            await self._ensure(slot)
+            slot.active += 1
+            return slot
+
+    async def _checkin(self, slot: _Slot) -> None:
+        async with self._lock:
+            slot.active -= 1
+            slot.pages += 1
+            self._stats["contexts_served"] += 1
+            if slot.browser is not None and not slot.browser.is_connected():
+                self._stats["crashes"] += 1
+                await self._close_browser(slot)
+            elif slot.pages >= self.max_pages and slot.active == 0:
+                self._stats["recycles"] += 1
+                await self._close_browser(slot)
+
+    @asynccontextmanager
+    async def context(self, **kwargs: Any) -> AsyncIterator[BrowserContext]:
+        """Yield a fresh ``BrowserContext``; it is closed on exit."""
+        self._waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            slot = await self._checkout()
+            try:
+                ctx = await slot.browser.new_context(**kwargs)
+                try:
+                    yield ctx
+                finally:
+                    with suppress(Exception):
+                        await ctx.close()
+            finally:
+                await self._checkin(slot)
+        finally:
+            self._sem.release()
+
+    async def close(self) -> None:
+        """Close every browser and stop the Playwright driver."""
+        async with self._lock:
+            self._closed = True
+            for slot in self._slots:
+                await self._close_browser(slot)
+            if self._playwright is not None:
+                with suppress(Exception):
+                    await self._playwright.stop()
+                self._playwright = None
+
+    def stats(self) -> dict:
+        """Return pool counters for ``/health``."""
+        return {
+            "size": self.size,
+            "max_contexts": self.max_contexts,
+            "browsers_alive": sum(1 for s in self._slots if s.healthy()),
+            "in_use": sum(s.active for s in self._slots),
+            "waiting": self._waiting,
+            **self._stats,
+        }
+
+
+_pool: BrowserPool | None = None
+
+
+def get_browser_pool() -> BrowserPool | None:
+    """Return the app-wide pool, or *None* if it has not been started."""
+    return _pool
+
+
+async def start_browser_pool() -> BrowserPool:
+    """Create (and optionally pre-warm) the app-wide pool (call on startup)."""
+    global _pool
+    if _pool is None:
+        _pool = BrowserPool()
+        await _pool.start()
+    return _pool
+
+
+async def close_browser_pool() -> None:
+    """Close the app-wide pool (call on shutdown)."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+@asynccontextmanager
+async def browser_context(**kwargs: Any) -> AsyncIterator[BrowserContext]:
+    """Yield a ``BrowserContext`` from the pool, or from a one-shot browser."""
+    if _pool is not None:
+        async with _pool.context(**kwargs) as ctx:
+            yield ctx
+        return
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        try:
+            ctx = await browser.new_context(**kwargs)
+            yield ctx
+        finally:
+            await browser.close()
@@ -9,6 +9,10 @@ import redis.asyncio as redis
 REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 DEFAULT_TTL: int = int(os.getenv("CACHE_TTL_SECONDS", str(24 * 3600)))  # 24 hours
 
+# What Redis calls raise when the server is down or slow; callers that can
+# carry on without Redis catch these
+REDIS_ERRORS = (redis.RedisError, OSError)
+
 _pool: Optional[redis.Redis] = None
 
 
@@ -0,0 +1,71 @@
+"""PinCart AI — Incremental parsing of a streamed JSON object.
+
+``JSONSectionParser`` is fed text as it arrives (e.g. model output tokens)
+and yields each top-level member of the object as soon as its value is
+complete, so callers can show ``seo_title`` long before ``faq`` is written.
+"""
+import json
+from typing import Any
+
+
+class JSONSectionParser:
+    """Emit ``(key, value)`` for each completed top-level member of an object."""
+
+    def __init__(self) -> None:
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key_start: int | None = None
+        self._key: str | None = None
+        self._value_start: int | None = None
+
+    def feed(self, chunk: str) -> list[tuple[str, Any]]:
+        """Add *chunk* and return the members it completed, in order."""
+        self.text += chunk
+        text = self.text
+        sections: list[tuple[str, Any]] = []
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._key_start is not None:
+                        self._key = json.loads(text[self._key_start : i + 1])
+                        self._key_start = None
+                continue
+            if c == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None:
+                    self._key_start = i
+            elif c in "{[":
+                self._depth += 1
+            elif c in "}]":
+                if self._depth == 1:
+                    self._emit(text, i, sections)
+                self._depth -= 1
+            elif self._depth == 1:
+                if c == ":" and self._key is not None and self._value_start is None:
+                    self._value_start = i + 1
+                elif c == ",":
+                    self._emit(text, i, sections)
+        self._pos = len(text)
+        return sections
+
+    def _emit(self, text: str, end: int, sections: list[tuple[str, Any]]) -> None:
+        if self._key is not None and self._value_start is not None:
+            try:
+                sections.append((self._key, json.loads(text[self._value_start : end])))
+            except ValueError:
+                pass  # Malformed member; the final parse will report it
+        self._key = None
+        self._value_start = None
+
+    def result(self) -> Any:
+        """Parse the complete text (raises ``json.JSONDecodeError`` if invalid)."""
+        return json.loads(self.text or "{}")
@@ -0,0 +1,36 @@
+"""PinCart AI — Expiring concurrency slots shared across workers.
+
+A slot pool is a Redis sorted set of holder tokens, each scored by the time
+its lease runs out. Taking a slot first prunes expired holders, so a slot
+held by a worker that was killed (OOM, hard time limit) frees itself after
+*ttl* seconds instead of counting against the limit forever.
+"""
+import time
+import uuid
+from typing import Any
+
+
+async def acquire_lease(r: Any, key: str, limit: int, ttl: float) -> str | None:
+    """Take one of *limit* slots in *key* for *ttl* seconds.
+
+    Returns the holder token to pass to ``release_lease``, or *None* if all
+    slots are held.
+    """
+    token = uuid.uuid4().hex
+    now = time.time()
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.zremrangebyscore(key, "-inf", now)
+        pipe.zadd(key, {token: now + ttl})
+        pipe.zcard(key)
+        # Only drops the idle key; each holder still expires by its own score
+        pipe.expire(key, int(ttl) + 1)
+        held = (await pipe.execute())[2]
+    if held > limit:
+        await r.zrem(key, token)
+        return None
+    return token
+
+
+async def release_lease(r: Any, key: str, token: str) -> None:
+    """Give back the slot taken with *token*."""
+    await r.zrem(key, token)
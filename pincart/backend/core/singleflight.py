@@ -0,0 +1,135 @@
+"""PinCart AI — Request coalescing (single-flight).
+
+``SingleFlight`` makes concurrent callers in one process share a single
+in-flight call per key. ``redis_singleflight`` does the same across workers
+and instances: one caller takes a Redis lease and does the work, the rest
+wait for the result it publishes. When Redis is unavailable the work simply
+runs locally.
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from core.cache import REDIS_ERRORS, _cache_key, get_redis
+
+LEASE_TTL: int = int(os.getenv("SINGLEFLIGHT_LEASE_TTL", "60"))  # seconds
+WAIT_TIMEOUT: float = float(os.getenv("SINGLEFLIGHT_WAIT_TIMEOUT", "45"))
+RESULT_TTL: int = int(os.getenv("SINGLEFLIGHT_RESULT_TTL", "30"))
+POLL_INTERVAL: float = 0.25
+
+# Compare-and-delete so a leader never releases a lease it no longer owns
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlightTimeout(Exception):
+    """Raised when a follower gives up waiting for the leader's result."""
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key within this process."""
+
+    def __init__(self) -> None:
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run *fn* once per *key*; concurrent callers await the same result.
+
+        The call runs as its own task, so a caller that disconnects does not
+        cancel the work for everyone else.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Mark retrieved even if every caller went away
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+
+async def _lead(
+    r: Any,
+    lease_key: str,
+    result_key: str,
+    token: str,
+    fn: Callable[[], Awaitable[Any]],
+    result_ttl: int,
+) -> Any:
+    """Do the work as lease holder, publish the result, release the lease."""
+    try:
+        result = await fn()
+        try:
+            await r.set(result_key, json.dumps(result), ex=result_ttl)
+        except REDIS_ERRORS:
+            pass
+        return result
+    finally:
+        try:
+            await r.eval(_RELEASE_SCRIPT, 1, lease_key, token)
+        except REDIS_ERRORS:
+            pass
+
+
+async def redis_singleflight(
+    namespace: str,
+    key: str,
+    fn: Callable[[], Awaitable[Any]],
+    lease_ttl: int = LEASE_TTL,
+    wait_timeout: float = WAIT_TIMEOUT,
+    result_ttl: int = RESULT_TTL,
+) -> Any:
+    """Run *fn* on at most one worker at a time for *key*.
+
+    Followers poll for the leader's JSON result. If the leader fails or its
+    lease expires, a follower takes over. Raises ``SingleFlightTimeout`` if
+    no result shows up within *wait_timeout* seconds.
+    """
+    lease_key = _cache_key(f"sf-lease:{namespace}", key)
+    result_key = _cache_key(f"sf-result:{namespace}", key)
+    token = uuid.uuid4().hex
+
+    try:
+        r = await get_redis()
+        acquired = await r.set(lease_key, token, nx=True, ex=lease_ttl)
+    except REDIS_ERRORS:
+        return await fn()  # Redis unavailable — do the work ourselves
+
+    if acquired:
+        return await _lead(r, lease_key, result_key, token, fn, result_ttl)
+
+    deadline = time.monotonic() + wait_timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(POLL_INTERVAL)
+        try:
+            raw = await r.get(result_key)
+            # Leader finished without a result, or died and its lease expired
+            took_over = raw is None and await r.set(
+                lease_key, token, nx=True, ex=lease_ttl
+            )
+        except REDIS_ERRORS:
+            return await fn()  # Lost Redis mid-wait
+        if raw is not None:
+            return json.loads(raw)
+        if took_over:
+            return await _lead(r, lease_key, result_key, token, fn, result_ttl)
+    raise SingleFlightTimeout(f"Timed out waiting for in-flight {namespace} '{key}'")
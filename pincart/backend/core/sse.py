@@ -0,0 +1,10 @@
+"""PinCart AI — Server-Sent Events helpers."""
+import json
+from typing import Any
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one SSE frame with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
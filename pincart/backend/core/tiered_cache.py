@@ -0,0 +1,213 @@
+"""PinCart AI — Two-tier cache with stale-while-revalidate.
+
+L1 is a bounded in-process LRU; L2 is the shared Redis layer from
+``core.cache``. An optional durable store (e.g. Postgres) can sit behind
+both as a third tier. Entries carry their write time: fresh entries are
+served as-is, stale ones are served immediately while a background task
+reloads them, and only a full miss makes the caller wait for the loader.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any, Protocol
+
+from core.cache import cache_get, cache_set
+from core.singleflight import SingleFlight
+
+# (stored_at, value)
+Entry = tuple[float, Any]
+Loader = Callable[[], Awaitable[Any]]
+
+
+class DurableStore(Protocol):
+    """Third tier consulted when both L1 and L2 miss."""
+
+    async def load(self, identifier: str) -> Entry | None: ...
+
+    async def save(self, identifier: str, value: Any) -> None: ...
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used key."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = max(1, maxsize)
+        self._data: OrderedDict[str, Entry] = OrderedDict()
+
+    def get(self, key: str) -> Entry | None:
+        entry = self._data.get(key)
+        if entry is not None:
+            self._data.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: Entry) -> None:
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TieredCache:
+    """In-process LRU (L1) in front of Redis (L2), with background refresh."""
+
+    def __init__(
+        self,
+        prefix: str,
+        fresh_ttl: int,
+        stale_ttl: int,
+        maxsize: int = 512,
+        store: DurableStore | None = None,
+        ttl_for: Callable[[Any], tuple[int, int]] | None = None,
+        empty_ttl: int = 0,
+    ) -> None:
+        self.prefix = prefix
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        # Optional per-value (fresh_ttl, stale_ttl), e.g. short TTLs for misses
+        self.ttl_for = ttl_for
+        # Seconds an empty result is cached (L1 + L2 only); 0 reloads every time
+        self.empty_ttl = empty_ttl
+        self.l1 = LRUCache(maxsize)
+        self.store = store
+        self._flight = SingleFlight()
+        self._background: set[asyncio.Task] = set()
+        self.stats = {
+            "l1_hits": 0,
+            "l2_hits": 0,
+            "store_hits": 0,
+            "stale_served": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+            "empty_cached": 0,
+        }
+
+    def _age(self, entry: Entry) -> float:
+        return time.time() - entry[0]
+
+    def _ttls(self, entry: Entry) -> tuple[int, int]:
+        if not entry[1] and self.empty_ttl:
+            return self.empty_ttl, 0
+        if self.ttl_for is not None:
+            return self.ttl_for(entry[1])
+        return self.fresh_ttl, self.stale_ttl
+
+    async def peek(self, identifier: str) -> Entry | None:
+        """Return the newest cached entry, promoting hits to faster tiers, or *None*."""
+        entry = self.l1.get(identifier)
+        if entry is not None and self._age(entry) < self._ttls(entry)[0]:
+            self.stats["l1_hits"] += 1
+            return entry
+
+        raw = await cache_get(self.prefix, identifier)
+        if isinstance(raw, dict) and "ts" in raw:
+            remote: Entry = (float(raw["ts"]), raw.get("value"))
+            if entry is None or remote[0] > entry[0]:
+                self.stats["l2_hits"] += 1
+                self.l1.set(identifier, remote)
+                return remote
+        if entry is not None:
+            self.stats["l1_hits"] += 1
+            return entry
+
+        if self.store is not None:
+            durable = await self.store.load(identifier)
+            if durable is not None:
+                self.stats["store_hits"] += 1
+                self.l1.set(identifier, durable)
+                await self._write_l2(identifier, durable)
+                return durable
+        return None
+
+    async def _write_l2(self, identifier: str, entry: Entry) -> None:
+        ttl = int(entry[0] + sum(self._ttls(entry)) - time.time())
+        if ttl > 0:
+            await cache_set(
+                self.prefix, identifier, {"ts": entry[0], "value": entry[1]}, ttl=ttl
+            )
+
+    def _spawn(self, coro: Awaitable[Any]) -> None:
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def set(self, identifier: str, value: Any) -> None:
+        """Write *value* to every tier, stamped with the current time.
+
+        The durable store is written in the background.
+        """
+        entry: Entry = (time.time(), value)
+        self.l1.set(identifier, entry)
+        await self._write_l2(identifier, entry)
+        if self.store is not None:
+            self._spawn(self.store.save(identifier, value))
+
+    async def invalidate(self, identifier: str) -> None:
+        """Drop *identifier* from L1 and expire it in L2."""
+        self.l1.delete(identifier)
+        await cache_set(self.prefix, identifier, None, ttl=1)
+
+    async def _load(self, identifier: str, loader: Loader) -> Any:
+        value = await loader()
+        if value:
+            await self.set(identifier, value)
+        elif self.empty_ttl:
+            # Never let an empty result overwrite good stale data
+            current = await self.peek(identifier)
+            if not (
+                current is not None
+                and current[1]
+                and self._age(current) < sum(self._ttls(current))
+            ):
+                self.stats["empty_cached"] += 1
+                entry: Entry = (time.time(), value)
+                self.l1.set(identifier, entry)
+                await self._write_l2(identifier, entry)
+        return value
+
+    def _refresh_in_background(self, identifier: str, loader: Loader) -> None:
+        async def run() -> None:
+            self.stats["refreshes"] += 1
+            try:
+                await self._flight.do(
+                    identifier, lambda: self._load(identifier, loader)
+                )
+            except Exception:  # noqa: BLE001
+                self.stats["refresh_failures"] += 1  # Keep serving the stale entry
+
+        self._spawn(run())
+
+    async def get_or_load(self, identifier: str, loader: Loader) -> Any:
+        """Return the cached value, refreshing stale entries in the background.
+
+        Only a miss (or an entry older than ``fresh_ttl + stale_ttl``) waits
+        for *loader*; concurrent misses share one call.
+        """
+        entry = await self.peek(identifier)
+        if entry is not None:
+            age = self._age(entry)
+            fresh_ttl, stale_ttl = self._ttls(entry)
+            if age < fresh_ttl:
+                return entry[1]
+            if age < fresh_ttl + stale_ttl:
+                self.stats["stale_served"] += 1
+                self._refresh_in_background(identifier, loader)
+                return entry[1]
+
+        self.stats["misses"] += 1
+        return await self._flight.do(identifier, lambda: self._load(identifier, loader))
+
+    async def refresh(self, identifier: str, loader: Loader) -> Any:
+        """Reload *identifier* now, bypassing any cached entry."""
+        return await self._flight.do(identifier, lambda: self._load(identifier, loader))
+
+    def snapshot(self) -> dict:
+        """Return counters for ``/health``."""
+        return {"l1_size": len(self.l1), "l1_max": self.l1.maxsize, **self.stats}
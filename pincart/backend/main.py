@@ -15,8 +15,11 @@ from services.sentry_setup import init_sentry
 init_sentry()
 
 from routers import discover, match, generate, export, billing
+from core.browser_pool import close_browser_pool, get_browser_pool, start_browser_pool
 from core.cache import close_redis
 from core.rate_limit import RateLimitMiddleware
+from services.http_client import close_http_clients, get_http_clients, start_http_clients
+from services.user_profiles import profiles
 
 app = FastAPI(title="PinCart AI", version="1.0.0")
 
@@ -56,8 +59,16 @@ app.include_router(export.router, tags=["Export"])
 app.include_router(billing.router, tags=["Billing"])
 
 
+@app.on_event("startup")
+async def _startup() -> None:
+    start_http_clients()
+    await start_browser_pool()
+
+
 @app.on_event("shutdown")
 async def _shutdown() -> None:
+    await close_browser_pool()
+    await close_http_clients()
     await close_redis()
 
 
@@ -72,4 +83,16 @@ async def health() -> dict:
         redis_ok = await r.ping()
     except Exception:
         pass
-    return {"status": "ok", "redis": redis_ok}
+    pool = get_browser_pool()
+    return {
+        "status": "ok",
+        "redis": redis_ok,
+        "browser_pool": pool.stats() if pool else None,
+        "discover_cache": discover._cache.snapshot(),
+        "discover_scraper": discover.scrape_stats(),
+        "generate_cache": generate._cache.snapshot(),
+        "user_profiles": profiles.snapshot(),
+        "models": generate.model_router.snapshot(),
+        "http_clients": get_http_clients().stats(),
+        "suppliers": match.engine.stats(),
+    }
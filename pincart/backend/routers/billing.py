@@ -1,9 +1,15 @@
 """Stripe Billing & Webhook Handler"""
+import asyncio
+import json
 import os
+from contextlib import suppress
 import stripe
 from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel
 from db import supabase
+from celery_worker import process_stripe_events_task
+from services.stripe_events import customer_of, record_event
+from services.user_profiles import profiles
 
 router = APIRouter()
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY", "")
@@ -31,13 +37,16 @@ async def create_checkout(req: CheckoutRequest):
 
     try:
         # Get or create Stripe customer
-        user_data = supabase.table("users").select("stripe_customer_id").eq("id", req.user_id).single().execute()
-        customer_id = user_data.data.get("stripe_customer_id") if user_data.data else None
+        profile = await profiles.get(req.user_id)
+        if profile is None:
+            raise HTTPException(404, "User not found")
+        customer_id = profile.get("stripe_customer_id")
 
         if not customer_id:
             customer = stripe.Customer.create(email=req.email, metadata={"user_id": req.user_id})
             customer_id = customer.id
             supabase.table("users").update({"stripe_customer_id": customer_id}).eq("id", req.user_id).execute()
+            await profiles.invalidate([req.user_id])
 
         session = stripe.checkout.Session.create(
             customer=customer_id,
@@ -49,6 +58,8 @@ async def create_checkout(req: CheckoutRequest):
             metadata={"user_id": req.user_id, "plan": req.plan},
         )
         return {"checkout_url": session.url}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Checkout creation failed: {str(e)}")
 
@@ -57,8 +68,8 @@ async def create_checkout(req: CheckoutRequest):
 async def create_portal(req: CheckoutRequest):
     """Create Stripe Customer Portal session for managing subscription."""
     try:
-        user_data = supabase.table("users").select("stripe_customer_id").eq("id", req.user_id).single().execute()
-        customer_id = user_data.data.get("stripe_customer_id") if user_data.data else None
+        profile = await profiles.get(req.user_id)
+        customer_id = profile.get("stripe_customer_id") if profile else None
 
         if not customer_id:
             raise HTTPException(400, "No billing account found. Subscribe to a plan first.")
@@ -76,47 +87,29 @@ async def create_portal(req: CheckoutRequest):
 
 @router.post("/stripe-webhook")
 async def stripe_webhook(request: Request):
-    """Handle Stripe webhook events."""
+    """Verify a Stripe event, store it and acknowledge it straight away.
+
+    The event is applied by a Celery worker, in order with the customer's
+    other events (``services.stripe_events``). Redeliveries of an event id
+    already stored are acknowledged without being queued again. If the
+    event cannot be stored, a 503 makes Stripe retry it later.
+    """
     payload = await request.body()
     sig = request.headers.get("stripe-signature", "")
 
     try:
-        event = stripe.Webhook.construct_event(payload, sig, WEBHOOK_SECRET)
+        stripe.Webhook.construct_event(payload, sig, WEBHOOK_SECRET)
     except (ValueError, stripe.error.SignatureVerificationError):
         raise HTTPException(400, "Invalid webhook signature")
 
-    event_type = event["type"]
-    data = event["data"]["object"]
-
-    if event_type == "checkout.session.completed":
-        user_id = data.get("metadata", {}).get("user_id")
-        plan = data.get("metadata", {}).get("plan", "starter")
-        if user_id:
-            supabase.table("users").update({
-                "plan_tier": plan,
-                "stripe_customer_id": data.get("customer"),
-            }).eq("id", user_id).execute()
-
-    elif event_type == "customer.subscription.updated":
-        customer_id = data.get("customer")
-        status = data.get("status")
-        if customer_id and status == "active":
-            # Plan could have changed
-            price_id = data["items"]["data"][0]["price"]["id"] if data.get("items") else None
-            plan = "starter"
-            for plan_name, pid in PLAN_PRICES.items():
-                if pid == price_id:
-                    plan = plan_name
-                    break
-            supabase.table("users").update({"plan_tier": plan}).eq("stripe_customer_id", customer_id).execute()
-
-    elif event_type == "customer.subscription.deleted":
-        customer_id = data.get("customer")
-        if customer_id:
-            supabase.table("users").update({"plan_tier": "free"}).eq("stripe_customer_id", customer_id).execute()
-
-    elif event_type == "invoice.payment_failed":
-        # Could send email notification here — skip for MVP
-        pass
+    event = json.loads(payload)
+    try:
+        stored = await asyncio.to_thread(record_event, event)
+    except Exception as e:
+        raise HTTPException(503, "Event store is unavailable. Please retry.") from e
+    if not stored:
+        return {"received": True, "duplicate": True}
 
+    with suppress(Exception):  # Stored; the periodic sweep queues it once the broker is back
+        await asyncio.to_thread(process_stripe_events_task.delay, customer_of(event), event["id"])
     return {"received": True}
@@ -1,8 +1,21 @@
 """Pinterest Trend Discovery — Playwright scraper"""
 import asyncio
+import os
 import random
-from fastapi import APIRouter, Query, HTTPException
-from playwright.async_api import async_playwright
+import statistics
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from fastapi import APIRouter, Query, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from playwright.async_api import Error as PlaywrightError
+from pydantic import BaseModel, Field
+from celery_worker import job_status, scrape_pinterest_batch_task, scrape_pinterest_task
+from core.browser_pool import browser_context
+from core.singleflight import SingleFlightTimeout, redis_singleflight
+from core.sse import SSE_HEADERS, sse_event
+from core.tiered_cache import TieredCache
+from services.pin_store import PinStore, record_search
 
 router = APIRouter()
 
@@ -12,109 +25,361 @@ USER_AGENTS = [
     "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
 ]
 
-# In-memory cache: keyword -> (timestamp, results)
-_cache: dict[str, tuple[float, list]] = {}
+# "fast" = block heavy resources + wait on DOM conditions; "legacy" = fixed sleeps
+SCRAPE_MODE = os.getenv("DISCOVER_SCRAPE_MODE", "fast")
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+READY_MIN_PINS = 15  # pins rendered before we consider the page ready
+READY_TIMEOUT_MS = 5000  # hard ceiling for the initial render
+SCROLL_TIMEOUT_MS = 3000  # hard ceiling for the post-scroll render
+TIMING_SAMPLES = 200
+STREAM_SCROLLS = 4  # default scrolls for /discover/stream
+BATCH_MAX_KEYWORDS = 20
+BATCH_PAGE_CONCURRENCY = int(os.getenv("DISCOVER_BATCH_CONCURRENCY", "4"))
+
+# Pinterest renders pins in divs with data-test-id or role=listitem
+PIN_SELECTOR = '[data-test-id="pin"], [role="listitem"]'
+PINIMG_SELECTOR = 'img[src*="pinimg"]'
+
+_EXTRACT_IMAGES_JS = """
+    () => {
+        const results = [];
+        const imgs = document.querySelectorAll('img[src*="pinimg"]');
+        imgs.forEach((img, i) => {
+            if (i >= 50) return;
+            const parent = img.closest('a');
+            results.push({
+                image: img.src || '',
+                title: img.alt || 'Pinterest Product',
+                pin_url: parent ? 'https://www.pinterest.com' + parent.getAttribute('href') : '',
+                saves_text: ''
+            });
+        });
+        return results;
+    }
+"""
+
+# With onlyNew, every pin is returned once (marked on the node) and there is
+# no cap, so each streamed scroll round yields just the pins it revealed
+_EXTRACT_PINS_JS = """
+    (onlyNew) => {
+        const results = [];
+        const pinElements = document.querySelectorAll('[data-test-id="pin"], [role="listitem"]');
+
+        pinElements.forEach((el, i) => {
+            if (onlyNew ? el.dataset.pincartSeen : i >= 50) return; // cap at 50
+
+            const img = el.querySelector('img');
+            const link = el.querySelector('a[href*="/pin/"]');
+            const titleEl = el.querySelector('[title]') || el.querySelector('img');
+
+            if (img && link) {
+                if (onlyNew) el.dataset.pincartSeen = img.dataset.pincartSeen = '1';
+                results.push({
+                    image: img.src || img.getAttribute('srcset')?.split(' ')[0] || '',
+                    title: titleEl?.getAttribute('title') || titleEl?.getAttribute('alt') || 'Untitled Pin',
+                    pin_url: 'https://www.pinterest.com' + (link.getAttribute('href') || ''),
+                    saves_text: ''
+                });
+            }
+        });
+
+        // Fallback: grab all images if structured parsing fails
+        if (results.length === 0) {
+            const imgs = document.querySelectorAll('img[src*="pinimg"]');
+            imgs.forEach((img, i) => {
+                if (onlyNew ? img.dataset.pincartSeen : i >= 50) return;
+                if (onlyNew) img.dataset.pincartSeen = '1';
+                const parent = img.closest('a');
+                results.push({
+                    image: img.src || '',
+                    title: img.alt || 'Pinterest Product',
+                    pin_url: parent ? 'https://www.pinterest.com' + parent.getAttribute('href') : '',
+                    saves_text: ''
+                });
+            });
+        }
+        return results;
+    }
+"""
+
+# Job status streaming
+JOB_POLL_INTERVAL = 1.0  # seconds between Celery state checks
+JOB_STREAM_TIMEOUT = 180  # matches the Celery hard time limit
+
+# Per-stage scrape timings (ms), most recent samples per mode
+_timings: dict[str, deque] = {}
+_scrape_counters = {"blocked_requests": 0}
+
+# Daily sorted sets of searched keywords: pincart:discover:traffic:<YYYYMMDD>
+TRAFFIC_KEY_PREFIX = "pincart:discover:traffic"
+
+# Tiered cache keyed by keyword: in-process LRU, then Redis, then Postgres
 CACHE_TTL = 4 * 3600  # 4 hours
+CACHE_STALE_TTL = int(os.getenv("DISCOVER_STALE_TTL_SECONDS", str(24 * 3600)))
+# Keywords with no results are remembered briefly instead of re-scraped per request
+CACHE_EMPTY_TTL = int(os.getenv("DISCOVER_EMPTY_TTL_SECONDS", "600"))
+_cache = TieredCache(
+    "discover",
+    fresh_ttl=CACHE_TTL,
+    stale_ttl=CACHE_STALE_TTL,
+    empty_ttl=CACHE_EMPTY_TTL,
+    maxsize=int(os.getenv("DISCOVER_L1_MAX_KEYWORDS", "512")),
+    store=PinStore(max_age=CACHE_TTL + CACHE_STALE_TTL),
+)
 
 
-async def _scrape_pinterest(keyword: str) -> list[dict]:
-    """Scrape Pinterest search results for a keyword."""
-    import time
+def _normalize_keyword(keyword: str) -> str:
+    """Lowercase and collapse whitespace so equivalent keywords share a key."""
+    return " ".join(keyword.lower().split())
 
-    # Check cache
-    now = time.time()
-    if keyword.lower() in _cache:
-        ts, results = _cache[keyword.lower()]
-        if now - ts < CACHE_TTL:
-            return results
 
-    pins: list[dict] = []
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(
-            user_agent=random.choice(USER_AGENTS),
-            viewport={"width": 1280, "height": 900},
+async def _record_search(key: str) -> None:
+    """Count a search for *key* in today's traffic set (feeds cache pre-warming)."""
+    from core.cache import REDIS_ERRORS, get_redis
+
+    try:
+        r = await get_redis()
+        day_key = f"{TRAFFIC_KEY_PREFIX}:{time.strftime('%Y%m%d', time.gmtime())}"
+        await r.zincrby(day_key, 1, key)
+        await r.expire(day_key, 8 * 86400)
+    except REDIS_ERRORS:
+        pass
+
+
+async def _scrape_pinterest(keyword: str, refresh: bool = False) -> list[dict]:
+    """Return ranked Pinterest pins for a keyword, scraping on a cache miss.
+
+    Stale entries are returned immediately and re-scraped in the background;
+    ``refresh=True`` always scrapes and rewrites the cache.
+    """
+    key = _normalize_keyword(keyword)
+
+    # The cache coalesces misses in this process; the Redis lease across workers
+    def loader():
+        return redis_singleflight("discover", key, lambda: _fetch_pins(keyword))
+
+    if refresh:
+        return await _cache.refresh(key, loader)
+    return await _cache.get_or_load(key, loader)
+
+
+class _StageTimer:
+    """Record wall time (ms) between successive scrape stages."""
+
+    def __init__(self) -> None:
+        self.stages: dict[str, float] = {}
+        self._start = self._last = time.perf_counter()
+
+    def mark(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.stages[stage] = round((now - self._last) * 1000, 1)
+        self._last = now
+
+    def done(self) -> dict[str, float]:
+        self.stages["total"] = round((time.perf_counter() - self._start) * 1000, 1)
+        return self.stages
+
+
+def _record_timings(mode: str, stages: dict[str, float]) -> None:
+    _timings.setdefault(mode, deque(maxlen=TIMING_SAMPLES)).append(stages)
+
+
+def scrape_stats() -> dict:
+    """Median / P95 per-stage timings (ms) per scrape mode, for ``/health``."""
+    summary: dict = {"mode": SCRAPE_MODE, **_scrape_counters}
+    for mode, samples in _timings.items():
+        stages: dict[str, list[float]] = {}
+        for sample in samples:
+            for stage, ms in sample.items():
+                stages.setdefault(stage, []).append(ms)
+        summary[mode] = {
+            stage: {
+                "p50": statistics.median(values),
+                "p95": sorted(values)[int(0.95 * (len(values) - 1))],
+                "n": len(values),
+            }
+            for stage, values in stages.items()
+        }
+    return summary
+
+
+async def _block_heavy_resources(route) -> None:
+    """Abort images, media and fonts — we only read DOM attributes."""
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        _scrape_counters["blocked_requests"] += 1
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def _wait_for_count(page, selector: str, minimum: int, timeout_ms: int) -> bool:
+    """Wait until *selector* matches at least *minimum* nodes, up to a ceiling."""
+    try:
+        await page.wait_for_function(
+            "([sel, n]) => document.querySelectorAll(sel).length >= n",
+            arg=[selector, minimum],
+            timeout=timeout_ms,
         )
-        page = await context.new_page()
+        return True
+    except PlaywrightError:
+        return False  # Ceiling reached — extract whatever has rendered
 
-        url = f"https://www.pinterest.com/search/pins/?q={keyword.replace(' ', '%20')}"
-        try:
-            await page.goto(url, wait_until="domcontentloaded", timeout=15000)
+
+async def _scrape_page(page, keyword: str, mode: str, timer: _StageTimer) -> list[dict]:
+    """Load the search page for *keyword* in *page* and extract raw pins."""
+    pins: list[dict] = []
+    url = f"https://www.pinterest.com/search/pins/?q={keyword.replace(' ', '%20')}"
+    try:
+        await page.goto(url, wait_until="domcontentloaded", timeout=15000)
+        timer.mark("goto")
+        if mode == "fast":
+            await _wait_for_count(page, PIN_SELECTOR, READY_MIN_PINS, READY_TIMEOUT_MS)
+        else:
             await page.wait_for_timeout(3000)
+        timer.mark("ready")
 
-            # Scroll once for more results
+        # Scroll once for more results
+        if mode == "fast":
+            rendered = await page.evaluate(
+                "(sel) => document.querySelectorAll(sel).length", PIN_SELECTOR
+            )
+            await page.evaluate("window.scrollBy(0, 2000)")
+            await _wait_for_count(page, PIN_SELECTOR, rendered + 1, SCROLL_TIMEOUT_MS)
+        else:
             await page.evaluate("window.scrollBy(0, 2000)")
             await page.wait_for_timeout(2000)
+        timer.mark("scroll")
 
-            # Extract pin data from the page
-            pins = await page.evaluate("""
-                () => {
-                    const results = [];
-                    // Pinterest renders pins in divs with data-test-id or role=listitem
-                    const pinElements = document.querySelectorAll('[data-test-id="pin"], [role="listitem"]');
-
-                    pinElements.forEach((el, i) => {
-                        if (i >= 50) return; // cap at 50
-
-                        const img = el.querySelector('img');
-                        const link = el.querySelector('a[href*="/pin/"]');
-                        const titleEl = el.querySelector('[title]') || el.querySelector('img');
-
-                        if (img && link) {
-                            results.push({
-                                image: img.src || img.getAttribute('srcset')?.split(' ')[0] || '',
-                                title: titleEl?.getAttribute('title') || titleEl?.getAttribute('alt') || 'Untitled Pin',
-                                pin_url: 'https://www.pinterest.com' + (link.getAttribute('href') || ''),
-                                saves_text: ''
-                            });
-                        }
-                    });
-
-                    // Fallback: grab all images if structured parsing fails
-                    if (results.length === 0) {
-                        const imgs = document.querySelectorAll('img[src*="pinimg"]');
-                        imgs.forEach((img, i) => {
-                            if (i >= 50) return;
-                            const parent = img.closest('a');
-                            results.push({
-                                image: img.src || '',
-                                title: img.alt || 'Pinterest Product',
-                                pin_url: parent ? 'https://www.pinterest.com' + parent.getAttribute('href') : '',
-                                saves_text: ''
-                            });
-                        });
-                    }
-                    return results;
-                }
-            """)
+        # Extract pin data from the page
+        pins = await page.evaluate(_EXTRACT_PINS_JS)
+        timer.mark("extract")
+    except Exception:
+        # Retry once after delay
+        await page.wait_for_timeout(5000 if mode == "legacy" else 1000)
+        try:
+            await page.goto(url, wait_until="domcontentloaded", timeout=15000)
+            if mode == "fast":
+                await _wait_for_count(page, PINIMG_SELECTOR, READY_MIN_PINS, READY_TIMEOUT_MS)
+            else:
+                await page.wait_for_timeout(4000)
+            pins = await page.evaluate(_EXTRACT_IMAGES_JS)
         except Exception:
-            # Retry once after delay
-            await page.wait_for_timeout(5000)
+            pass
+        timer.mark("retry")
+    return pins
+
+
+async def _fetch_pins(keyword: str, mode: str | None = None) -> list[dict]:
+    """Scrape Pinterest search results for a keyword, then dedupe and rank.
+
+    ``fast`` mode blocks heavy resources and waits on the pin count instead of
+    fixed sleeps; ``legacy`` keeps the original fixed waits.
+    """
+    mode = mode or SCRAPE_MODE
+    timer = _StageTimer()
+    async with browser_context(
+        user_agent=random.choice(USER_AGENTS),
+        viewport={"width": 1280, "height": 900},
+    ) as context:
+        if mode == "fast":
+            await context.route("**/*", _block_heavy_resources)
+        page = await context.new_page()
+        timer.mark("context")
+        pins = await _scrape_page(page, keyword, mode, timer)
+
+    _record_timings(mode, timer.done())
+    return _rank_pins(pins)
+
+
+async def _scrape_batch(keywords: list[str]) -> dict[str, list[dict]]:
+    """Scrape several keywords in parallel pages of one shared browser context.
+
+    At most ``BATCH_PAGE_CONCURRENCY`` pages are open at once. Each result is
+    written through the discover cache; a failed keyword maps to ``[]``.
+    """
+    results: dict[str, list[dict]] = {}
+    sem = asyncio.Semaphore(BATCH_PAGE_CONCURRENCY)
+    async with browser_context(
+        user_agent=random.choice(USER_AGENTS),
+        viewport={"width": 1280, "height": 900},
+    ) as context:
+        if SCRAPE_MODE == "fast":
+            await context.route("**/*", _block_heavy_resources)
+
+        async def scrape_one(keyword: str) -> list[dict]:
+            timer = _StageTimer()
+            page = await context.new_page()
             try:
-                await page.goto(url, wait_until="domcontentloaded", timeout=15000)
-                await page.wait_for_timeout(4000)
-                pins = await page.evaluate("""
-                    () => {
-                        const results = [];
-                        const imgs = document.querySelectorAll('img[src*="pinimg"]');
-                        imgs.forEach((img, i) => {
-                            if (i >= 50) return;
-                            const parent = img.closest('a');
-                            results.push({
-                                image: img.src || '',
-                                title: img.alt || 'Pinterest Product',
-                                pin_url: parent ? 'https://www.pinterest.com' + parent.getAttribute('href') : '',
-                                saves_text: ''
-                            });
-                        });
-                        return results;
-                    }
-                """)
-            except Exception:
-                pass
-        finally:
-            await browser.close()
+                pins = await _scrape_page(page, keyword, SCRAPE_MODE, timer)
+            finally:
+                await page.close()
+            _record_timings(SCRAPE_MODE, timer.done())
+            return _rank_pins(pins)
+
+        async def run(keyword: str) -> None:
+            async with sem:
+                try:
+                    results[keyword] = await _cache.refresh(
+                        _normalize_keyword(keyword), lambda: scrape_one(keyword)
+                    )
+                except Exception:  # noqa: BLE001
+                    results[keyword] = []
+
+        await asyncio.gather(*(run(k) for k in keywords))
+    return results
+
+
+def _merge_batch(results: dict[str, list[dict]]) -> list[dict]:
+    """Deduplicate pins across keywords by image URL, listing every keyword."""
+    merged: dict[str, dict] = {}
+    for keyword, pins in results.items():
+        for pin in pins:
+            image = pin.get("image", "")
+            if not image:
+                continue
+            if image not in merged:
+                merged[image] = {**pin, "keywords": []}
+            else:
+                merged[image]["demand_score"] = max(
+                    merged[image].get("demand_score", 0), pin.get("demand_score", 0)
+                )
+            merged[image]["keywords"].append(keyword)
+    return sorted(
+        merged.values(),
+        key=lambda p: (len(p["keywords"]), p.get("demand_score", 0)),
+        reverse=True,
+    )
+
 
+async def _stream_pins(keyword: str, scrolls: int) -> AsyncIterator[list[dict]]:
+    """Yield the pins on the page after the first render, then those each scroll adds.
+
+    Always uses fast mode. Each pin node is extracted once; callers still
+    dedupe by image, since Pinterest may render the same pin twice.
+    """
+    async with browser_context(
+        user_agent=random.choice(USER_AGENTS),
+        viewport={"width": 1280, "height": 900},
+    ) as context:
+        await context.route("**/*", _block_heavy_resources)
+        page = await context.new_page()
+
+        url = f"https://www.pinterest.com/search/pins/?q={keyword.replace(' ', '%20')}"
+        await page.goto(url, wait_until="domcontentloaded", timeout=15000)
+        await _wait_for_count(page, PIN_SELECTOR, READY_MIN_PINS, READY_TIMEOUT_MS)
+        yield await page.evaluate(_EXTRACT_PINS_JS, True)
+
+        for _ in range(scrolls):
+            rendered = await page.evaluate(
+                "(sel) => document.querySelectorAll(sel).length", PIN_SELECTOR
+            )
+            await page.evaluate("window.scrollBy(0, 2000)")
+            await _wait_for_count(page, PIN_SELECTOR, rendered + 1, SCROLL_TIMEOUT_MS)
+            yield await page.evaluate(_EXTRACT_PINS_JS, True)
+
+
+def _rank_pins(pins: list[dict]) -> list[dict]:
+    """Deduplicate pins by image URL and keep the top 20 by demand score."""
     # Deduplicate by image URL
     seen = set()
     unique: list[dict] = []
@@ -132,23 +397,195 @@ async def _scrape_pinterest(keyword: str) -> list[dict]:
         scored.append(pin)
 
     scored.sort(key=lambda x: x["demand_score"], reverse=True)
-    top20 = scored[:20]
-
-    # Cache results
-    _cache[keyword.lower()] = (now, top20)
-    return top20
+    return scored[:20]
 
 
 @router.get("/discover")
-async def discover(keyword: str = Query(..., max_length=80, description="Niche or product keyword")):
+async def discover(
+    keyword: str = Query(..., max_length=80, description="Niche or product keyword"),
+    user_id: str | None = Query(None, description="Save the search to this user's history"),
+):
     """Discover trending Pinterest products for a keyword."""
     if not keyword.strip():
         raise HTTPException(400, "Keyword is required")
 
-    results = await _scrape_pinterest(keyword.strip())
+    await _record_search(_normalize_keyword(keyword))
+    try:
+        results = await _scrape_pinterest(keyword.strip())
+    except SingleFlightTimeout:
+        raise HTTPException(
+            503,
+            detail="Discovery for this keyword is already running. Please retry in a few seconds.",
+        )
     if not results:
         raise HTTPException(
             404,
             detail="No trending products found for this keyword. Try a broader term like 'home decor' or 'pet accessories'.",
         )
+    if user_id:
+        await record_search(user_id, keyword.strip(), results)
     return {"keyword": keyword, "count": len(results), "products": results}
+
+
+@router.get("/discover/stream")
+async def discover_stream(
+    keyword: str = Query(..., max_length=80, description="Niche or product keyword"),
+    scrolls: int = Query(STREAM_SCROLLS, ge=0, le=10, description="Extra scrolls to load"),
+):
+    """Stream pins as Server-Sent Events while the page loads.
+
+    Emits ``batch`` events with pins not sent before, then one ``summary``
+    event with the final ranked top 20 (which is also cached).
+    """
+    keyword = keyword.strip()
+    if not keyword:
+        raise HTTPException(400, "Keyword is required")
+    key = _normalize_keyword(keyword)
+    await _record_search(key)
+
+    async def events():
+        entry = await _cache.peek(key)
+        if entry is not None and entry[1] and time.time() - entry[0] < CACHE_TTL:
+            yield sse_event("batch", {"products": entry[1]})
+            yield sse_event("summary", {"keyword": keyword, "count": len(entry[1]), "products": entry[1]})
+            return
+
+        seen: set[str] = set()
+        collected: list[dict] = []
+        try:
+            async for pins in _stream_pins(keyword, scrolls):
+                fresh = []
+                for pin in pins:
+                    image = pin.get("image", "")
+                    if image and image not in seen:
+                        seen.add(image)
+                        fresh.append(pin)
+                if fresh:
+                    collected.extend(fresh)
+                    yield sse_event("batch", {"products": fresh})
+        except Exception:  # noqa: BLE001
+            yield sse_event("error", {"detail": "Scraping stopped early; showing partial results."})
+
+        ranked = _rank_pins(collected)
+        if ranked:
+            await _cache.set(key, ranked)
+        yield sse_event("summary", {"keyword": keyword, "count": len(ranked), "products": ranked})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+class BatchDiscoverRequest(BaseModel):
+    keywords: list[str] = Field(..., min_length=1, max_length=BATCH_MAX_KEYWORDS)
+    background: bool = False  # queue misses as a Celery job instead of waiting
+
+
+@router.post("/discover/batch")
+async def discover_batch(req: BatchDiscoverRequest):
+    """Discover products for several keywords in one call.
+
+    Cache hits are returned immediately; misses are scraped in parallel pages
+    of one shared browser (or queued when ``background`` is set). Pins found
+    under several keywords appear once in ``unique_products``.
+    """
+    keywords: list[str] = []
+    seen: set[str] = set()
+    for raw in req.keywords:
+        keyword = raw.strip()[:80]
+        if keyword and _normalize_keyword(keyword) not in seen:
+            seen.add(_normalize_keyword(keyword))
+            keywords.append(keyword)
+    if not keywords:
+        raise HTTPException(400, "At least one keyword is required")
+
+    results: dict[str, list[dict]] = {}
+    cached: set[str] = set()
+    misses: list[str] = []
+    for keyword in keywords:
+        key = _normalize_keyword(keyword)
+        await _record_search(key)
+        entry = await _cache.peek(key)
+        if entry is not None and entry[1] and time.time() - entry[0] < CACHE_TTL:
+            results[keyword] = entry[1]
+            cached.add(keyword)
+        else:
+            misses.append(keyword)
+
+    job_id = None
+    if misses and req.background:
+        try:
+            task = await asyncio.to_thread(scrape_pinterest_batch_task.delay, misses)
+        except Exception as e:
+            raise HTTPException(503, "Job queue is unavailable. Please try again shortly.") from e
+        job_id = task.id
+    elif misses:
+        results.update(await _scrape_batch(misses))
+
+    unique = _merge_batch(results)
+    return {
+        "job_id": job_id,
+        "pending": misses if job_id else [],
+        "results": {
+            keyword: {"count": len(pins), "cached": keyword in cached, "products": pins}
+            for keyword, pins in results.items()
+        },
+        "unique_count": len(unique),
+        "unique_products": unique,
+    }
+
+
+class DiscoverJobRequest(BaseModel):
+    keyword: str = Field(..., max_length=80)
+    notify_email: str | None = None
+
+
+@router.post("/discover/jobs", status_code=202)
+async def submit_discover_job(req: DiscoverJobRequest, response: Response):
+    """Queue a background scrape, or return cached results straight away."""
+    keyword = req.keyword.strip()
+    if not keyword:
+        raise HTTPException(400, "Keyword is required")
+
+    key = _normalize_keyword(keyword)
+    await _record_search(key)
+    entry = await _cache.peek(key)
+    if entry is not None and entry[1]:
+        response.status_code = 200
+        return {
+            "job_id": None,
+            "status": "complete",
+            "result": {"keyword": keyword, "count": len(entry[1]), "products": entry[1]},
+        }
+
+    try:
+        task = await asyncio.to_thread(scrape_pinterest_task.delay, keyword, req.notify_email)
+    except Exception as e:
+        raise HTTPException(503, "Job queue is unavailable. Please try again shortly.") from e
+    return {"job_id": task.id, "status": "queued"}
+
+
+@router.get("/discover/jobs/{job_id}")
+async def get_discover_job(job_id: str):
+    """Poll the status of a discover job."""
+    return await asyncio.to_thread(job_status, job_id)
+
+
+@router.get("/discover/jobs/{job_id}/events")
+async def stream_discover_job(job_id: str):
+    """Stream job status changes as Server-Sent Events until it finishes."""
+
+    async def events():
+        deadline = time.monotonic() + JOB_STREAM_TIMEOUT
+        last_state = None
+        while True:
+            status = await asyncio.to_thread(job_status, job_id)
+            if status["state"] != last_state:
+                last_state = status["state"]
+                yield sse_event("status", status)
+            if status["status"] in ("complete", "failed"):
+                return
+            if time.monotonic() > deadline:
+                yield sse_event("timeout", {"job_id": job_id})
+                return
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
@@ -1,35 +1,25 @@
-"""Shopify CSV Exporter"""
-import csv
-import io
+"""Shopify CSV / bulk JSONL Exporter"""
+import asyncio
+import datetime
+import os
 import uuid
 import time
+from collections.abc import Iterable, Iterator
+from contextlib import suppress
+from typing import Literal
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from db import supabase
+from services.export_artifacts import artifact_name, get_artifact_store, valid_name
+from services.pricing import DEFAULT_MARKUP, PricingRules, price_offers
+from services.shopify_export import FORMATS, ProductRow
 
 router = APIRouter()
 
-# Full Shopify CSV columns — all must be present
-SHOPIFY_COLUMNS = [
-    "Handle", "Title", "Body (HTML)", "Vendor", "Product Category", "Type", "Tags",
-    "Published", "Option1 Name", "Option1 Value", "Option2 Name", "Option2 Value",
-    "Option3 Name", "Option3 Value", "Variant SKU", "Variant Grams",
-    "Variant Inventory Tracker", "Variant Inventory Qty", "Variant Inventory Policy",
-    "Variant Fulfillment Service", "Variant Price", "Variant Compare At Price",
-    "Variant Requires Shipping", "Variant Taxable", "Variant Barcode",
-    "Image Src", "Image Position", "Image Alt Text", "Gift Card",
-    "SEO Title", "SEO Description",
-    "Google Shopping / Google Product Category", "Google Shopping / Gender",
-    "Google Shopping / Age Group", "Google Shopping / MPN",
-    "Google Shopping / AdWords Grouping", "Google Shopping / AdWords Labels",
-    "Google Shopping / Condition", "Google Shopping / Custom Product",
-    "Google Shopping / Custom Label 0", "Google Shopping / Custom Label 1",
-    "Google Shopping / Custom Label 2", "Google Shopping / Custom Label 3",
-    "Google Shopping / Custom Label 4", "Variant Image", "Variant Weight Unit",
-    "Variant Tax Code", "Cost per item", "Included / United States",
-    "Price / United States", "Compare At Price / United States", "Status",
-]
-
+BULK_MAX_IDS = 5000
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "200"))  # generations per query
+EXPORT_ID_CHUNK = 100  # ids per "id in (...)" filter, keeps the query URL short
 
 def _slugify(text: str) -> str:
     import re
@@ -50,71 +40,317 @@ class ExportRequest(BaseModel):
     tags: str = ""
     seo_title: str = ""
     seo_description: str = ""
+    user_id: str | None = None  # records the export in the user's history
+    generation_id: str | None = None
+    format: Literal["csv", "jsonl"] = "csv"  # jsonl: Shopify bulk productCreate input
 
 
-@router.post("/export")
-async def export_csv(req: ExportRequest):
-    """Generate and return a Shopify-compatible product CSV."""
-    if not req.product_name.strip():
-        raise HTTPException(400, "Product name is required")
-
-    # Build HTML body
+def _body_html(description_html: str, bullets: list, faq: list) -> str:
     body_parts = []
-    if req.description_html:
-        body_parts.append(req.description_html)
-    if req.bullets:
-        bullet_html = "<ul>" + "".join(f"<li>{b}</li>" for b in req.bullets) + "</ul>"
+    if description_html:
+        body_parts.append(description_html)
+    if bullets:
+        bullet_html = "<ul>" + "".join(f"<li>{b}</li>" for b in bullets) + "</ul>"
         body_parts.append(bullet_html)
-    if req.faq:
+    if faq:
         faq_html = "<div class='faq'>"
-        for item in req.faq:
+        for item in faq:
             faq_html += f"<h4>{item.get('q', '')}</h4><p>{item.get('a', '')}</p>"
         faq_html += "</div>"
         body_parts.append(faq_html)
+    return "\n".join(body_parts)
 
-    body_html = "\n".join(body_parts)
 
-    # Generate SKU
+def _sku() -> str:
     nonce = uuid.uuid4().hex[:6].upper()
-    sku = f"PCA-{nonce}-{int(time.time())}"
-
-    # Build row with all Shopify columns
-    row = {col: "" for col in SHOPIFY_COLUMNS}
-    row.update({
-        "Handle": _slugify(req.product_name),
-        "Title": req.product_name,
-        "Body (HTML)": body_html,
-        "Vendor": req.vendor,
-        "Type": "Dropship",
-        "Tags": req.tags or req.product_name.lower(),
-        "Published": "TRUE",
-        "Option1 Name": "Title",
-        "Option1 Value": "Default Title",
-        "Variant SKU": sku,
-        "Variant Inventory Policy": "continue",
-        "Variant Fulfillment Service": "manual",
-        "Variant Price": str(req.price),
-        "Variant Requires Shipping": "TRUE",
-        "Variant Taxable": "TRUE",
-        "Image Src": req.image_url,
-        "Image Position": "1",
-        "Image Alt Text": req.product_name,
-        "Gift Card": "FALSE",
-        "SEO Title": req.seo_title or req.product_name,
-        "SEO Description": req.seo_description or "",
-        "Status": "active",
-    })
-
-    # Write CSV to memory
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=SHOPIFY_COLUMNS)
-    writer.writeheader()
-    writer.writerow(row)
-    output.seek(0)
-
-    filename = f"pincart-{_slugify(req.product_name)}.csv"
+    return f"PCA-{nonce}-{int(time.time())}"
+
+
+def _product_row(
+    product_name: str,
+    body_html: str,
+    price: float,
+    vendor: str,
+    tags: str = "",
+    image_url: str = "",
+    seo_title: str = "",
+    seo_description: str = "",
+    cost: float | None = None,
+) -> ProductRow:
+    """One product, ready for any export writer."""
+    return ProductRow(
+        handle=_slugify(product_name),
+        title=product_name,
+        body_html=body_html,
+        vendor=vendor,
+        tags=tags or product_name.lower(),
+        price=price,
+        sku=_sku(),
+        image_url=image_url,
+        seo_title=seo_title or product_name,
+        seo_description=seo_description or "",
+        cost=cost,
+    )
+
+
+def _record_export(user_id: str, **fields) -> None:
+    """Add a row to ``exports`` (blocking; errors are ignored)."""
+    with suppress(Exception):
+        supabase.table("exports").insert({"user_id": user_id, **fields}).execute()
+
+
+def _media_type(name: str) -> str:
+    ext = name.rsplit(".", 1)[-1]
+    return next((media for _, media, e in FORMATS.values() if e == ext), "application/octet-stream")
+
+
+def _stored_response(path: str, filename: str) -> FileResponse:
+    """A stored artifact, sent from disk with Range support."""
+    return FileResponse(path, media_type=_media_type(filename), filename=filename)
+
+
+def _storing_response(name: str, chunks: Iterable[str], filename: str, on_stored=None) -> StreamingResponse:
+    """Stream *chunks* to the client while writing them to artifact *name*.
+
+    The artifact is only published once the whole file was produced (a
+    dropped connection discards it); then *on_stored(url)* runs.
+    """
+    store = get_artifact_store()
+
+    def body() -> Iterator[bytes]:
+        pending = store.writer(name)
+        try:
+            for chunk in chunks:
+                data = chunk.encode("utf-8")
+                pending.write(data)
+                yield data
+        except BaseException:
+            pending.abort()
+            raise
+        pending.commit()
+        if on_stored is not None:
+            on_stored(store.url(name))
+
     return StreamingResponse(
-        io.BytesIO(output.getvalue().encode("utf-8")),
-        media_type="text/csv",
+        body(),
+        media_type=_media_type(filename),
         headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
+
+
+@router.post("/export")
+async def export_csv(req: ExportRequest):
+    """Generate and return a Shopify-compatible product CSV (or bulk JSONL).
+
+    The file is stored under a hash of the request, so exporting the same
+    product again is served from the stored file.
+    """
+    if not req.product_name.strip():
+        raise HTTPException(400, "Product name is required")
+
+    write, _, ext = FORMATS[req.format]
+    filename = f"pincart-{_slugify(req.product_name)}.{ext}"
+    name = artifact_name("product", req.model_dump(exclude={"user_id", "generation_id"}), ext)
+
+    def record(url: str) -> None:
+        if req.user_id:
+            _record_export(req.user_id, generation_id=req.generation_id, csv_url=url)
+
+    store = get_artifact_store()
+    path = store.path(name)
+    if path is not None:
+        await asyncio.to_thread(record, store.url(name))
+        return _stored_response(path, filename)
+
+    product = _product_row(
+        req.product_name,
+        _body_html(req.description_html, req.bullets, req.faq),
+        req.price,
+        req.vendor,
+        tags=req.tags,
+        image_url=req.image_url,
+        seo_title=req.seo_title,
+        seo_description=req.seo_description,
+    )
+    return _storing_response(name, write([product]), filename, record)
+
+
+class BulkExportRequest(BaseModel):
+    user_id: str
+    generation_ids: list[str] | None = Field(None, min_length=1, max_length=BULK_MAX_IDS)
+    since_days: int | None = Field(None, ge=1, le=365)  # e.g. 7 = last week's pages
+    vendor: str = "My Store"
+    tags: str = ""
+    markup: float = Field(DEFAULT_MARKUP, gt=0)  # retail = supplier price x markup
+    default_price: float = 29.99  # for pages without a supplier price
+    format: Literal["csv", "jsonl"] = "csv"
+
+
+def _generation_pages(
+    user_id: str,
+    generation_ids: list[str] | None = None,
+    since: datetime.datetime | None = None,
+    page_size: int | None = None,
+    columns: str = "id, product_name, supplier_data, generated_copy, created_at",
+) -> Iterator[list[dict]]:
+    """Page the user's generations out of Supabase, newest first (blocking).
+
+    Explicit ids are fetched ``EXPORT_ID_CHUNK`` at a time (an empty list
+    yields nothing); with ``generation_ids=None`` the table is read
+    ``page_size`` rows per query.
+    """
+    def query():
+        q = supabase.table("generations").select(columns).eq("user_id", user_id)
+        if since is not None:
+            q = q.gte("created_at", since.isoformat())
+        return q.order("created_at", desc=True).order("id")
+
+    if generation_ids is not None:
+        for start in range(0, len(generation_ids), EXPORT_ID_CHUNK):
+            chunk = generation_ids[start:start + EXPORT_ID_CHUNK]
+            yield query().in_("id", chunk).execute().data or []
+        return
+
+    page_size = page_size or EXPORT_PAGE_SIZE
+    offset = 0
+    while True:
+        rows = query().range(offset, offset + page_size - 1).execute().data or []
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        offset += page_size
+
+
+def _generation_products(pages: Iterable[list[dict]], req: BulkExportRequest, stats: dict) -> Iterator[ProductRow]:
+    """Products for each page of generations, priced a page at a time.
+
+    Only the newest generation of each product (by handle) is exported, so
+    revisions and repeat generations don't become duplicate products.
+    """
+    rules = PricingRules(markup=req.markup)
+    handles: set[str] = set()
+    for page in pages:
+        costs = [(g.get("supplier_data") or {}).get("price") for g in page]
+        retail = price_offers([c or 0 for c in costs], rules=rules)["retail"].tolist()
+        for generation, cost, price in zip(page, costs, retail):
+            copy = generation.get("generated_copy") or {}
+            name = generation.get("product_name") or copy.get("seo_title") or ""
+            handle = _slugify(name)
+            if not handle or handle in handles:
+                continue
+            handles.add(handle)
+            stats["products"] += 1
+            yield _product_row(
+                name,
+                _body_html(copy.get("description", ""), copy.get("bullets") or [], copy.get("faq") or []),
+                price if cost else req.default_price,
+                req.vendor,
+                tags=req.tags,
+                seo_title=copy.get("seo_title", ""),
+                seo_description=copy.get("meta_description", ""),
+                cost=cost or None,
+            )
+
+
+def _record_repeat_export(user_id: str, url: str, filters: dict) -> None:
+    """Record an export served from a stored file, copying its product count."""
+    try:
+        prior = (
+            supabase.table("exports").select("product_count").eq("csv_url", url).limit(1).execute().data
+            or []
+        )
+    except Exception:  # noqa: BLE001
+        prior = []
+    counts = {"product_count": prior[0]["product_count"]} if prior else {}
+    _record_export(user_id, filters=filters, csv_url=url, **counts)
+
+
+def _selected_ids(req: BulkExportRequest) -> list[str]:
+    """Ids of the generations *req* selects, newest first (blocking).
+
+    Generations are never edited in place, so this list fully determines
+    the file and is what the artifact is addressed by.
+    """
+    since = None
+    if req.since_days:
+        since = datetime.datetime.now(datetime.UTC) - datetime.timedelta(days=req.since_days)
+    pages = _generation_pages(req.user_id, req.generation_ids, since, columns="id, created_at")
+    return [row["id"] for page in pages for row in page]
+
+
+@router.post("/export/bulk")
+async def export_bulk(req: BulkExportRequest):
+    """Export many stored generations as one Shopify CSV or bulk JSONL file.
+
+    Pick pages by ``generation_ids`` and/or ``since_days``. Rows are read
+    from ``generations`` a page at a time and written to the response as
+    they are produced, so memory stays flat however many products the store
+    has. The file is stored under a hash of the selected ids and export
+    options; a repeat export of the same selection is served from it. Every
+    export is recorded in ``exports`` with the file's URL. A selection that
+    matches no generations is a 404.
+    """
+    if not req.generation_ids and not req.since_days:
+        raise HTTPException(400, "Provide generation_ids or since_days")
+
+    # Listing ids first also turns a database outage into a 503, not a truncated file
+    try:
+        ids = await asyncio.to_thread(_selected_ids, req)
+    except Exception as e:
+        raise HTTPException(503, "Could not load generations. Please retry.") from e
+    if not ids:
+        raise HTTPException(404, "No generations match this selection")
+
+    write, _, ext = FORMATS[req.format]
+    options = req.model_dump(include={"vendor", "tags", "markup", "default_price", "format"})
+    name = artifact_name("bulk", {"user_id": req.user_id, "ids": ids, **options}, ext)
+    filename = f"pincart-export-{datetime.date.today():%Y%m%d}.{ext}"
+    filters = {"generation_ids": req.generation_ids, "since_days": req.since_days}
+    stats = {"products": 0}
+
+    def record(url: str) -> None:
+        _record_export(req.user_id, product_count=stats["products"], filters=filters, csv_url=url)
+
+    store = get_artifact_store()
+    path = store.path(name)
+    if path is not None:
+        await asyncio.to_thread(_record_repeat_export, req.user_id, store.url(name), filters)
+        return _stored_response(path, filename)
+
+    products = _generation_products(_generation_pages(req.user_id, ids), req, stats)
+    return _storing_response(name, write(products), filename, record)
+
+
+@router.get("/exports")
+async def list_exports(user_id: str, limit: int = 50):
+    """The user's export history, newest first, with download URLs."""
+    def load() -> list:
+        return (
+            supabase.table("exports")
+            .select("id, generation_id, csv_url, product_count, filters, created_at")
+            .eq("user_id", user_id)
+            .order("created_at", desc=True)
+            .limit(min(max(limit, 1), 200))
+            .execute()
+            .data
+            or []
+        )
+
+    try:
+        exports = await asyncio.to_thread(load)
+    except Exception as e:
+        raise HTTPException(503, "Could not load export history. Please retry.") from e
+    return {"exports": exports}
+
+
+@router.get("/exports/artifacts/{name}")
+async def download_artifact(name: str):
+    """Download a stored export file (supports Range requests).
+
+    Names are content hashes, so the URL itself is the access token.
+    """
+    path = get_artifact_store().path(name) if valid_name(name) else None
+    if path is None:
+        raise HTTPException(404, "Export file not found. Please export again.")
+    return _stored_response(path, f"pincart-export-{name[:12]}.{name.rsplit('.', 1)[-1]}")
@@ -1,17 +1,90 @@
 """AI Product Page Generator — OpenAI GPT-4o"""
+import asyncio
 import os
 import json
+import time
+from collections.abc import AsyncIterator
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from openai import AsyncOpenAI
+from celery_worker import generate_page_task
+from core.json_stream import JSONSectionParser
+from core.singleflight import SingleFlightTimeout, redis_singleflight
+from core.sse import SSE_HEADERS, sse_event
+from core.tiered_cache import TieredCache
 from db import supabase
+from services import generation_batch
+from services.model_router import FAILOVER_ERRORS, UNKNOWN_PLAN, ModelRouter
+from services.user_profiles import profiles
 
 router = APIRouter()
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY", ""))
+# OPENAI_BASE_URL points at any OpenAI-compatible server (e.g. a local stub).
+# SDK retries are off by default: the model router fails over instead, and
+# batch jobs back off through Celery.
+client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY", ""),
+    base_url=os.getenv("OPENAI_BASE_URL") or None,
+    max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "0")),
+)
+model_router = ModelRouter(client)
 
 SYSTEM_PROMPT = """You are an expert ecommerce copywriter who writes high-conversion Shopify product pages. 
 You specialize in dropshipping products and write copy that sells. Your output must be valid JSON."""
 
+# Bump whenever SYSTEM_PROMPT, _build_prompt, the model settings or the cached
+# value format change so cached pages from the old prompt are no longer served
+PROMPT_VERSION = "2"
+
+TONE_INSTRUCTIONS = {
+    "standard": "Write in a clear, professional ecommerce tone.",
+    "playful": "Write in a fun, energetic tone with personality.",
+    "luxury": "Write in an elevated, premium tone that signals quality and exclusivity.",
+    "urgency": "Write with urgency and scarcity — limited stock, trending now, selling fast.",
+}
+
+# Output spec for each section of a page, in page order
+SECTION_SPECS = {
+    "seo_title": '"SEO-optimized product title (60-70 characters)"',
+    "description": '"Benefit-driven product description focusing on outcomes, not features (250-400 words, HTML formatted with <p> tags)"',
+    "bullets": '["5-7 concise feature bullet points"]',
+    "faq": '[\n    {"q": "question", "a": "answer"}\n  ]',
+    "meta_description": '"SEO meta description under 155 characters"',
+    "tiktok_hook": '"A punchy 1-2 sentence TikTok ad opening hook"',
+    "pinterest_caption": '"Pinterest pin description optimized for saves (under 100 words)"',
+}
+# Completion budget when regenerating single sections (plus a small JSON overhead)
+SECTION_MAX_TOKENS = {
+    "seo_title": 60,
+    "description": 700,
+    "bullets": 250,
+    "faq": 450,
+    "meta_description": 80,
+    "tiktok_hook": 80,
+    "pinterest_caption": 180,
+}
+PARTIAL_GENERATION_COST = 0.25  # per section, against the plan's generation limit (PRD 5.3)
+BATCH_MAX_ITEMS = 50
+
+# Generated pages keyed by the normalized prompt inputs and preferred model
+# (L1 LRU + Redis). Values are {"generated", "model", "fallback"}; pages a
+# failover model wrote are kept briefly so the preferred model soon replaces them.
+GENERATE_CACHE_TTL = int(os.getenv("GENERATE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+GENERATE_FALLBACK_CACHE_TTL = int(os.getenv("GENERATE_FALLBACK_CACHE_TTL_SECONDS", "3600"))
+
+
+def _cache_ttls(value: dict) -> tuple[int, int]:
+    return (GENERATE_FALLBACK_CACHE_TTL if value.get("fallback") else GENERATE_CACHE_TTL), 0
+
+
+_cache = TieredCache(
+    "generate",
+    fresh_ttl=GENERATE_CACHE_TTL,
+    stale_ttl=0,
+    maxsize=int(os.getenv("GENERATE_L1_MAX_ENTRIES", "256")),
+    ttl_for=_cache_ttls,
+)
+
 
 class GenerateRequest(BaseModel):
     product_name: str
@@ -19,78 +92,445 @@ class GenerateRequest(BaseModel):
     tone: str = "standard"  # standard, playful, luxury, urgency
     supplier_price: float | None = None
     user_id: str | None = None
+    regenerate: bool = False  # skip the cache and write a fresh page
+
+
+def _cache_identifier(
+    product_name: str,
+    target_audience: str,
+    tone: str,
+    supplier_price: float | None,
+    model: str | None = None,
+) -> str:
+    """Normalized prompt inputs, preferred *model* and ``PROMPT_VERSION``, as a stable JSON key.
+
+    Case and whitespace are ignored, unknown tones collapse to ``standard``
+    and prices are compared to the cent, mirroring how ``_build_prompt``
+    treats them. *model* defaults to the primary model.
+    """
+    return json.dumps([
+        PROMPT_VERSION,
+        model or model_router.primary,
+        " ".join(product_name.lower().split()),
+        " ".join(target_audience.lower().split()),
+        tone if tone in TONE_INSTRUCTIONS else "standard",
+        round(supplier_price, 2) if supplier_price else None,
+    ])
+
+
+def _context_lines(target_audience: str, tone: str, supplier_price: float | None) -> str:
+    tone_text = TONE_INSTRUCTIONS.get(tone, TONE_INSTRUCTIONS["standard"])
+
+    audience_line = f"Target audience: {target_audience}." if target_audience else ""
+    price_line = f"The product costs approximately ${supplier_price} wholesale." if supplier_price else ""
+    return f"{audience_line}\n{price_line}\n{tone_text}"
+
+
+def _keys_spec(keys) -> str:
+    """JSON skeleton describing the requested *keys*."""
+    lines = ",\n".join(f'  "{key}": {SECTION_SPECS[key]}' for key in keys)
+    return "{\n" + lines + "\n}"
+
+
+def _build_prompt(product_name: str, target_audience: str, tone: str, supplier_price: float | None) -> str:
+    """User prompt for one product page."""
+    return f"""Write a complete Shopify product page for: "{product_name}"
+
+{_context_lines(target_audience, tone, supplier_price)}
+
+Return a JSON object with these exact keys:
+{_keys_spec(SECTION_SPECS)}
+
+Write for MAXIMUM conversion. Make the buyer feel they need this product TODAY."""
+
+
+def _build_sections_prompt(
+    product_name: str,
+    target_audience: str,
+    tone: str,
+    supplier_price: float | None,
+    current: dict,
+    sections: list[str],
+    instructions: str = "",
+) -> str:
+    """User prompt that rewrites only *sections* of an existing page."""
+    replaced = json.dumps({key: current.get(key) for key in sections}, ensure_ascii=False)
+    feedback = f"What to change: {instructions}\n" if instructions else ""
+    return f"""Rewrite part of the Shopify product page for: "{product_name}"
+Page title: {current.get("seo_title") or product_name}
+
+{_context_lines(target_audience, tone, supplier_price)}
+
+Current version of the sections to replace:
+{replaced}
+{feedback}
+Return a JSON object with ONLY these keys:
+{_keys_spec(sections)}
+
+Write fresh copy that is clearly different from the current version and consistent with the rest of the page."""
+
+
+def _completion_params(prompt: str, max_tokens: int = 1500) -> dict:
+    """``chat.completions.create`` arguments; the model router adds ``model``."""
+    return {
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        "temperature": 0.7,
+        "max_tokens": max_tokens,
+        "response_format": {"type": "json_object"},
+    }
+
+
+async def _complete_with_usage(
+    prompt: str,
+    max_tokens: int = 1500,
+    plan: str | None = None,
+    failover_errors: tuple[type[Exception], ...] = FAILOVER_ERRORS,
+) -> tuple[dict, dict]:
+    """Run *prompt* through the model routed for *plan* and parse its JSON reply.
+
+    Also returns the serving ``model`` and the call's token usage, keyed by
+    their ``generations`` column names. Upstream errors outside
+    *failover_errors* are raised instead of failing over.
+    """
+    response, model = await model_router.create(
+        _completion_params(prompt, max_tokens), plan, failover_errors=failover_errors
+    )
+    content = response.choices[0].message.content or "{}"
+    usage = response.usage
+    return json.loads(content), {
+        "model": model,
+        "prompt_tokens": usage.prompt_tokens if usage else 0,
+        "completion_tokens": usage.completion_tokens if usage else 0,
+        "total_tokens": usage.total_tokens if usage else 0,
+    }
+
+
+async def _stream_completion(prompt: str, plan: str | None = None) -> tuple[str, AsyncIterator[str]]:
+    """Open a streamed reply to *prompt*; returns the serving model and its text deltas."""
+    stream, model = await model_router.create(_completion_params(prompt), plan, stream=True)
+
+    async def deltas() -> AsyncIterator[str]:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    return model, deltas()
+
+
+async def _plan_tier(user_id: str | None) -> str | None:
+    """The user's cached ``plan_tier``.
+
+    *None* for anonymous or unknown users, ``UNKNOWN_PLAN`` if the profile
+    could not be read.
+    """
+    try:
+        profile = await profiles.get(user_id)
+    except Exception:  # noqa: BLE001
+        return UNKNOWN_PLAN
+    return profile.get("plan_tier") if profile else None
+
+
+def _cache_value(generated: dict, model: str, plan: str | None) -> dict | None:
+    """What the generate cache stores for a page (*None* for an empty page)."""
+    if not generated:
+        return None
+    return {"generated": generated, "model": model, "fallback": model != model_router.preferred(plan)}
+
+
+async def _cached_page(key: str) -> dict | None:
+    """The fresh cache value for *key*, or *None*."""
+    entry = await _cache.peek(key)
+    if entry is None or not entry[1]:
+        return None
+    return entry[1] if time.time() - entry[0] < _cache_ttls(entry[1])[0] else None
+
+
+def _save_generation(req, generated: dict, **revision) -> str | None:
+    """Record the page in the user's history and charge its cost against the
+    plan's generation limit (blocking; errors are ignored).
+
+    *revision* holds extra ``generations`` columns (``parent_id``,
+    ``revision``, ``regenerated_sections``, ``generation_cost``, ``model``,
+    token usage). Returns the new row id.
+    """
+    row = {
+        "user_id": req.user_id,
+        "product_name": req.product_name,
+        "supplier_data": {"price": req.supplier_price},
+        "generated_copy": generated,
+        "tone_preset": req.tone,
+        **revision,
+    }
+    try:
+        result = supabase.table("generations").insert(row).execute()
+        supabase.rpc(
+            "increment_generations_used",
+            {"p_user_id": req.user_id, "p_amount": row.get("generation_cost", 1)},
+        ).execute()
+        return (result.data or [{}])[0].get("id")
+    except Exception:  # noqa: BLE001
+        return None  # Don't fail the request if DB save fails
 
 
 @router.post("/generate")
 async def generate_page(req: GenerateRequest):
-    """Generate a full AI product page."""
+    """Generate a full AI product page.
+
+    Identical requests (same normalized product, audience, tone, price and
+    preferred model) are served from cache, and concurrent ones share a
+    single model call. Set ``regenerate`` to force a fresh page. ``model``
+    is the model that wrote the page.
+    """
     if not req.product_name.strip():
         raise HTTPException(400, "Product name is required")
 
-    tone_instructions = {
-        "standard": "Write in a clear, professional ecommerce tone.",
-        "playful": "Write in a fun, energetic tone with personality.",
-        "luxury": "Write in an elevated, premium tone that signals quality and exclusivity.",
-        "urgency": "Write with urgency and scarcity — limited stock, trending now, selling fast.",
+    plan = await _plan_tier(req.user_id)
+    inputs = (req.product_name, req.target_audience, req.tone, req.supplier_price)
+    key = _cache_identifier(*inputs, model_router.preferred(plan))
+    usage: dict = {}
+
+    async def generate() -> dict | None:
+        generated, call_usage = await _complete_with_usage(_build_prompt(*inputs), plan=plan)
+        usage.update(call_usage)
+        return _cache_value(generated, call_usage["model"], plan)
+
+    # The cache coalesces callers in this process; the Redis lease across workers
+    def loader():
+        return redis_singleflight("generate", key, generate)
+
+    try:
+        if req.regenerate:
+            value = await _cache.refresh(key, loader)
+        else:
+            value = await _cache.get_or_load(key, loader)
+    except SingleFlightTimeout:
+        raise HTTPException(503, "This page is already being generated. Please retry in a few seconds.")
+    except json.JSONDecodeError:
+        raise HTTPException(500, "AI returned invalid output. Please retry.")
+    except Exception as e:
+        raise HTTPException(500, f"AI generation failed: {e}")
+
+    generated = value["generated"] if value else {}
+    model = value["model"] if value else usage.get("model")
+
+    # Save to Supabase if user_id provided
+    if req.user_id:
+        await asyncio.to_thread(_save_generation, req, generated, **(usage or {"model": model}))
+
+    return {
+        "product_name": req.product_name,
+        "generated": generated,
+        "cached": not usage,
+        "model": model,
     }
-    tone_text = tone_instructions.get(req.tone, tone_instructions["standard"])
 
-    audience_line = f"Target audience: {req.target_audience}." if req.target_audience else ""
-    price_line = f"The product costs approximately ${req.supplier_price} wholesale." if req.supplier_price else ""
 
-    prompt = f"""Write a complete Shopify product page for: "{req.product_name}"
+@router.post("/generate/stream")
+async def generate_page_stream(req: GenerateRequest):
+    """Generate a product page, streaming each section as it is written.
 
-{audience_line}
-{price_line}
-{tone_text}
+    Server-Sent Events: one ``section`` event (``{"key", "value"}``) per
+    top-level field as soon as the model closes it, then ``done`` carrying
+    the same payload as ``POST /generate``, or ``error``. Cached pages are
+    replayed section by section straight away.
+    """
+    if not req.product_name.strip():
+        raise HTTPException(400, "Product name is required")
 
-Return a JSON object with these exact keys:
-{{
-  "seo_title": "SEO-optimized product title (60-70 characters)",
-  "description": "Benefit-driven product description focusing on outcomes, not features (250-400 words, HTML formatted with <p> tags)",
-  "bullets": ["5-7 concise feature bullet points"],
-  "faq": [
-    {{"q": "question", "a": "answer"}}
-  ],
-  "meta_description": "SEO meta description under 155 characters",
-  "tiktok_hook": "A punchy 1-2 sentence TikTok ad opening hook",
-  "pinterest_caption": "Pinterest pin description optimized for saves (under 100 words)"
-}}
+    plan = await _plan_tier(req.user_id)
+    inputs = (req.product_name, req.target_audience, req.tone, req.supplier_price)
+    key = _cache_identifier(*inputs, model_router.preferred(plan))
 
-Write for MAXIMUM conversion. Make the buyer feel they need this product TODAY."""
+    async def events():
+        page = None if req.regenerate else await _cached_page(key)
+        if page is not None:
+            generated, model, cached = page["generated"], page["model"], True
+            for name, value in generated.items():
+                yield sse_event("section", {"key": name, "value": value})
+        else:
+            parser = JSONSectionParser()
+            try:
+                model, deltas = await _stream_completion(_build_prompt(*inputs), plan)
+                async for delta in deltas:
+                    for name, value in parser.feed(delta):
+                        yield sse_event("section", {"key": name, "value": value})
+                generated, cached = parser.result(), False
+            except json.JSONDecodeError:
+                yield sse_event("error", {"detail": "AI returned invalid output. Please retry."})
+                return
+            except Exception as e:  # noqa: BLE001
+                yield sse_event("error", {"detail": f"AI generation failed: {e}"})
+                return
+            value = _cache_value(generated, model, plan)
+            if value:
+                await _cache.set(key, value)
 
-    try:
-        response = await client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
-            max_tokens=1500,
-            response_format={"type": "json_object"},
+        if req.user_id:
+            await asyncio.to_thread(_save_generation, req, generated, model=model)
+        yield sse_event(
+            "done",
+            {"product_name": req.product_name, "generated": generated, "cached": cached, "model": model},
         )
-        content = response.choices[0].message.content or "{}"
-        generated = json.loads(content)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+class RegenerateSectionsRequest(BaseModel):
+    sections: list[str] = Field(..., min_length=1)
+    product_name: str = ""  # taken from the stored generation when omitted
+    target_audience: str = ""
+    tone: str | None = None  # the stored generation's tone when omitted, else "standard"
+    supplier_price: float | None = None
+    user_id: str | None = None  # required with generation_id: only the owner may revise
+    generation_id: str | None = None  # existing row to revise...
+    generated: dict | None = None  # ...or the current page passed inline
+    instructions: str = Field("", max_length=500)  # optional guidance, e.g. "shorter"
+
+
+def _load_generation(generation_id: str, user_id: str) -> dict | None:
+    """The generation *generation_id* if *user_id* owns it (blocking)."""
+    rows = (
+        supabase.table("generations").select("*").eq("id", generation_id).eq("user_id", user_id).limit(1).execute().data
+        or []
+    )
+    return rows[0] if rows else None
+
+
+@router.post("/generate/sections")
+async def regenerate_sections(req: RegenerateSectionsRequest):
+    """Rewrite only some sections of an existing page.
+
+    The current page comes from ``generation_id`` (a ``generations`` row) or
+    inline ``generated``; revising a stored row requires its owner's
+    ``user_id``. Only the requested keys are sent to the model, with
+    a completion budget sized for them. The merged page is saved as a new
+    revision that costs ``PARTIAL_GENERATION_COST`` of a generation per
+    section, up to one generation. An inline page missing any section it
+    does not regenerate is billed as a full generation.
+    """
+    sections = list(dict.fromkeys(req.sections))
+    unknown = [key for key in sections if key not in SECTION_SPECS]
+    if unknown:
+        raise HTTPException(400, f"Unknown sections: {', '.join(unknown)}")
+
+    parent = None
+    if req.generation_id:
+        if not req.user_id:
+            raise HTTPException(400, "user_id is required to revise a saved generation")
+        try:
+            parent = await asyncio.to_thread(_load_generation, req.generation_id, req.user_id)
+        except Exception as e:
+            raise HTTPException(503, "Could not load the generation. Please retry.") from e
+        if parent is None:
+            raise HTTPException(404, "Generation not found")
+        req = req.model_copy(update={
+            "product_name": req.product_name or parent["product_name"],
+            "tone": req.tone or parent.get("tone_preset") or "standard",
+            "supplier_price": req.supplier_price or (parent.get("supplier_data") or {}).get("price"),
+        })
+        current = parent.get("generated_copy") or {}
+    elif req.generated is not None:
+        req = req.model_copy(update={"tone": req.tone or "standard"})
+        current = req.generated
+    else:
+        raise HTTPException(400, "Provide generation_id or generated")
+    if not req.product_name.strip():
+        raise HTTPException(400, "Product name is required")
+
+    prompt = _build_sections_prompt(
+        req.product_name,
+        req.target_audience,
+        req.tone,
+        req.supplier_price,
+        current,
+        sections,
+        req.instructions,
+    )
+    max_tokens = min(1500, 40 + sum(SECTION_MAX_TOKENS[key] for key in sections))
+    plan = await _plan_tier(req.user_id)
+    try:
+        rewritten, usage = await _complete_with_usage(prompt, max_tokens=max_tokens, plan=plan)
     except json.JSONDecodeError:
         raise HTTPException(500, "AI returned invalid output. Please retry.")
     except Exception as e:
-        raise HTTPException(500, f"AI generation failed: {str(e)}")
+        raise HTTPException(500, f"AI generation failed: {e}") from e
+    if not isinstance(rewritten, dict) or any(key not in rewritten for key in sections):
+        raise HTTPException(500, "AI returned invalid output. Please retry.")
 
-    # Save to Supabase if user_id provided
+    # Keep the page's key order; only the requested keys are replaced
+    generated = {**current, **{key: rewritten[key] for key in sections}}
+    generation_cost = min(1, PARTIAL_GENERATION_COST * len(sections))
+    if parent is None and any(not current.get(key) for key in SECTION_SPECS if key not in sections):
+        generation_cost = 1  # The model wrote most of a fresh page
+    revision = (parent.get("revision") or 1) + 1 if parent else 1
+    generation_id = None
     if req.user_id:
-        try:
-            supabase.table("generations").insert({
-                "user_id": req.user_id,
-                "product_name": req.product_name,
-                "supplier_data": {"price": req.supplier_price},
-                "generated_copy": generated,
-                "tone_preset": req.tone,
-            }).execute()
-        except Exception:
-            pass  # Don't fail the request if DB save fails
+        generation_id = await asyncio.to_thread(
+            _save_generation,
+            req,
+            generated,
+            parent_id=parent["id"] if parent else None,
+            revision=revision,
+            regenerated_sections=sections,
+            generation_cost=generation_cost,
+            **usage,
+        )
 
     return {
         "product_name": req.product_name,
         "generated": generated,
+        "regenerated": sections,
+        "generation_id": generation_id,
+        "revision": revision,
+        "model": usage["model"],
     }
+
+
+class GenerateBatchRequest(BaseModel):
+    items: list[GenerateRequest] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+    user_id: str | None = None  # applied to items that don't set their own
+    notify_email: str | None = None
+
+
+def _enqueue_batch(batch_id: str, items: list[dict]) -> None:
+    for index, item in enumerate(items):
+        generate_page_task.delay(batch_id, index, item)
+
+
+@router.post("/generate/batch", status_code=202)
+async def generate_batch(req: GenerateBatchRequest):
+    """Queue up to ``BATCH_MAX_ITEMS`` pages for background generation.
+
+    Each page is a Celery task that runs under the global OpenAI concurrency
+    and tokens-per-minute budget (``services.openai_budget``) and retries
+    rate limits with backoff. Poll ``GET /generate/batch/{batch_id}``;
+    ``notify_email`` gets an email when the whole batch has finished.
+    """
+    if any(not item.product_name.strip() for item in req.items):
+        raise HTTPException(400, "Product name is required")
+
+    items = [
+        item.model_copy(update={"user_id": item.user_id or req.user_id}).model_dump()
+        for item in req.items
+    ]
+    try:
+        batch_id = await generation_batch.create_batch(items, req.user_id, req.notify_email)
+        await asyncio.to_thread(_enqueue_batch, batch_id, items)
+    except Exception as e:
+        raise HTTPException(503, "Job queue is unavailable. Please try again shortly.") from e
+    return {"batch_id": batch_id, "status": "queued", "total": len(items)}
+
+
+@router.get("/generate/batch/{batch_id}")
+async def get_generate_batch(batch_id: str):
+    """Progress of a generation batch, with each finished page and its token usage."""
+    try:
+        batch = await generation_batch.get_batch(batch_id)
+    except Exception as e:
+        raise HTTPException(503, "Batch status is unavailable. Please try again shortly.") from e
+    if batch is None:
+        raise HTTPException(404, "Batch not found")
+    return batch
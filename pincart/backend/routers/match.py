@@ -1,11 +1,72 @@
 """Supplier Matching — AliExpress / CJdropshipping keyword search"""
-import httpx
+import asyncio
+import os
+import re
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from celery_worker import job_status, match_products_task
+from core.sse import SSE_HEADERS, sse_event
+from core.tiered_cache import TieredCache
+from services.http_client import get_http_clients
+from services.pricing import DEFAULT_MARKUP, PricingRules, apply_pricing, price_offers, to_rows
+from services.supplier_engine import SupplierAdapter, SupplierEngine
+from services.supplier_parsers import AliExpressParser, CJParser, StreamParser
 
 router = APIRouter()
 
-MARKUP = 2.8  # Default retail markup
+DISCLAIMER = (
+    f"Margin estimates assume {DEFAULT_MARKUP:g}x markup. Net profit includes card fees "
+    "but not ads or shipping; use /profit-calculator to model your own costs."
+)
+PROFIT_CALCULATOR_MAX_OFFERS = 5000
+BATCH_MAX_TITLES = 200
+BATCH_SYNC_MAX = int(os.getenv("MATCH_BATCH_SYNC_MAX", "25"))  # larger batches go to Celery
+# Per-title budget inside a batch; titles queue on the per-supplier limit
+BATCH_BUDGET = float(os.getenv("MATCH_BATCH_BUDGET_SECONDS", "30"))
+DEDUPE_SIMILARITY = 0.8  # token Jaccard at or above which titles are merged
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/131.0.0.0 Safari/537.36"
+
+# Per-source cache TTLs (seconds) by search outcome:
+#   ok — products found; empty — page parsed, nothing matched;
+#   blocked — non-200 response or captcha page.
+# Network errors and timeouts are not cached; the supplier engine retries
+# them and trips the source's circuit breaker.
+# Stale entries are served while a background refresh re-queries the source.
+SOURCE_TTLS = {
+    "aliexpress": {
+        "ok": int(os.getenv("MATCH_ALIEXPRESS_TTL_SECONDS", str(6 * 3600))),
+        "empty": 15 * 60,
+        "blocked": 5 * 60,
+    },
+    "cj": {
+        "ok": int(os.getenv("MATCH_CJ_TTL_SECONDS", str(12 * 3600))),
+        "empty": 15 * 60,
+        "blocked": 5 * 60,
+    },
+}
+STALE_TTL = int(os.getenv("MATCH_STALE_TTL_SECONDS", str(24 * 3600)))
+BLOCK_MARKERS = ("captcha", "punish", "unusual traffic")
+
+
+def _source_ttls(source: str):
+    def ttl_for(outcome: dict) -> tuple[int, int]:
+        ttls = SOURCE_TTLS[source]
+        return ttls.get(outcome.get("status"), ttls["blocked"]), STALE_TTL
+
+    return ttl_for
+
+
+_caches = {
+    source: TieredCache(
+        f"match:{source}",
+        fresh_ttl=ttls["ok"],
+        stale_ttl=STALE_TTL,
+        maxsize=1024,
+        ttl_for=_source_ttls(source),
+    )
+    for source, ttls in SOURCE_TTLS.items()
+}
 
 
 class MatchRequest(BaseModel):
@@ -13,92 +74,115 @@ class MatchRequest(BaseModel):
     image_url: str | None = None
 
 
-async def _search_aliexpress(keyword: str) -> list[dict]:
+def _normalize_title(title: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace for cache keys."""
+    return " ".join(re.sub(r"[^\w\s]", " ", title.lower()).split())
+
+
+def _outcome(status_code: int, head: str, results: list[dict]) -> dict:
+    """Classify a supplier response as ok / empty / blocked."""
+    if results:
+        return {"status": "ok", "results": results}
+    if status_code != 200:
+        return {"status": "blocked", "results": []}
+    if any(marker in head.lower() for marker in BLOCK_MARKERS):
+        return {"status": "blocked", "results": []}
+    return {"status": "empty", "results": []}
+
+
+async def _stream_parse(url: str, parser: StreamParser, **kwargs) -> tuple[int, str, list[dict]]:
+    """GET *url* and feed the body to *parser*, closing the response early
+    once it has enough products. Returns ``(status_code, head, products)``."""
+    async with get_http_clients().stream("GET", url, follow_redirects=True, **kwargs) as resp:
+        if resp.status_code != 200:
+            return resp.status_code, "", []
+        async for chunk in resp.aiter_bytes():
+            if parser.feed(chunk):
+                break
+    return resp.status_code, parser.head, parser.close()
+
+
+def _supplier_result(source: str, title: str, cost: float, **extra) -> dict:
+    """Build a supplier offer; pricing is filled in by ``apply_pricing``."""
+    return {"source": source, "product_title": title, "unit_cost": cost, "image": "", **extra}
+
+
+async def _fetch_aliexpress(keyword: str) -> dict:
     """Search AliExpress via their public search page and parse results."""
-    results: list[dict] = []
-    try:
-        async with httpx.AsyncClient(timeout=12) as client:
-            # Use AliExpress affiliate/search API-like endpoint
-            url = "https://www.aliexpress.com/wholesale"
-            params = {"SearchText": keyword, "SortType": "total_tranpro_desc"}
-            resp = await client.get(
-                url,
-                params=params,
-                headers={
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/131.0.0.0 Safari/537.36",
-                    "Accept": "text/html",
-                },
-                follow_redirects=True,
-            )
-            if resp.status_code == 200:
-                text = resp.text
-                # Parse JSON embedded in page (runParams or similar)
-                import re, json
-
-                # Try to extract product data from page scripts
-                pattern = r'"productId":"?(\d+)"?.*?"title":"([^"]*)".*?"salePrice":"?([0-9.]+)"?'
-                matches = re.findall(pattern, text[:50000])
-                for pid, title, price in matches[:5]:
-                    cost = float(price)
-                    retail = round(cost * MARKUP, 2)
-                    margin = round((retail - cost) / retail * 100, 1)
-                    results.append({
-                        "source": "AliExpress",
-                        "supplier_name": "AliExpress Seller",
-                        "product_title": title,
-                        "unit_cost": cost,
-                        "suggested_retail": retail,
-                        "estimated_margin_pct": margin,
-                        "shipping_regions": ["US", "UK", "AU", "CA"],
-                        "product_url": f"https://www.aliexpress.com/item/{pid}.html",
-                        "image": "",
-                    })
-    except Exception:
-        pass
-    return results
-
-
-async def _search_cj(keyword: str) -> list[dict]:
+    # Product data is embedded as JSON in the page scripts
+    status, head, products = await _stream_parse(
+        "https://www.aliexpress.com/wholesale",
+        AliExpressParser(limit=5),
+        params={"SearchText": keyword, "SortType": "total_tranpro_desc"},
+        headers={"User-Agent": USER_AGENT, "Accept": "text/html"},
+    )
+    results = [
+        _supplier_result(
+            "AliExpress",
+            p["title"],
+            float(p["price"]),
+            supplier_name="AliExpress Seller",
+            shipping_regions=["US", "UK", "AU", "CA"],
+            product_url=f"https://www.aliexpress.com/item/{p['id']}.html",
+        )
+        for p in products
+    ]
+    return _outcome(status, head, results)
+
+
+async def _fetch_cj(keyword: str) -> dict:
     """Search CJdropshipping product catalog."""
-    results: list[dict] = []
-    try:
-        async with httpx.AsyncClient(timeout=12) as client:
-            url = "https://cjdropshipping.com/search-product.html"
-            resp = await client.get(
-                url,
-                params={"keyword": keyword},
-                headers={
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/131.0.0.0 Safari/537.36",
-                },
-                follow_redirects=True,
-            )
-            if resp.status_code == 200:
-                import re
-                text = resp.text
-                # Extract basic product info
-                price_matches = re.findall(r'\$([0-9]+\.?[0-9]*)', text[:30000])
-                title_matches = re.findall(r'title="([^"]{10,80})"', text[:30000])
-                for i, (title, price_str) in enumerate(zip(title_matches[:3], price_matches[:3])):
-                    try:
-                        cost = float(price_str)
-                        retail = round(cost * MARKUP, 2)
-                        margin = round((retail - cost) / retail * 100, 1)
-                        results.append({
-                            "source": "CJdropshipping",
-                            "supplier_name": "CJ Supplier",
-                            "product_title": title,
-                            "unit_cost": cost,
-                            "suggested_retail": retail,
-                            "estimated_margin_pct": margin,
-                            "shipping_regions": ["US", "UK", "EU"],
-                            "product_url": f"https://cjdropshipping.com/search-product.html?keyword={keyword}",
-                            "image": "",
-                        })
-                    except ValueError:
-                        continue
-    except Exception:
-        pass
-    return results
+    status, head, products = await _stream_parse(
+        "https://cjdropshipping.com/search-product.html",
+        CJParser(limit=3),
+        params={"keyword": keyword},
+        headers={"User-Agent": USER_AGENT},
+    )
+    results = [
+        _supplier_result(
+            "CJdropshipping",
+            p["title"],
+            float(p["price"]),
+            supplier_name="CJ Supplier",
+            shipping_regions=["US", "UK", "EU"],
+            product_url=f"https://cjdropshipping.com/search-product.html?keyword={keyword}",
+        )
+        for p in products
+    ]
+    return _outcome(status, head, results)
+
+
+async def _cached_search(source: str, keyword: str, load) -> dict:
+    """Return the *source* outcome for *keyword*, cached per normalized title."""
+    cache = _caches[source]
+    key = _normalize_title(keyword)
+
+    async def load_keeping_last_good() -> dict:
+        outcome = await load()
+        if outcome["status"] == "blocked":
+            # Keep serving the last good results, but retry after the short TTL
+            previous = await cache.peek(key)
+            if previous is not None and previous[1].get("results"):
+                outcome["results"] = previous[1]["results"]
+        return outcome
+
+    return await cache.get_or_load(key, load_keeping_last_good)
+
+
+# Registered supplier sources; add an adapter here to query another supplier.
+# Their concurrency caps are shared across all web and Celery workers.
+engine = SupplierEngine([
+    SupplierAdapter(
+        "aliexpress",
+        _fetch_aliexpress,
+        lookup=lambda keyword, load: _cached_search("aliexpress", keyword, load),
+    ),
+    SupplierAdapter(
+        "cj",
+        _fetch_cj,
+        lookup=lambda keyword, load: _cached_search("cj", keyword, load),
+    ),
+], shared_limits=True)
 
 
 def _generate_fallback_suppliers(keyword: str) -> list[dict]:
@@ -112,15 +196,11 @@ def _generate_fallback_suppliers(keyword: str) -> list[dict]:
     suppliers = []
     for i, source in enumerate(["AliExpress", "CJdropshipping"]):
         cost = round(base_cost + i * 1.5, 2)
-        retail = round(cost * MARKUP, 2)
-        margin = round((retail - cost) / retail * 100, 1)
         suppliers.append({
             "source": source,
             "supplier_name": f"{source} Top Seller",
             "product_title": keyword,
             "unit_cost": cost,
-            "suggested_retail": retail,
-            "estimated_margin_pct": margin,
             "shipping_regions": ["US", "UK", "AU", "CA", "EU"],
             "product_url": f"https://www.aliexpress.com/wholesale?SearchText={keyword.replace(' ', '+')}" if source == "AliExpress" else f"https://cjdropshipping.com/search-product.html?keyword={keyword.replace(' ', '+')}",
             "image": "",
@@ -128,35 +208,165 @@ def _generate_fallback_suppliers(keyword: str) -> list[dict]:
     return suppliers
 
 
+async def _match_title(keyword: str, budget: float | None = None) -> dict:
+    """Cheapest three supplier matches for *keyword*."""
+    # Query every supplier in parallel; slow sources are cut off by the budget
+    found = await engine.search(keyword, budget=budget)
+    all_results = found["results"]
+
+    # If scraping found nothing, provide fallback estimates
+    if not all_results:
+        all_results = _generate_fallback_suppliers(keyword)
+
+    # Sort by cost ascending; copy so pricing never touches cached offers
+    all_results.sort(key=lambda x: x.get("unit_cost", 999))
+    top3 = apply_pricing([dict(offer) for offer in all_results[:3]])
+
+    return {
+        "product_title": keyword,
+        "match_count": len(top3),
+        "suppliers": top3,
+        "sources": found["sources"],
+    }
+
+
 @router.post("/match-product")
 async def match_product(req: MatchRequest):
     """Find supplier matches for a product."""
     if not req.product_title.strip():
         raise HTTPException(400, "Product title is required")
 
-    keyword = req.product_title.strip()
+    return {**await _match_title(req.product_title.strip()), "disclaimer": DISCLAIMER}
 
-    # Run both searches in parallel
-    import asyncio
-    ali_results, cj_results = await asyncio.gather(
-        _search_aliexpress(keyword),
-        _search_cj(keyword),
-    )
 
-    # Merge and deduplicate
-    all_results = ali_results + cj_results
+def _dedupe_titles(titles: list[str]) -> list[tuple[str, list[int]]]:
+    """Group identical or near-identical titles.
 
-    # If scraping found nothing, provide fallback estimates
-    if not all_results:
-        all_results = _generate_fallback_suppliers(keyword)
+    Returns ``(title, request_indexes)`` pairs, one per distinct product,
+    using the first title seen for each group. Titles whose normalized word
+    sets overlap by at least ``DEDUPE_SIMILARITY`` are treated as the same.
+    """
+    groups: list[tuple[str, set[str], list[int]]] = []
+    for index, raw in enumerate(titles):
+        title = raw.strip()
+        if not title:
+            continue
+        words = set(_normalize_title(title).split())
+        for _, group_words, indexes in groups:
+            union = words | group_words
+            if union and len(words & group_words) / len(union) >= DEDUPE_SIMILARITY:
+                indexes.append(index)
+                break
+        else:
+            groups.append((title, words, [index]))
+    return [(title, indexes) for title, _, indexes in groups]
 
-    # Sort by cost ascending
-    all_results.sort(key=lambda x: x.get("unit_cost", 999))
-    top3 = all_results[:3]
 
+async def _match_batch(titles: list[str]):
+    """Yield ``(request_indexes, match)`` for each distinct title as it completes.
+
+    Every title starts at once; the supplier engine's per-source concurrency
+    limit decides how many requests actually go out together.
+    """
+    groups = _dedupe_titles(titles)
+
+    async def run(title: str, indexes: list[int]):
+        return indexes, await _match_title(title, budget=BATCH_BUDGET)
+
+    for next_done in asyncio.as_completed([run(title, indexes) for title, indexes in groups]):
+        yield await next_done
+
+
+async def match_batch(titles: list[str]) -> dict:
+    """Match every title and collect results in request order (Celery jobs)."""
+    results: list[dict | None] = [None] * len(titles)
+    unique = 0
+    async for indexes, match in _match_batch(titles):
+        unique += 1
+        for index in indexes:
+            results[index] = match
+    return {"unique_titles": unique, "results": results, "disclaimer": DISCLAIMER}
+
+
+class BatchMatchRequest(BaseModel):
+    products: list[MatchRequest] = Field(..., min_length=1, max_length=BATCH_MAX_TITLES)
+    background: bool = False  # queue as a Celery job even for small batches
+
+
+@router.post("/match-products")
+async def match_products(req: BatchMatchRequest):
+    """Match a batch of product titles in one request.
+
+    Near-identical titles are matched once. Batches up to
+    ``MATCH_BATCH_SYNC_MAX`` stream a ``match`` event per distinct title as it
+    completes (with the request indexes it answers), then ``summary``.
+    Larger batches, or ``background`` requests, are queued and return a job
+    id to poll at ``/match-products/jobs/{job_id}``.
+    """
+    titles = [p.product_title.strip() for p in req.products]
+    if not any(titles):
+        raise HTTPException(400, "At least one product title is required")
+
+    if req.background or len(titles) > BATCH_SYNC_MAX:
+        try:
+            task = await asyncio.to_thread(match_products_task.delay, titles)
+        except Exception as e:
+            raise HTTPException(503, "Job queue is unavailable. Please try again shortly.") from e
+        return JSONResponse({"job_id": task.id, "status": "queued"}, status_code=202)
+
+    async def events():
+        unique = 0
+        async for indexes, match in _match_batch(titles):
+            unique += 1
+            yield sse_event("match", {"requests": indexes, **match})
+        yield sse_event(
+            "summary",
+            {"titles": len(titles), "unique_titles": unique, "disclaimer": DISCLAIMER},
+        )
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.get("/match-products/jobs/{job_id}")
+async def get_match_job(job_id: str):
+    """Poll the status of a batch match job."""
+    return await asyncio.to_thread(job_status, job_id)
+
+
+class ProfitOffer(BaseModel):
+    unit_cost: float = Field(..., ge=0)
+    region: str | None = None
+
+
+class ProfitCalculatorRequest(BaseModel):
+    offers: list[ProfitOffer] = Field(..., min_length=1, max_length=PROFIT_CALCULATOR_MAX_OFFERS)
+    markup: float = Field(DEFAULT_MARKUP, gt=0)
+    markup_tiers: list[tuple[float, float]] = []  # (max_unit_cost, markup)
+    payment_fee_pct: float = Field(PricingRules.payment_fee_pct, ge=0, le=100)
+    payment_fee_fixed: float = Field(PricingRules.payment_fee_fixed, ge=0)
+    platform_fee_pct: float = Field(0.0, ge=0, le=100)
+    shipping: dict[str, float] = {}  # region -> shipping cost
+    default_shipping: float = Field(0.0, ge=0)
+    charm_cents: int | None = Field(None, ge=0, le=99)
+
+
+@router.post("/profit-calculator")
+async def profit_calculator(req: ProfitCalculatorRequest):
+    """Price a batch of offers under custom markup, fee and shipping rules."""
+    rules = PricingRules(**req.model_dump(exclude={"offers"}))
+    priced = price_offers(
+        [offer.unit_cost for offer in req.offers],
+        [offer.region for offer in req.offers],
+        rules,
+    )
+    rows = to_rows(priced)
+    net = priced["net_profit"]
     return {
-        "product_title": keyword,
-        "match_count": len(top3),
-        "suppliers": top3,
-        "disclaimer": "Margin estimates assume 2.8x markup. Actual margins vary after fees, ads, and shipping costs.",
+        "count": len(rows),
+        "rows": rows,
+        "summary": {
+            "total_net_profit": round(float(net.sum()), 2),
+            "avg_net_margin_pct": round(float(priced["net_margin_pct"].mean()), 1),
+            "unprofitable": int((net <= 0).sum()),
+        },
     }
@@ -0,0 +1,110 @@
+"""PinCart AI — Content-addressed store for finished export files.
+
+Each export file is named by a hash of everything that determines its
+contents (``artifact_name``). A repeat export, or an "Export History"
+download, is answered from the stored file instead of rebuilding it.
+``FilesystemArtifactStore`` keeps files on local disk. An object store
+would implement the same methods and serve ``url`` directly.
+"""
+import hashlib
+import json
+import os
+import re
+import uuid
+from typing import Any, BinaryIO
+
+EXPORT_ARTIFACT_DIR: str = os.getenv(
+    "EXPORT_ARTIFACT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "artifacts", "exports"),
+)
+# Public path (or absolute URL) that serves stored artifacts
+EXPORT_ARTIFACT_URL: str = os.getenv("EXPORT_ARTIFACT_URL", "/exports/artifacts")
+# Bump when the export file format changes so old artifacts are not reused
+ARTIFACT_VERSION = "1"
+
+_NAME_RE = re.compile(r"^[0-9a-f]{64}\.[a-z]{2,5}$")
+
+
+def artifact_name(kind: str, inputs: Any, ext: str = "csv") -> str:
+    """Content address for an export of *kind* built from *inputs* (JSON-able)."""
+    raw = json.dumps([ARTIFACT_VERSION, kind, inputs], sort_keys=True, default=str)
+    return f"{hashlib.sha256(raw.encode()).hexdigest()}.{ext}"
+
+
+def valid_name(name: str) -> bool:
+    return bool(_NAME_RE.match(name))
+
+
+class PendingArtifact:
+    """A file being written; ``commit`` publishes it atomically, ``abort`` drops it.
+
+    The temporary file is only opened by the first ``write``, so a writer
+    that is never used holds no file handle.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        self._file: BinaryIO | None = None
+        self.size = 0
+
+    def _open(self) -> BinaryIO:
+        if self._file is None:
+            self._file = open(self._tmp, "wb")  # noqa: SIM115 (closed by commit/abort)
+        return self._file
+
+    def write(self, data: bytes) -> None:
+        self._open().write(data)
+        self.size += len(data)
+
+    def commit(self) -> None:
+        self._open().close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self) -> None:
+        if self._file is None:
+            return
+        self._file.close()
+        try:
+            os.remove(self._tmp)
+        except OSError:
+            pass
+
+
+class FilesystemArtifactStore:
+    """Artifacts under *root*, fanned out by the first hash characters."""
+
+    def __init__(
+        self, root: str = EXPORT_ARTIFACT_DIR, base_url: str = EXPORT_ARTIFACT_URL
+    ) -> None:
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def _path(self, name: str) -> str:
+        if not valid_name(name):
+            raise ValueError(f"Invalid artifact name: {name!r}")
+        return os.path.join(self.root, name[:2], name)
+
+    def path(self, name: str) -> str | None:
+        """Local path of artifact *name*, or *None* if it isn't stored."""
+        path = self._path(name)
+        return path if os.path.isfile(path) else None
+
+    def url(self, name: str) -> str:
+        return f"{self.base_url}/{name}"
+
+    def writer(self, name: str) -> PendingArtifact:
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return PendingArtifact(path)
+
+
+_store: FilesystemArtifactStore | None = None
+
+
+def get_artifact_store() -> FilesystemArtifactStore:
+    """The process-wide artifact store."""
+    global _store
+    if _store is None:
+        _store = FilesystemArtifactStore()
+    return _store
@@ -0,0 +1,281 @@
+"""PinCart AI — Batch product-page generation.
+
+A batch is a list of generate requests processed by one Celery task per
+item. Progress lives in Redis: a hash of counters per batch plus one JSON
+entry per item. Each item goes through the generation cache and the shared
+OpenAI budget, and is saved to ``generations`` with its token usage.
+"""
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Any
+
+import openai
+
+from core.cache import get_redis
+from services import openai_budget
+from services.model_router import FAILOVER_ERRORS
+
+BATCH_TTL: int = 3 * 24 * 3600  # keep progress for three days
+MAX_BACKOFF: float = 300.0
+
+# OpenAI errors worth retrying with backoff; anything else fails the item
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+# A 429 is retried on the same model with backoff rather than failed over, so
+# a rate-limited primary does not push a batch onto the fallback model
+BATCH_FAILOVER_ERRORS = tuple(
+    error for error in FAILOVER_ERRORS if error is not openai.RateLimitError
+)
+
+
+class RetryLater(Exception):
+    """Raised by ``run_item`` when the Celery task should retry after *countdown*."""
+
+    def __init__(self, countdown: float, reason: str) -> None:
+        super().__init__(reason)
+        self.countdown = countdown
+
+
+def _meta_key(batch_id: str) -> str:
+    return f"pincart:genbatch:{batch_id}"
+
+
+def _items_key(batch_id: str) -> str:
+    return f"pincart:genbatch:{batch_id}:items"
+
+
+async def create_batch(
+    items: list[dict[str, Any]], user_id: str | None, notify_email: str | None
+) -> str:
+    """Record a new batch as queued and return its id (raises without Redis)."""
+    batch_id = uuid.uuid4().hex
+    r = await get_redis()
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.hset(
+            _meta_key(batch_id),
+            mapping={
+                "total": len(items),
+                "completed": 0,
+                "failed": 0,
+                "cached": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "user_id": user_id or "",
+                "notify_email": notify_email or "",
+                "created_at": int(time.time()),
+            },
+        )
+        pipe.hset(
+            _items_key(batch_id),
+            mapping={
+                str(i): json.dumps(
+                    {
+                        "index": i,
+                        "product_name": item["product_name"],
+                        "status": "queued",
+                    }
+                )
+                for i, item in enumerate(items)
+            },
+        )
+        pipe.expire(_meta_key(batch_id), BATCH_TTL)
+        pipe.expire(_items_key(batch_id), BATCH_TTL)
+        await pipe.execute()
+    return batch_id
+
+
+async def get_batch(batch_id: str) -> dict[str, Any] | None:
+    """Progress for *batch_id*, or *None* if unknown or expired."""
+    r = await get_redis()
+    meta = await r.hgetall(_meta_key(batch_id))
+    if not meta:
+        return None
+    raw_items = await r.hgetall(_items_key(batch_id))
+    items = sorted(
+        (json.loads(v) for v in raw_items.values()), key=lambda i: i["index"]
+    )
+    total = int(meta["total"])
+    done = int(meta["completed"]) + int(meta["failed"])
+    return {
+        "batch_id": batch_id,
+        "status": "complete" if done >= total else "running",
+        "total": total,
+        "completed": int(meta["completed"]),
+        "failed": int(meta["failed"]),
+        "cached": int(meta["cached"]),
+        "usage": {
+            "prompt_tokens": int(meta["prompt_tokens"]),
+            "completion_tokens": int(meta["completion_tokens"]),
+        },
+        "items": items,
+    }
+
+
+async def _set_item(batch_id: str, index: int, entry: dict[str, Any]) -> None:
+    r = await get_redis()
+    await r.hset(_items_key(batch_id), str(index), json.dumps(entry))
+
+
+async def _finish_item(
+    batch_id: str, entry: dict[str, Any], usage: dict[str, int] | None = None
+) -> dict[str, Any]:
+    """Store the item's final state and return the batch counters.
+
+    Counters are bumped atomically, so exactly one item sees the batch
+    reach its total (``batch_done``) and sends the completion email.
+    """
+    await _set_item(batch_id, entry["index"], entry)
+    r = await get_redis()
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.hincrby(
+            _meta_key(batch_id),
+            "completed" if entry["status"] == "complete" else "failed",
+            1,
+        )
+        if entry.get("cached"):
+            pipe.hincrby(_meta_key(batch_id), "cached", 1)
+        if usage:
+            pipe.hincrby(
+                _meta_key(batch_id), "prompt_tokens", usage.get("prompt_tokens", 0)
+            )
+            pipe.hincrby(
+                _meta_key(batch_id),
+                "completion_tokens",
+                usage.get("completion_tokens", 0),
+            )
+        pipe.hgetall(_meta_key(batch_id))
+        meta = (await pipe.execute())[-1]
+    finished = int(meta["completed"]) + int(meta["failed"])
+    return {
+        **entry,
+        "batch_done": finished >= int(meta["total"]),
+        "batch": {
+            "total": int(meta["total"]),
+            "completed": int(meta["completed"]),
+            "failed": int(meta["failed"]),
+            "notify_email": meta.get("notify_email") or None,
+            "total_tokens": int(meta["prompt_tokens"]) + int(meta["completion_tokens"]),
+        },
+    }
+
+
+def backoff(attempt: int, retry_after: float | None = None) -> float:
+    """Seconds to wait before retry *attempt* (0-based), honouring Retry-After."""
+    if retry_after:
+        return min(MAX_BACKOFF, retry_after + random.uniform(0, 2))
+    return min(MAX_BACKOFF, 10 * 2**attempt) + random.uniform(0, 5)
+
+
+def _retry_after(exc: Exception) -> float | None:
+    response = getattr(exc, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+async def run_item(
+    batch_id: str, index: int, item: dict[str, Any], attempt: int, final_attempt: bool
+) -> dict[str, Any]:
+    """Generate one page of a batch.
+
+    Raises ``RetryLater`` on rate limits, transient OpenAI errors or an
+    exhausted budget, unless this is the *final_attempt*, in which case the
+    item is marked failed.
+    """
+    from routers.generate import (
+        GenerateRequest,
+        _build_prompt,
+        _cache,
+        _cache_identifier,
+        _cache_value,
+        _cached_page,
+        _complete_with_usage,
+        _completion_params,
+        _plan_tier,
+        _save_generation,
+        model_router,
+    )
+
+    req = GenerateRequest(**item)
+    plan = await _plan_tier(req.user_id)
+    inputs = (req.product_name, req.target_audience, req.tone, req.supplier_price)
+    key = _cache_identifier(*inputs, model_router.preferred(plan))
+    entry: dict[str, Any] = {"index": index, "product_name": req.product_name}
+
+    usage: dict[str, Any] | None = None
+    page = None if req.regenerate else await _cached_page(key)
+    if page is not None:
+        generated = page["generated"]
+        entry["cached"] = True
+        entry["model"] = page["model"]
+    else:
+        await _set_item(
+            batch_id, index, {**entry, "status": "running", "attempt": attempt + 1}
+        )
+        prompt = _build_prompt(*inputs)
+        try:
+            max_tokens = _completion_params(prompt)["max_tokens"]
+            reservation = await openai_budget.acquire(
+                openai_budget.estimate_tokens(prompt, max_tokens)
+            )
+        except openai_budget.BudgetUnavailable as exc:
+            if final_attempt:
+                return await _finish_item(
+                    batch_id, {**entry, "status": "failed", "error": str(exc)}
+                )
+            raise RetryLater(exc.retry_after, str(exc))
+        try:
+            generated, usage = await _complete_with_usage(
+                prompt, plan=plan, failover_errors=BATCH_FAILOVER_ERRORS
+            )
+        except RETRYABLE_ERRORS as exc:
+            await openai_budget.release(reservation)
+            if final_attempt:
+                return await _finish_item(
+                    batch_id, {**entry, "status": "failed", "error": str(exc)}
+                )
+            raise RetryLater(backoff(attempt, _retry_after(exc)), str(exc))
+        except Exception as exc:  # noqa: BLE001 (recorded as the item's failure)
+            await openai_budget.release(reservation)
+            message = (
+                "AI returned invalid output"
+                if isinstance(exc, json.JSONDecodeError)
+                else str(exc)
+            )
+            return await _finish_item(
+                batch_id, {**entry, "status": "failed", "error": message}
+            )
+        await openai_budget.release(reservation, usage.get("total_tokens"))
+        entry["model"] = usage["model"]
+        value = _cache_value(generated, usage["model"], plan)
+        if value:
+            await _cache.set(key, value)
+
+    generation_id = None
+    if req.user_id:
+        generation_id = await asyncio.to_thread(
+            _save_generation,
+            req,
+            generated,
+            batch_id=batch_id,
+            **(usage or {"model": entry["model"]}),
+        )
+    return await _finish_item(
+        batch_id,
+        {
+            **entry,
+            "status": "complete",
+            "generation_id": generation_id,
+            "generated": generated,
+            "usage": usage,
+        },
+        usage,
+    )
@@ -0,0 +1,145 @@
+"""PinCart AI — Shared outbound HTTP clients.
+
+Keeps one ``httpx.AsyncClient`` per upstream host for the lifetime of the
+app, so supplier searches and Mailgun calls reuse warm keep-alive (and
+HTTP/2 where the host supports it) connections instead of paying DNS, TCP
+and TLS setup on every request.
+"""
+import os
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager, suppress
+from typing import Any
+from urllib.parse import urlsplit
+
+import httpx
+
+# Defaults for hosts without an explicit entry in HOST_CONFIG
+DEFAULT_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT_SECONDS", "10"))
+DEFAULT_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+DEFAULT_MAX_KEEPALIVE: int = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+
+# Per-host overrides: timeout (s), max_connections, max_keepalive, http2
+HOST_CONFIG: dict[str, dict[str, Any]] = {
+    "www.aliexpress.com": {"timeout": 12, "max_connections": 20, "http2": True},
+    "cjdropshipping.com": {"timeout": 12, "max_connections": 20, "http2": True},
+    "api.mailgun.net": {"timeout": 10, "max_connections": 5, "http2": True},
+}
+
+
+class HTTPClientManager:
+    """Lazily created, per-host pooled ``httpx.AsyncClient`` instances."""
+
+    def __init__(self, host_config: dict[str, dict[str, Any]] | None = None) -> None:
+        self.host_config = HOST_CONFIG if host_config is None else host_config
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._stats: dict[str, dict[str, int]] = {}
+
+    def client(self, url: str) -> httpx.AsyncClient:
+        """Return the pooled client for *url*'s host, creating it on first use."""
+        host = urlsplit(url).hostname or url
+        client = self._clients.get(host)
+        if client is None:
+            cfg = self.host_config.get(host, {})
+            client = httpx.AsyncClient(
+                http2=cfg.get("http2", True),
+                timeout=cfg.get("timeout", DEFAULT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=cfg.get("max_connections", DEFAULT_MAX_CONNECTIONS),
+                    max_keepalive_connections=cfg.get(
+                        "max_keepalive", DEFAULT_MAX_KEEPALIVE
+                    ),
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+            )
+            self._clients[host] = client
+            self._stats[host] = {"requests": 0, "errors": 0, "in_flight": 0}
+        return client
+
+    def _host_stats(self, url: str) -> dict[str, int]:
+        self.client(url)
+        return self._stats[urlsplit(url).hostname or url]
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Send a request through the host's pool (``httpx`` keyword arguments)."""
+        stats = self._host_stats(url)
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        try:
+            return await self.client(url).request(method, url, **kwargs)
+        except Exception:
+            stats["errors"] += 1
+            raise
+        finally:
+            stats["in_flight"] -= 1
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(
+        self, method: str, url: str, **kwargs: Any
+    ) -> AsyncIterator[httpx.Response]:
+        """Stream a response body through the host's pool."""
+        stats = self._host_stats(url)
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        try:
+            async with self.client(url).stream(method, url, **kwargs) as resp:
+                yield resp
+        except Exception:
+            stats["errors"] += 1
+            raise
+        finally:
+            stats["in_flight"] -= 1
+
+    async def close(self) -> None:
+        """Close every pooled client."""
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            with suppress(Exception):
+                await client.aclose()
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """Per-host request counters and pool usage for ``/health``."""
+        out: dict[str, dict[str, int]] = {}
+        for host, counters in self._stats.items():
+            entry = dict(counters)
+            client = self._clients.get(host)
+            # httpx does not expose pool state publicly; read it defensively
+            pool = getattr(getattr(client, "_transport", None), "_pool", None)
+            connections = list(getattr(pool, "connections", []) or [])
+            entry["connections"] = len(connections)
+            entry["idle_connections"] = sum(1 for c in connections if c.is_idle())
+            out[host] = entry
+        return out
+
+
+_manager: HTTPClientManager | None = None
+
+
+def get_http_clients() -> HTTPClientManager:
+    """Return the app-wide client manager (lazy-initialised)."""
+    global _manager
+    if _manager is None:
+        _manager = HTTPClientManager()
+    return _manager
+
+
+def start_http_clients() -> HTTPClientManager:
+    """Create the manager and a client for every configured host (call on startup)."""
+    manager = get_http_clients()
+    for host in manager.host_config:
+        manager.client(f"https://{host}")
+    return manager
+
+
+async def close_http_clients() -> None:
+    """Close all pooled clients (call on shutdown)."""
+    global _manager
+    if _manager is not None:
+        await _manager.close()
+        _manager = None
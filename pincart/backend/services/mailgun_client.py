@@ -1,8 +1,10 @@
 """PinCart AI — Mailgun transactional email client."""
+import html
 import os
-from typing import Optional
+import re
+from typing import Any, Optional
 
-import httpx
+from services.http_client import get_http_clients
 
 MAILGUN_API_KEY: str = os.getenv("MAILGUN_API_KEY", "")
 MAILGUN_DOMAIN: str = os.getenv("MAILGUN_DOMAIN", "")
@@ -10,6 +12,23 @@ MAILGUN_FROM: str = os.getenv(
     "MAILGUN_FROM", f"PinCart AI <noreply@{MAILGUN_DOMAIN}>"
 )
 MAILGUN_API_URL: str = f"https://api.mailgun.net/v3/{MAILGUN_DOMAIN}/messages"
+TEMPLATE_DIR: str = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "templates", "email"
+)
+
+
+def render_template(name: str, **context: Any) -> str:
+    """Render ``templates/email/<name>.html``, replacing ``{{key}}`` placeholders.
+
+    Values are HTML-escaped; unknown placeholders render as empty strings.
+    """
+    with open(os.path.join(TEMPLATE_DIR, f"{name}.html"), encoding="utf-8") as f:
+        source = f.read()
+    return re.sub(
+        r"\{\{\s*(\w+)\s*\}\}",
+        lambda m: html.escape(str(context.get(m.group(1), ""))),
+        source,
+    )
 
 
 async def send_email(
@@ -35,12 +54,11 @@ async def send_email(
         data["text"] = text
 
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            resp = await client.post(
-                MAILGUN_API_URL,
-                auth=("api", MAILGUN_API_KEY),
-                data=data,
-            )
-            return resp.status_code == 200
+        resp = await get_http_clients().post(
+            MAILGUN_API_URL,
+            auth=("api", MAILGUN_API_KEY),
+            data=data,
+        )
+        return resp.status_code == 200
     except Exception:
         return False
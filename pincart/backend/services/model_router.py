@@ -0,0 +1,186 @@
+"""PinCart AI — Latency-aware OpenAI model router.
+
+Chat completions go through ``ModelRouter``, which keeps a rolling window of
+latency and errors per model. Requests try the plan's preferred model first
+(free plan: the cheaper fallback) and fail over to the other model when a
+call errors or times out. A model whose recent error rate or P95 latency is
+over the limit is tried last until its window clears, so a slow upstream
+stops holding every request for the full timeout.
+"""
+import math
+import os
+import time
+from collections import deque
+from typing import Any
+
+import openai
+
+PRIMARY_MODEL: str = os.getenv("OPENAI_PRIMARY_MODEL", "gpt-4o")
+FALLBACK_MODEL: str = os.getenv("OPENAI_FALLBACK_MODEL", "gpt-3.5-turbo")
+# Plans routed to the fallback model first; requests without a user count as free
+ECONOMY_PLANS = set(os.getenv("MODEL_ECONOMY_PLANS", "free").split(","))
+# Plan of a signed-in user whose profile could not be read. Routed like a paid
+# plan, so a profile outage never quietly downgrades paying users.
+UNKNOWN_PLAN = "unknown"
+MODEL_STATS_WINDOW: float = float(os.getenv("MODEL_STATS_WINDOW_SECONDS", "300"))
+MODEL_MIN_SAMPLES: int = int(os.getenv("MODEL_MIN_SAMPLES", "5"))
+MODEL_MAX_ERROR_RATE: float = float(os.getenv("MODEL_MAX_ERROR_RATE", "0.5"))
+# A full 1500-token gpt-4o page normally takes 5-15 s; a P95 above that means
+# the model is running slower than usual
+MODEL_SLOW_P95: float = float(os.getenv("MODEL_SLOW_P95_SECONDS", "15"))
+# A non-streaming completion sends nothing until the whole reply is written, so
+# the per-call timeout scales with max_tokens: a fixed allowance plus the reply
+# at the slowest generation speed still counted as healthy, capped at a ceiling
+# just over the 15 s page target. A timed out call fails over to the next model.
+MODEL_TIMEOUT_BASE: float = float(os.getenv("MODEL_TIMEOUT_BASE_SECONDS", "3"))
+MODEL_MIN_TOKENS_PER_SECOND: float = float(
+    os.getenv("MODEL_MIN_TOKENS_PER_SECOND", "100")
+)
+MODEL_ATTEMPT_TIMEOUT: float = float(os.getenv("MODEL_ATTEMPT_TIMEOUT_SECONDS", "18"))
+
+# Upstream failures worth retrying on another model (not 4xx request errors)
+FAILOVER_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class ModelStats:
+    """Outcomes and latencies of one model's calls over the last *window* seconds."""
+
+    def __init__(self, window: float = MODEL_STATS_WINDOW) -> None:
+        self.window = window
+        # (finished_at, latency or None, ok)
+        self._samples: deque[tuple[float, float | None, bool]] = deque()
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+
+    def record(self, latency: float | None, ok: bool) -> None:
+        self._samples.append((time.monotonic(), latency, ok))
+        self._prune()
+
+    def snapshot(self) -> dict[str, Any]:
+        self._prune()
+        calls = len(self._samples)
+        errors = sum(1 for _, _, ok in self._samples if not ok)
+        latencies = sorted(
+            lat for _, lat, ok in self._samples if ok and lat is not None
+        )
+        p95 = latencies[math.ceil(0.95 * len(latencies)) - 1] if latencies else None
+        return {
+            "calls": calls,
+            "errors": errors,
+            "error_rate": round(errors / calls, 3) if calls else 0.0,
+            "p95_latency": round(p95, 3) if p95 is not None else None,
+        }
+
+
+class ModelRouter:
+    """Pick and call a model per request, failing over on upstream errors."""
+
+    def __init__(
+        self,
+        client: Any,
+        primary: str = PRIMARY_MODEL,
+        fallback: str = FALLBACK_MODEL,
+        economy_plans: set | None = None,
+        window: float = MODEL_STATS_WINDOW,
+        min_samples: int = MODEL_MIN_SAMPLES,
+        max_error_rate: float = MODEL_MAX_ERROR_RATE,
+        slow_p95: float = MODEL_SLOW_P95,
+        attempt_timeout: float = MODEL_ATTEMPT_TIMEOUT,
+        timeout_base: float = MODEL_TIMEOUT_BASE,
+        min_tokens_per_second: float = MODEL_MIN_TOKENS_PER_SECOND,
+    ) -> None:
+        self.client = client
+        self.primary = primary
+        self.fallback = fallback
+        self.economy_plans = ECONOMY_PLANS if economy_plans is None else economy_plans
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.slow_p95 = slow_p95
+        self.attempt_timeout = attempt_timeout
+        self.timeout_base = timeout_base
+        self.min_tokens_per_second = min_tokens_per_second
+        self.stats = {model: ModelStats(window) for model in (primary, fallback)}
+        self.failovers = 0
+
+    def preferred(self, plan: str | None) -> str:
+        """The model *plan* is routed to when every model is healthy."""
+        if plan != UNKNOWN_PLAN and (plan or "free") in self.economy_plans:
+            return self.fallback
+        return self.primary
+
+    def timeout(self, max_tokens: int | None) -> float:
+        """Seconds one call may take to write a reply of up to *max_tokens*."""
+        if not max_tokens:
+            return self.attempt_timeout
+        expected = self.timeout_base + max_tokens / self.min_tokens_per_second
+        return min(self.attempt_timeout, expected)
+
+    def healthy(self, model: str) -> bool:
+        snap = self.stats[model].snapshot()
+        if snap["calls"] < self.min_samples:
+            return True  # Too little recent traffic to judge; let it through
+        if snap["error_rate"] >= self.max_error_rate:
+            return False
+        return snap["p95_latency"] is None or snap["p95_latency"] <= self.slow_p95
+
+    def candidates(self, plan: str | None) -> list[str]:
+        """Models to try for *plan*, in order; unhealthy ones go last."""
+        first = self.preferred(plan)
+        order = list(dict.fromkeys([first, self.primary, self.fallback]))
+        return sorted(order, key=lambda model: not self.healthy(model))
+
+    async def create(
+        self,
+        params: dict[str, Any],
+        plan: str | None = None,
+        stream: bool = False,
+        failover_errors: tuple[type[Exception], ...] = FAILOVER_ERRORS,
+    ) -> tuple[Any, str]:
+        """Run a chat completion and return ``(response, model)``.
+
+        *params* are ``chat.completions.create`` arguments without ``model``.
+        Only *failover_errors* move on to the next model; other upstream
+        errors are raised to the caller. For streams only the outcome of
+        opening the stream is recorded, not its latency.
+        """
+        timeout = self.timeout(params.get("max_tokens"))
+        error: Exception | None = None
+        for model in self.candidates(plan):
+            if error is not None:
+                self.failovers += 1
+            started = time.monotonic()
+            try:
+                response = await self.client.chat.completions.create(
+                    **params, model=model, stream=stream, timeout=timeout
+                )
+            except FAILOVER_ERRORS as exc:
+                self.stats[model].record(None, False)
+                if not isinstance(exc, failover_errors):
+                    raise
+                error = exc
+                continue
+            self.stats[model].record(
+                None if stream else time.monotonic() - started, True
+            )
+            return response, model
+        raise error
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return per-model stats for ``/health``."""
+        return {
+            "primary": self.primary,
+            "fallback": self.fallback,
+            "failovers": self.failovers,
+            "models": {
+                model: {**stats.snapshot(), "healthy": self.healthy(model)}
+                for model, stats in self.stats.items()
+            },
+        }
@@ -0,0 +1,106 @@
+"""PinCart AI — Global OpenAI concurrency and tokens-per-minute budget.
+
+Background generation workers reserve a concurrency slot and an estimate of
+the tokens a call will use from shared Redis counters before calling
+OpenAI, then settle the reservation with the real usage. This keeps bulk
+jobs on every worker under the account's rate limits instead of bursting
+into 429s. Without Redis the per-worker Celery concurrency is the only cap.
+"""
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+
+from core.cache import REDIS_ERRORS, get_redis
+from core.leases import acquire_lease, release_lease
+
+OPENAI_MAX_CONCURRENCY: int = int(os.getenv("OPENAI_MAX_CONCURRENCY", "4"))
+OPENAI_TPM_LIMIT: int = int(os.getenv("OPENAI_TPM_LIMIT", "30000"))
+# How long a worker waits for budget before handing the task back to Celery
+OPENAI_BUDGET_WAIT: float = float(os.getenv("OPENAI_BUDGET_WAIT_SECONDS", "20"))
+# A slot whose worker died is freed after this long; longer than any call
+OPENAI_SLOT_TTL: int = int(os.getenv("OPENAI_SLOT_TTL_SECONDS", "300"))
+
+_ACTIVE_KEY = "pincart:openai:slots"
+_TPM_KEY = "pincart:openai:tpm"
+
+
+class BudgetUnavailable(Exception):
+    """No slot or token budget freed up within the wait."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"OpenAI budget exhausted; retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+@dataclass
+class Reservation:
+    minute: int
+    tokens: int
+    slot: str
+
+
+def estimate_tokens(prompt: str, max_tokens: int) -> int:
+    """Rough upper bound for one call: ~4 characters per prompt token."""
+    return len(prompt) // 4 + max_tokens
+
+
+async def _try_reserve(
+    r, tokens: int, concurrency: int, tpm: int
+) -> Reservation | None:
+    slot = await acquire_lease(r, _ACTIVE_KEY, concurrency, OPENAI_SLOT_TTL)
+    if slot is None:
+        return None
+    minute = int(time.time() // 60)
+    key = f"{_TPM_KEY}:{minute}"
+    used = await r.incrby(key, tokens)
+    await r.expire(key, 120)
+    # A single call larger than the whole budget still gets to run alone
+    if used <= tpm or used == tokens:
+        return Reservation(minute, tokens, slot)
+    await r.decrby(key, tokens)
+    await release_lease(r, _ACTIVE_KEY, slot)
+    return None
+
+
+async def acquire(
+    tokens: int,
+    wait: float = OPENAI_BUDGET_WAIT,
+    concurrency: int = OPENAI_MAX_CONCURRENCY,
+    tpm: int = OPENAI_TPM_LIMIT,
+) -> Reservation | None:
+    """Reserve a slot and *tokens* of this minute's budget.
+
+    Returns *None* when Redis is unavailable (no global cap). Raises
+    ``BudgetUnavailable`` if nothing frees up within *wait* seconds.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            r = await get_redis()
+            reservation = await _try_reserve(r, tokens, concurrency, tpm)
+        except REDIS_ERRORS:
+            return None
+        if reservation is not None:
+            return reservation
+        until_next_minute = 60 - time.time() % 60
+        if time.monotonic() + 0.5 > deadline:
+            raise BudgetUnavailable(min(until_next_minute, 60))
+        await asyncio.sleep(min(0.5, until_next_minute))
+
+
+async def release(
+    reservation: Reservation | None, used_tokens: int | None = None
+) -> None:
+    """Free the slot and settle the token estimate against *used_tokens*."""
+    if reservation is None:
+        return
+    try:
+        r = await get_redis()
+        await release_lease(r, _ACTIVE_KEY, reservation.slot)
+        if used_tokens is not None and used_tokens != reservation.tokens:
+            key = f"{_TPM_KEY}:{reservation.minute}"
+            if await r.exists(key):
+                await r.incrby(key, used_tokens - reservation.tokens)
+    except REDIS_ERRORS:
+        pass
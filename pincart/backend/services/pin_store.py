@@ -0,0 +1,93 @@
+"""PinCart AI — Durable pin store (Postgres via Supabase).
+
+Persists ranked /discover results as one row per pin plus keyword links, and
+serves them back as the third cache tier behind the in-process and Redis
+caches. Supabase calls are blocking, so they run in a worker thread.
+"""
+import asyncio
+import hashlib
+from contextlib import suppress
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from db import supabase
+
+
+def image_hash(url: str) -> str:
+    """Stable primary key for a pin: sha256 of its image URL."""
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def _save(keyword: str, pins: list[dict]) -> None:
+    rows = [
+        {
+            "image_hash": image_hash(pin["image"]),
+            "image_url": pin["image"],
+            "title": pin.get("title", ""),
+            "pin_url": pin.get("pin_url", ""),
+            "rank": rank,
+            "demand_score": pin.get("demand_score", 0),
+        }
+        for rank, pin in enumerate(pins)
+        if pin.get("image")
+    ]
+    supabase.rpc("save_keyword_pins", {"p_keyword": keyword, "p_pins": rows}).execute()
+
+
+def _load(keyword: str, max_age: int) -> tuple[float, list[dict]] | None:
+    cutoff = (datetime.now(UTC) - timedelta(seconds=max_age)).isoformat()
+    rows = (
+        supabase.table("pin_keywords")
+        .select("rank, demand_score, scraped_at, pins(image_url, title, pin_url)")
+        .eq("keyword", keyword)
+        .gte("scraped_at", cutoff)
+        .order("rank")
+        .limit(50)
+        .execute()
+    ).data or []
+    if not rows:
+        return None
+
+    pins = [
+        {
+            "image": row["pins"]["image_url"],
+            "title": row["pins"].get("title") or "Untitled Pin",
+            "pin_url": row["pins"].get("pin_url") or "",
+            "saves_text": "",
+            "demand_score": row.get("demand_score", 0),
+        }
+        for row in rows
+        if row.get("pins")
+    ]
+    scraped_at = max(datetime.fromisoformat(row["scraped_at"]) for row in rows)
+    return scraped_at.timestamp(), pins
+
+
+class PinStore:
+    """Durable tier for ``TieredCache``: ``load``/``save`` keyword results."""
+
+    def __init__(self, max_age: int) -> None:
+        self.max_age = max_age
+
+    async def load(self, keyword: str) -> tuple[float, Any] | None:
+        """Return ``(stored_at, pins)`` for *keyword*, or *None*."""
+        try:
+            return await asyncio.to_thread(_load, keyword, self.max_age)
+        except Exception:  # noqa: BLE001 (a store outage reads as a miss)
+            return None
+
+    async def save(self, keyword: str, pins: Any) -> None:
+        with suppress(Exception):
+            await asyncio.to_thread(_save, keyword, pins)
+
+
+def _record_search(user_id: str, keyword: str, results: list[dict]) -> None:
+    supabase.table("searches").insert(
+        {"user_id": user_id, "keyword": keyword, "results_json": results}
+    ).execute()
+
+
+async def record_search(user_id: str, keyword: str, results: list[dict]) -> None:
+    """Store a user's search and its results in ``searches`` (history)."""
+    with suppress(Exception):  # Don't fail the request if DB save fails
+        await asyncio.to_thread(_record_search, user_id, keyword, results)
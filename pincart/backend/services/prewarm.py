@@ -0,0 +1,137 @@
+"""PinCart AI — Discover cache pre-warming.
+
+Picks the hottest keywords from recent traffic and the ``searches`` table
+and re-scrapes them shortly before their cache entry expires, so popular
+keywords never miss. Driven by the Celery beat schedule in
+``celery_worker``.
+"""
+import asyncio
+import os
+import time
+from collections import Counter
+from contextlib import suppress
+from datetime import UTC, datetime, timedelta
+
+from core.cache import REDIS_ERRORS, get_redis
+from core.leases import acquire_lease, release_lease
+from routers.discover import (
+    CACHE_TTL,
+    TRAFFIC_KEY_PREFIX,
+    _cache,
+    _normalize_keyword,
+)
+
+PREWARM_TOP_N: int = int(os.getenv("PREWARM_TOP_N", "50"))
+PREWARM_INTERVAL: int = int(os.getenv("PREWARM_INTERVAL_SECONDS", "900"))
+# Refresh entries that will expire within this many seconds
+PREWARM_LEAD: int = int(os.getenv("PREWARM_LEAD_SECONDS", "1800"))
+PREWARM_CONCURRENCY: int = int(os.getenv("PREWARM_CONCURRENCY", "2"))
+# Longer than any single refresh; a killed worker's slot frees after this
+PREWARM_SLOT_TTL: int = int(os.getenv("PREWARM_SLOT_TTL_SECONDS", "300"))
+PREWARM_LOOKBACK_DAYS: int = 2  # days of Redis traffic to count
+
+_ACTIVE_KEY = "pincart:prewarm:slots"
+_QUEUED_KEY = "pincart:prewarm:queued"
+
+
+async def _traffic_counts() -> Counter:
+    """Search counts per keyword over the last few days of Redis traffic."""
+    counts: Counter = Counter()
+    try:
+        r = await get_redis()
+        today = datetime.now(UTC)
+        for day in range(PREWARM_LOOKBACK_DAYS):
+            stamp = (today - timedelta(days=day)).strftime("%Y%m%d")
+            for keyword, score in await r.zrevrange(
+                f"{TRAFFIC_KEY_PREFIX}:{stamp}", 0, PREWARM_TOP_N * 2, withscores=True
+            ):
+                counts[keyword] += score
+    except REDIS_ERRORS:
+        pass
+    return counts
+
+
+def _searches_counts(days: int = 7) -> Counter:
+    """Search counts per keyword from the ``searches`` table (blocking)."""
+    from db import supabase
+
+    counts: Counter = Counter()
+    since = (datetime.now(UTC) - timedelta(days=days)).isoformat()
+    with suppress(Exception):
+        rows = (
+            supabase.table("searches")
+            .select("keyword")
+            .gte("created_at", since)
+            .limit(5000)
+            .execute()
+        )
+        for row in rows.data or []:
+            if row.get("keyword"):
+                counts[_normalize_keyword(row["keyword"])] += 1
+    return counts
+
+
+async def top_keywords(limit: int = PREWARM_TOP_N) -> list[str]:
+    """Return the *limit* most searched keywords across both sources."""
+    counts = await _traffic_counts()
+    counts.update(await asyncio.to_thread(_searches_counts))
+    return [keyword for keyword, _ in counts.most_common(limit)]
+
+
+async def due_keywords(keywords: list[str], lead: int = PREWARM_LEAD) -> list[str]:
+    """Keywords whose cache entry is missing or expires within *lead* seconds."""
+    due = []
+    for keyword in keywords:
+        entry = await _cache.peek(keyword)
+        if entry is None or time.time() - entry[0] >= CACHE_TTL - lead:
+            due.append(keyword)
+    return due
+
+
+async def plan_refreshes(interval: int = PREWARM_INTERVAL) -> list[tuple[str, int]]:
+    """Pick due keywords and spread them evenly over the next *interval*.
+
+    Returns ``(keyword, countdown_seconds)`` pairs. A keyword already queued
+    by an earlier run is skipped until that run's interval has passed.
+    """
+    due = await due_keywords(await top_keywords())
+    if not due:
+        return []
+    step = interval / len(due)
+    plan: list[tuple[str, int]] = []
+    try:
+        r = await get_redis()
+    except REDIS_ERRORS:
+        r = None
+    for i, keyword in enumerate(due):
+        if r is not None:
+            try:
+                if not await r.set(f"{_QUEUED_KEY}:{keyword}", 1, nx=True, ex=interval):
+                    continue
+            except REDIS_ERRORS:
+                pass
+        plan.append((keyword, int(i * step)))
+    return plan
+
+
+async def acquire_slot(limit: int = PREWARM_CONCURRENCY) -> str | None:
+    """Take one of *limit* global pre-warm slots.
+
+    Returns the token to pass to ``release_slot``, or *None* if all are busy.
+    """
+    try:
+        r = await get_redis()
+        return await acquire_lease(r, _ACTIVE_KEY, limit, PREWARM_SLOT_TTL)
+    except REDIS_ERRORS:
+        return ""  # Without Redis, the per-worker Celery concurrency is the cap
+
+
+async def release_slot(token: str) -> None:
+    """Give back the slot taken with ``acquire_slot``."""
+    if not token:
+        return
+    try:
+        r = await get_redis()
+        await release_lease(r, _ACTIVE_KEY, token)
+    except REDIS_ERRORS:
+        pass
@@ -0,0 +1,147 @@
+"""PinCart AI — Vectorized pricing and margin engine.
+
+Prices whole batches of supplier offers at once as NumPy column operations:
+retail price from tiered markup rules (optionally rounded up to a charm
+price), gross margin, payment/platform fees, per-region shipping, net
+profit and break-even ROAS.
+"""
+import math
+import os
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+
+DEFAULT_MARKUP: float = float(os.getenv("PRICING_DEFAULT_MARKUP", "2.8"))
+# Typical card processing: 2.9 % + $0.30 per order
+PAYMENT_FEE_PCT: float = float(os.getenv("PRICING_PAYMENT_FEE_PCT", "2.9"))
+PAYMENT_FEE_FIXED: float = float(os.getenv("PRICING_PAYMENT_FEE_FIXED", "0.30"))
+
+
+@dataclass
+class PricingRules:
+    """Inputs for ``price_offers``.
+
+    ``markup_tiers`` is a list of ``(max_unit_cost, markup)`` pairs; an offer
+    uses the first tier whose ``max_unit_cost`` it does not exceed, and
+    ``markup`` when it exceeds them all. Percentages are of the retail price.
+    """
+
+    markup: float = DEFAULT_MARKUP
+    markup_tiers: list[tuple[float, float]] = field(default_factory=list)
+    payment_fee_pct: float = PAYMENT_FEE_PCT
+    payment_fee_fixed: float = PAYMENT_FEE_FIXED
+    platform_fee_pct: float = 0.0
+    # Shipping cost per region; regions not listed use default_shipping
+    shipping: dict[str, float] = field(default_factory=dict)
+    default_shipping: float = 0.0
+    # Round retail up to the next price ending in this many cents (e.g. .99)
+    charm_cents: int | None = None
+
+
+DEFAULT_RULES = PricingRules()
+
+
+def _markups(costs: np.ndarray, rules: PricingRules) -> np.ndarray:
+    if not rules.markup_tiers:
+        return np.full(costs.shape, rules.markup)
+    tiers = sorted(rules.markup_tiers)
+    bounds = np.array([bound for bound, _ in tiers], dtype=float)
+    values = np.array([markup for _, markup in tiers] + [rules.markup], dtype=float)
+    return values[np.searchsorted(bounds, costs, side="left")]
+
+
+def _charm(prices: np.ndarray, cents: int) -> np.ndarray:
+    """Round *prices* up to the nearest ``X.cents`` price point."""
+    ending = cents / 100
+    return np.ceil(np.round(prices - ending, 6)) + ending
+
+
+def price_offers(
+    unit_costs: Sequence[float],
+    regions: Sequence[str | None] | None = None,
+    rules: PricingRules = DEFAULT_RULES,
+) -> dict[str, np.ndarray]:
+    """Price a batch of offers; every returned column has one row per offer.
+
+    Columns: ``unit_cost``, ``markup``, ``retail``, ``gross_margin_pct``,
+    ``shipping``, ``fees``, ``net_profit``, ``net_margin_pct`` and
+    ``break_even_roas`` (revenue per ad dollar needed to break even;
+    ``inf`` when an order makes no profit before ads).
+    """
+    costs = np.asarray(unit_costs, dtype=float)
+    markup = _markups(costs, rules)
+    retail = costs * markup
+    if rules.charm_cents is not None:
+        retail = _charm(retail, rules.charm_cents)
+    retail = np.round(retail, 2)
+
+    if regions is None:
+        shipping = np.full(costs.shape, rules.default_shipping)
+    else:
+        shipping = np.array(
+            [
+                rules.shipping.get(region or "", rules.default_shipping)
+                for region in regions
+            ],
+            dtype=float,
+        )
+
+    fees = retail * (rules.payment_fee_pct + rules.platform_fee_pct) / 100
+    fees = fees + rules.payment_fee_fixed
+    net = retail - costs - shipping - fees
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gross_pct = np.where(retail > 0, (retail - costs) / retail * 100, 0.0)
+        net_pct = np.where(retail > 0, net / retail * 100, 0.0)
+        roas = np.where(net > 0, retail / net, np.inf)
+
+    return {
+        "unit_cost": costs,
+        "markup": markup,
+        "retail": retail,
+        "gross_margin_pct": np.round(gross_pct, 1),
+        "shipping": shipping,
+        "fees": np.round(fees, 2),
+        "net_profit": np.round(net, 2),
+        "net_margin_pct": np.round(net_pct, 1),
+        "break_even_roas": np.round(roas, 2),
+    }
+
+
+def to_rows(priced: dict[str, np.ndarray]) -> list[dict[str, float | None]]:
+    """Turn ``price_offers`` columns into JSON-safe per-offer dicts."""
+    columns = {name: values.tolist() for name, values in priced.items()}
+    count = len(columns["unit_cost"])
+    return [
+        {
+            name: None if math.isinf(values[i]) else values[i]
+            for name, values in columns.items()
+        }
+        for i in range(count)
+    ]
+
+
+def apply_pricing(
+    offers: list[dict[str, Any]],
+    rules: PricingRules = DEFAULT_RULES,
+    region: str | None = None,
+) -> list[dict[str, Any]]:
+    """Fill pricing fields on supplier offer dicts in place and return them.
+
+    Sets ``suggested_retail`` and ``estimated_margin_pct`` (gross) plus
+    ``estimated_net_profit`` and ``break_even_roas``. Offers are priced for
+    *region*, or the first of their ``shipping_regions``.
+    """
+    if not offers:
+        return offers
+    regions = [
+        region or (offer.get("shipping_regions") or [None])[0] for offer in offers
+    ]
+    priced = price_offers([offer["unit_cost"] for offer in offers], regions, rules)
+    for offer, row in zip(offers, to_rows(priced)):
+        offer["suggested_retail"] = row["retail"]
+        offer["estimated_margin_pct"] = row["gross_margin_pct"]
+        offer["estimated_net_profit"] = row["net_profit"]
+        offer["break_even_roas"] = row["break_even_roas"]
+    return offers
@@ -0,0 +1,193 @@
+"""PinCart AI — Shopify export writers.
+
+Exports are built once as ``ProductRow`` values and handed to a writer:
+``csv_chunks`` for Shopify's product CSV importer, or ``jsonl_chunks`` for
+a bulk ``productCreate`` mutation (``bulkOperationRunMutation`` with
+``BULK_PRODUCT_CREATE_MUTATION``). Both writers yield text as each product
+is written so responses can stream.
+"""
+import csv
+import io
+import json
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+
+# Full Shopify CSV columns — all must be present
+SHOPIFY_COLUMNS = [
+    "Handle",
+    "Title",
+    "Body (HTML)",
+    "Vendor",
+    "Product Category",
+    "Type",
+    "Tags",
+    "Published",
+    "Option1 Name",
+    "Option1 Value",
+    "Option2 Name",
+    "Option2 Value",
+    "Option3 Name",
+    "Option3 Value",
+    "Variant SKU",
+    "Variant Grams",
+    "Variant Inventory Tracker",
+    "Variant Inventory Qty",
+    "Variant Inventory Policy",
+    "Variant Fulfillment Service",
+    "Variant Price",
+    "Variant Compare At Price",
+    "Variant Requires Shipping",
+    "Variant Taxable",
+    "Variant Barcode",
+    "Image Src",
+    "Image Position",
+    "Image Alt Text",
+    "Gift Card",
+    "SEO Title",
+    "SEO Description",
+    "Google Shopping / Google Product Category",
+    "Google Shopping / Gender",
+    "Google Shopping / Age Group",
+    "Google Shopping / MPN",
+    "Google Shopping / AdWords Grouping",
+    "Google Shopping / AdWords Labels",
+    "Google Shopping / Condition",
+    "Google Shopping / Custom Product",
+    "Google Shopping / Custom Label 0",
+    "Google Shopping / Custom Label 1",
+    "Google Shopping / Custom Label 2",
+    "Google Shopping / Custom Label 3",
+    "Google Shopping / Custom Label 4",
+    "Variant Image",
+    "Variant Weight Unit",
+    "Variant Tax Code",
+    "Cost per item",
+    "Included / United States",
+    "Price / United States",
+    "Compare At Price / United States",
+    "Status",
+]
+
+# The JSONL lines are ProductInput variables for this mutation. Variants on
+# productCreate need Admin API 2024-01 or earlier.
+SHOPIFY_API_VERSION = "2024-01"
+BULK_PRODUCT_CREATE_MUTATION = """mutation call($input: ProductInput!) {
+  productCreate(input: $input) {
+    product { id handle }
+    userErrors { field message }
+  }
+}"""
+
+
+@dataclass
+class ProductRow:
+    """One single-variant product, independent of the export format."""
+
+    handle: str
+    title: str
+    body_html: str
+    vendor: str
+    tags: str
+    price: float
+    sku: str
+    image_url: str = ""
+    seo_title: str = ""
+    seo_description: str = ""
+    cost: float | None = None
+    product_type: str = "Dropship"
+
+
+_COLUMN = {name: i for i, name in enumerate(SHOPIFY_COLUMNS)}
+# Values every row shares; per-product cells are filled in by csv_chunks
+_CSV_TEMPLATE = [""] * len(SHOPIFY_COLUMNS)
+for _name, _value in {
+    "Published": "TRUE",
+    "Option1 Name": "Title",
+    "Option1 Value": "Default Title",
+    "Variant Inventory Policy": "continue",
+    "Variant Fulfillment Service": "manual",
+    "Variant Requires Shipping": "TRUE",
+    "Variant Taxable": "TRUE",
+    "Image Position": "1",
+    "Gift Card": "FALSE",
+    "Status": "active",
+}.items():
+    _CSV_TEMPLATE[_COLUMN[_name]] = _value
+
+
+def _csv_cells(product: ProductRow) -> list:
+    cells = list(_CSV_TEMPLATE)
+    for name, value in (
+        ("Handle", product.handle),
+        ("Title", product.title),
+        ("Body (HTML)", product.body_html),
+        ("Vendor", product.vendor),
+        ("Type", product.product_type),
+        ("Tags", product.tags),
+        ("Variant SKU", product.sku),
+        ("Variant Price", str(product.price)),
+        ("Image Src", product.image_url),
+        ("Image Alt Text", product.title),
+        ("SEO Title", product.seo_title or product.title),
+        ("SEO Description", product.seo_description),
+        ("Cost per item", "" if product.cost is None else str(product.cost)),
+    ):
+        cells[_COLUMN[name]] = value
+    return cells
+
+
+def csv_chunks(products: Iterable[ProductRow]) -> Iterator[str]:
+    """Yield the CSV header, then each product's row as it is written."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(SHOPIFY_COLUMNS)
+    for product in products:
+        writer.writerow(_csv_cells(product))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def product_input(product: ProductRow) -> dict:
+    """The ``ProductInput`` for *product*."""
+    variant: dict = {
+        "price": f"{product.price:.2f}",
+        "sku": product.sku,
+        "inventoryPolicy": "CONTINUE",
+        "taxable": True,
+    }
+    if product.cost is not None:
+        variant["inventoryItem"] = {"cost": f"{product.cost:.2f}", "tracked": False}
+    data: dict = {
+        "handle": product.handle,
+        "title": product.title,
+        "descriptionHtml": product.body_html,
+        "vendor": product.vendor,
+        "productType": product.product_type,
+        "tags": [tag.strip() for tag in product.tags.split(",") if tag.strip()],
+        "status": "ACTIVE",
+        "seo": {
+            "title": product.seo_title or product.title,
+            "description": product.seo_description,
+        },
+        "variants": [variant],
+    }
+    if product.image_url:
+        data["images"] = [{"src": product.image_url, "altText": product.title}]
+    return data
+
+
+def jsonl_chunks(products: Iterable[ProductRow]) -> Iterator[str]:
+    """Yield one ``{"input": ProductInput}`` line per product."""
+    for product in products:
+        line = json.dumps({"input": product_input(product)}, ensure_ascii=False)
+        yield line + "\n"
+
+
+# format -> (writer, media type, file extension)
+FORMATS: dict[str, tuple[Callable[[Iterable[ProductRow]], Iterator[str]], str, str]] = {
+    "csv": (csv_chunks, "text/csv", "csv"),
+    "jsonl": (jsonl_chunks, "application/x-ndjson", "jsonl"),
+}
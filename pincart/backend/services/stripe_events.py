@@ -0,0 +1,400 @@
+"""PinCart AI — Stripe webhook event log and processing.
+
+``/stripe-webhook`` only verifies an event and stores it in
+``stripe_events`` under its Stripe id (``record_event``); redeliveries of
+the same id are dropped there. A Celery worker then applies a customer's
+unprocessed events oldest first (``process_events``) under a Redis lock, so
+two workers never interleave one customer's events. Stripe does not
+guarantee delivery order: an event created before one already applied for
+the customer no longer changes the plan. Users whose rows change are
+dropped from the profile cache (``services.user_profiles``).
+
+Re-apply a time range with::
+
+    python -m services.stripe_events replay --since 2026-10-01 --until 2026-10-02
+"""
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+from collections.abc import Callable
+from contextlib import suppress
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from core.cache import REDIS_ERRORS, get_redis
+from db import supabase
+from services.user_profiles import profiles
+
+STRIPE_LOCK_TTL: int = int(os.getenv("STRIPE_EVENT_LOCK_SECONDS", "60"))
+# Events still unprocessed this long after arriving are re-queued by the sweep
+STRIPE_SWEEP_AGE: int = int(os.getenv("STRIPE_EVENT_SWEEP_AGE_SECONDS", "120"))
+# The sweep gives up on an event after this many failed attempts; replay it
+STRIPE_MAX_ATTEMPTS: int = int(os.getenv("STRIPE_EVENT_MAX_ATTEMPTS", "10"))
+
+_LOCK_KEY = "pincart:stripe:lock"
+_UNPROCESSED = ["pending", "failed"]
+
+
+class CustomerBusy(Exception):
+    """Another worker is applying this customer's events; retry shortly."""
+
+
+class EventFailed(Exception):
+    """An event could not be applied; the customer's later events wait for it."""
+
+    def __init__(self, event_id: str, error: str) -> None:
+        super().__init__(f"Stripe event {event_id} failed: {error}")
+        self.event_id = event_id
+
+
+def customer_of(event: dict[str, Any]) -> str | None:
+    """The Stripe customer id an event belongs to, if any."""
+    obj = event["data"]["object"]
+    if obj.get("object") == "customer":
+        return obj.get("id")
+    customer = obj.get("customer")
+    if isinstance(customer, dict):  # expanded customer object
+        return customer.get("id")
+    return customer or None
+
+
+def _timestamp(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, UTC).isoformat()
+
+
+def record_event(event: dict[str, Any]) -> bool:
+    """Store a verified *event* (blocking); *False* if its id was already stored."""
+    row = {
+        "id": event["id"],
+        "type": event["type"],
+        "customer_id": customer_of(event),
+        "created": _timestamp(event["created"]),
+        "payload": event,
+    }
+    result = (
+        supabase.table("stripe_events")
+        .upsert(row, on_conflict="id", ignore_duplicates=True)
+        .execute()
+    )
+    # Ignored duplicates are left out of the returned representation
+    return bool(result.data)
+
+
+# ---------------------------------------------------------------------------
+# Handlers — return the ids of the users they updated, or *None* when the
+# event changed nothing
+# ---------------------------------------------------------------------------
+
+
+def _plan_for_price(price_id: str | None) -> str:
+    from routers.billing import PLAN_PRICES
+
+    for plan_name, pid in PLAN_PRICES.items():
+        if pid == price_id:
+            return plan_name
+    return "starter"
+
+
+def _user_ids(result: Any) -> list[str]:
+    return [row["id"] for row in result.data or []]
+
+
+def _checkout_completed(data: dict[str, Any], stale: bool) -> list[str] | None:
+    metadata = data.get("metadata") or {}
+    user_id = metadata.get("user_id")
+    if not user_id:
+        return None
+    update = {"stripe_customer_id": data.get("customer")}
+    if not stale:  # Otherwise a newer subscription event already set the plan
+        update["plan_tier"] = metadata.get("plan", "starter")
+    supabase.table("users").update(update).eq("id", user_id).execute()
+    return [user_id]
+
+
+def _subscription_updated(data: dict[str, Any], stale: bool) -> list[str] | None:
+    customer_id = data.get("customer")
+    if stale or not customer_id or data.get("status") != "active":
+        return None
+    # Plan could have changed
+    items = (data.get("items") or {}).get("data") or []
+    plan = _plan_for_price(items[0]["price"]["id"] if items else None)
+    result = (
+        supabase.table("users")
+        .update({"plan_tier": plan})
+        .eq("stripe_customer_id", customer_id)
+        .execute()
+    )
+    return _user_ids(result)
+
+
+def _subscription_deleted(data: dict[str, Any], stale: bool) -> list[str] | None:
+    customer_id = data.get("customer")
+    if stale or not customer_id:
+        return None
+    result = (
+        supabase.table("users")
+        .update({"plan_tier": "free"})
+        .eq("stripe_customer_id", customer_id)
+        .execute()
+    )
+    return _user_ids(result)
+
+
+# invoice.payment_failed: could send an email notification — skipped for MVP
+HANDLERS: dict[str, Callable[[dict[str, Any], bool], list[str] | None]] = {
+    "checkout.session.completed": _checkout_completed,
+    "customer.subscription.updated": _subscription_updated,
+    "customer.subscription.deleted": _subscription_deleted,
+}
+
+
+def apply_event(event: dict[str, Any], stale: bool = False) -> list[str] | None:
+    """Run *event*'s handler; *stale* events are older than one already applied.
+
+    Returns the updated user ids, or *None* if the event changed nothing.
+    """
+    handler = HANDLERS.get(event["type"])
+    if handler is None:
+        return None
+    return handler(event["data"]["object"], stale)
+
+
+# ---------------------------------------------------------------------------
+# Processing
+# ---------------------------------------------------------------------------
+
+
+def _unprocessed(customer_id: str | None, event_id: str | None) -> list[dict]:
+    query = supabase.table("stripe_events").select("id, created, payload, attempts")
+    if customer_id:
+        query = query.eq("customer_id", customer_id)
+    else:
+        query = query.eq("id", event_id)
+    return (
+        query.in_("status", _UNPROCESSED).order("created").order("id").execute().data
+        or []
+    )
+
+
+def _newest_applied(customer_id: str) -> datetime | None:
+    rows = (
+        supabase.table("stripe_events")
+        .select("created")
+        .eq("customer_id", customer_id)
+        .eq("status", "processed")
+        .order("created", desc=True)
+        .limit(1)
+        .execute()
+        .data
+    )
+    return datetime.fromisoformat(rows[0]["created"]) if rows else None
+
+
+def _mark(event_id: str, status: str, attempts: int, error: str | None = None) -> None:
+    update: dict[str, Any] = {"status": status, "attempts": attempts, "error": error}
+    if status != "failed":
+        update["processed_at"] = datetime.now(UTC).isoformat()
+    supabase.table("stripe_events").update(update).eq("id", event_id).execute()
+
+
+def _process(
+    customer_id: str | None, event_id: str | None, changed: set[str]
+) -> dict[str, int]:
+    """Apply the events in order, adding updated user ids to *changed*."""
+    counts = {"processed": 0, "skipped": 0}
+    newest = _newest_applied(customer_id) if customer_id else None
+    for row in _unprocessed(customer_id, event_id):
+        created = datetime.fromisoformat(row["created"])
+        stale = newest is not None and created < newest
+        attempts = row["attempts"] + 1
+        try:
+            users = apply_event(row["payload"], stale)
+        except Exception as exc:
+            with suppress(Exception):
+                _mark(row["id"], "failed", attempts, str(exc))
+            raise EventFailed(row["id"], str(exc)) from exc
+        if users:
+            changed.update(users)
+        status = "skipped" if users is None else "processed"
+        _mark(row["id"], status, attempts)
+        counts[status] += 1
+        if users is not None and (newest is None or created > newest):
+            newest = created
+    return counts
+
+
+async def _lock(customer_id: str) -> str | None:
+    token = uuid.uuid4().hex
+    try:
+        r = await get_redis()
+        taken = await r.set(
+            f"{_LOCK_KEY}:{customer_id}", token, nx=True, ex=STRIPE_LOCK_TTL
+        )
+    except REDIS_ERRORS:
+        return None  # Without Redis, run unlocked
+    if not taken:
+        raise CustomerBusy(customer_id)
+    return token
+
+
+async def _unlock(customer_id: str, token: str) -> None:
+    try:
+        r = await get_redis()
+        key = f"{_LOCK_KEY}:{customer_id}"
+        if await r.get(key) == token:
+            await r.delete(key)
+    except REDIS_ERRORS:
+        pass
+
+
+async def process_events(
+    customer_id: str | None, event_id: str | None = None
+) -> dict[str, int]:
+    """Apply *customer_id*'s unprocessed events, oldest first.
+
+    An event without a customer is processed on its own by *event_id*.
+    Raises ``CustomerBusy`` if another worker holds the customer, and
+    ``EventFailed`` when an event fails; its later events are left pending so
+    they are never applied ahead of it.
+    """
+    token = await _lock(customer_id) if customer_id else None
+    changed: set[str] = set()
+    try:
+        return await asyncio.to_thread(_process, customer_id, event_id, changed)
+    finally:
+        await profiles.invalidate(changed)
+        if token:
+            await _unlock(customer_id, token)
+
+
+def _work(rows: list[dict]) -> list[tuple[str | None, str]]:
+    """One ``(customer_id, event_id)`` per customer, plus each customerless event."""
+    seen = set()
+    work = []
+    for row in rows:
+        customer_id = row.get("customer_id")
+        if customer_id in seen:
+            continue
+        if customer_id:
+            seen.add(customer_id)
+        work.append((customer_id, row["id"]))
+    return work
+
+
+def stuck_events(
+    age: int = STRIPE_SWEEP_AGE, max_attempts: int = STRIPE_MAX_ATTEMPTS
+) -> list[tuple[str | None, str]]:
+    """Work left unprocessed *age* seconds after arriving (blocking)."""
+    before = datetime.now(UTC) - timedelta(seconds=age)
+    rows = (
+        supabase.table("stripe_events")
+        .select("id, customer_id")
+        .in_("status", _UNPROCESSED)
+        .lt("received_at", before.isoformat())
+        .lt("attempts", max_attempts)
+        .order("received_at")
+        .limit(500)
+        .execute()
+        .data
+        or []
+    )
+    return _work(rows)
+
+
+def reset_range(
+    since: datetime,
+    until: datetime,
+    event_type: str | None = None,
+    dry_run: bool = False,
+) -> list[tuple[str | None, str]]:
+    """Mark events created in ``[since, until)`` pending again (blocking).
+
+    Returns the work to process. With *dry_run* nothing is changed.
+    """
+    table = supabase.table("stripe_events")
+    if dry_run:
+        query = table.select("id, customer_id")
+    else:
+        query = table.update({"status": "pending", "error": None})
+    query = query.gte("created", since.isoformat()).lt("created", until.isoformat())
+    if event_type:
+        query = query.eq("type", event_type)
+    return _work(query.execute().data or [])
+
+
+async def replay(
+    work: list[tuple[str | None, str]], wait: float = STRIPE_LOCK_TTL
+) -> dict[str, Any]:
+    """Process *work* here, waiting up to *wait* seconds for busy customers."""
+    from core.cache import close_redis
+
+    totals: dict[str, Any] = {"processed": 0, "skipped": 0, "failed": []}
+    try:
+        for customer_id, event_id in work:
+            deadline = asyncio.get_running_loop().time() + wait
+            while True:
+                try:
+                    counts = await process_events(customer_id, event_id)
+                except CustomerBusy:
+                    if asyncio.get_running_loop().time() >= deadline:
+                        totals["failed"].append(f"{customer_id} (busy)")
+                        break
+                    await asyncio.sleep(1)
+                    continue
+                except EventFailed as exc:
+                    totals["failed"].append(str(exc))
+                    break
+                totals["processed"] += counts["processed"]
+                totals["skipped"] += counts["skipped"]
+                break
+    finally:
+        await close_redis()
+    return totals
+
+
+def _parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=UTC)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m services.stripe_events",
+        description="Stored Stripe webhook events.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    replay_cmd = commands.add_parser(
+        "replay",
+        help="Re-apply events created in a time range, in order per customer",
+    )
+    replay_cmd.add_argument(
+        "--since", required=True, type=_parse_time, help="ISO date/time (UTC)"
+    )
+    replay_cmd.add_argument(
+        "--until",
+        type=_parse_time,
+        default=datetime.now(UTC),
+        help="ISO date/time (UTC), exclusive; default now",
+    )
+    replay_cmd.add_argument("--type", dest="event_type", help="only this event type")
+    replay_cmd.add_argument(
+        "--dry-run", action="store_true", help="list what would be replayed"
+    )
+    args = parser.parse_args(argv)
+
+    work = reset_range(args.since, args.until, args.event_type, args.dry_run)
+    customers = len({customer for customer, _ in work if customer})
+    print(f"{len(work)} event group(s), {customers} customer(s)")
+    if args.dry_run or not work:
+        return 0
+    totals = asyncio.run(replay(work))
+    print(f"processed {totals['processed']}, skipped {totals['skipped']}")
+    for failure in totals["failed"]:
+        print(f"failed: {failure}", file=sys.stderr)
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,357 @@
+"""PinCart AI — Supplier adapter engine.
+
+Each supplier is registered as a ``SupplierAdapter`` with its own deadline,
+retry budget, optional hedge delay and circuit breaker. ``SupplierEngine``
+queries every adapter concurrently and returns whatever has finished within
+an overall latency budget; slower sources keep running in the background so
+their results still land in the cache for the next request.
+
+With ``shared_limits`` each supplier's concurrency cap is held in Redis
+leases, so it applies across every web and Celery worker rather than per
+process; a per-process semaphore still applies on top and is the only cap
+while Redis is down.
+"""
+import asyncio
+import os
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from core.cache import REDIS_ERRORS, get_redis
+from core.leases import acquire_lease, release_lease
+
+# Overall /match-product latency budget and per-source defaults (seconds)
+MATCH_BUDGET: float = float(os.getenv("MATCH_BUDGET_SECONDS", "4"))
+SUPPLIER_DEADLINE: float = float(os.getenv("SUPPLIER_DEADLINE_SECONDS", "6"))
+SUPPLIER_RETRIES: int = int(os.getenv("SUPPLIER_RETRIES", "1"))
+SUPPLIER_HEDGE_AFTER: float = float(os.getenv("SUPPLIER_HEDGE_AFTER_SECONDS", "2"))
+# Max requests in flight per supplier across all workers (with shared limits;
+# otherwise, or while Redis is down, per process)
+SUPPLIER_CONCURRENCY: int = int(os.getenv("SUPPLIER_CONCURRENCY", "4"))
+# Longer than any one request; a killed worker's slot frees after this
+SUPPLIER_SLOT_TTL: float = float(os.getenv("SUPPLIER_SLOT_TTL_SECONDS", "30"))
+SUPPLIER_SLOT_POLL: float = 0.05  # seconds between tries for a shared slot
+BREAKER_THRESHOLD: int = int(os.getenv("SUPPLIER_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET: float = float(os.getenv("SUPPLIER_BREAKER_RESET_SECONDS", "60"))
+
+_SLOTS_KEY = "pincart:supplier:slots"
+
+# fetch(keyword) -> {"status": "ok" | "empty" | "blocked", "results": [...]}
+Fetch = Callable[[str], Awaitable[dict[str, Any]]]
+Load = Callable[[], Awaitable[dict[str, Any]]]
+# lookup(keyword, load) -> outcome; lets the caller put a cache in front
+Lookup = Callable[[str, Load], Awaitable[dict[str, Any]]]
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a source whose breaker is open."""
+
+
+class CircuitBreaker:
+    """Skip a source after *threshold* consecutive failures.
+
+    After *reset_timeout* seconds one probe call is let through (half-open):
+    success closes the breaker, failure opens it again.
+    """
+
+    def __init__(
+        self, threshold: int = BREAKER_THRESHOLD, reset_timeout: float = BREAKER_RESET
+    ) -> None:
+        self.threshold = max(1, threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Return *True* if a call may go out now."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def end_probe(self) -> None:
+        """Forget an unfinished half-open probe, e.g. one that was cancelled."""
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+
+@dataclass
+class SupplierAdapter:
+    """One supplier source and its latency / failure policy."""
+
+    name: str
+    fetch: Fetch
+    deadline: float = SUPPLIER_DEADLINE
+    retries: int = SUPPLIER_RETRIES
+    # Fire a duplicate request if the first is still pending after this long
+    hedge_after: float | None = SUPPLIER_HEDGE_AFTER
+    max_concurrency: int | None = SUPPLIER_CONCURRENCY
+    lookup: Lookup | None = None
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+    stats: dict[str, int] = field(
+        default_factory=lambda: {
+            "calls": 0,
+            "hedges": 0,
+            "retries": 0,
+            "failures": 0,
+            "skipped": 0,
+        }
+    )
+
+
+async def _first_success(tasks: set[asyncio.Task], timeout: float) -> Any:
+    """Result of the first task in *tasks* to succeed within *timeout*."""
+    deadline = time.monotonic() + timeout
+    error: BaseException | None = None
+    pending = set(tasks)
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(
+                pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error or TimeoutError()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class SupplierEngine:
+    """Query registered adapters concurrently within a latency budget."""
+
+    def __init__(
+        self,
+        adapters: list[SupplierAdapter],
+        budget: float = MATCH_BUDGET,
+        shared_limits: bool = False,
+    ) -> None:
+        self.adapters = {adapter.name: adapter for adapter in adapters}
+        self.budget = budget
+        self.shared_limits = shared_limits
+        self._background: set[asyncio.Task] = set()
+        # Semaphores are bound to the loop they were made on (Celery tasks
+        # each run a fresh one), so they are rebuilt when the loop changes
+        self._limits: dict[str, asyncio.Semaphore] = {}
+        self._limits_loop: asyncio.AbstractEventLoop | None = None
+
+    def register(self, adapter: SupplierAdapter) -> None:
+        self.adapters[adapter.name] = adapter
+
+    def _limit(self, adapter: SupplierAdapter) -> asyncio.Semaphore | None:
+        if not adapter.max_concurrency:
+            return None
+        loop = asyncio.get_running_loop()
+        if loop is not self._limits_loop:
+            self._limits, self._limits_loop = {}, loop
+        if adapter.name not in self._limits:
+            self._limits[adapter.name] = asyncio.Semaphore(adapter.max_concurrency)
+        return self._limits[adapter.name]
+
+    async def _try_lease(self, adapter: SupplierAdapter) -> str | None:
+        """Take one of the supplier's shared slots if one is free now.
+
+        Returns the lease token, ``""`` when slots are not shared (or Redis
+        is down, leaving the per-process semaphore as the cap), or *None*
+        if every shared slot is held.
+        """
+        if not self.shared_limits:
+            return ""
+        try:
+            r = await get_redis()
+            return await acquire_lease(
+                r,
+                f"{_SLOTS_KEY}:{adapter.name}",
+                adapter.max_concurrency,
+                SUPPLIER_SLOT_TTL,
+            )
+        except REDIS_ERRORS:
+            return ""
+
+    async def _lease(self, adapter: SupplierAdapter) -> str:
+        """Wait for one of the supplier's shared slots."""
+        while (token := await self._try_lease(adapter)) is None:
+            await asyncio.sleep(SUPPLIER_SLOT_POLL)
+        return token
+
+    async def _release_lease(self, adapter: SupplierAdapter, token: str) -> None:
+        if not token:
+            return
+        try:
+            r = await get_redis()
+            await release_lease(r, f"{_SLOTS_KEY}:{adapter.name}", token)
+        except REDIS_ERRORS:
+            pass
+
+    def _free_slot(
+        self, adapter: SupplierAdapter, limit: asyncio.Semaphore, token: str
+    ) -> None:
+        """Give back a hedge's slot from a done callback."""
+        limit.release()
+        if token:
+            task = asyncio.ensure_future(self._release_lease(adapter, token))
+            self._background.add(task)
+            task.add_done_callback(self._forget)
+
+    async def _attempt(
+        self,
+        adapter: SupplierAdapter,
+        keyword: str,
+        limit: asyncio.Semaphore | None,
+    ) -> dict[str, Any]:
+        """One attempt, hedged with a second request if the first is slow.
+
+        The caller already holds a slot of *limit* (and a shared slot) for
+        the first request, so the deadline and hedge delay only measure the
+        supplier. The hedge goes out only if another slot is free right away.
+        """
+        primary = asyncio.ensure_future(adapter.fetch(keyword))
+        hedge_after = adapter.hedge_after
+        if hedge_after is None or hedge_after >= adapter.deadline:
+            return await _first_success({primary}, adapter.deadline)
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done:
+            return primary.result()
+        remaining = adapter.deadline - hedge_after
+        token = ""
+        if limit is not None:
+            if limit.locked():
+                return await _first_success({primary}, remaining)
+            await limit.acquire()  # Free, so this does not wait
+            token = await self._try_lease(adapter)
+            if token is None:  # Other workers hold every shared slot
+                limit.release()
+                return await _first_success({primary}, remaining)
+        adapter.stats["hedges"] += 1
+        hedge = asyncio.ensure_future(adapter.fetch(keyword))
+        if limit is not None:
+            # A callback also runs if the hedge is cancelled before it starts
+            hedge.add_done_callback(lambda _: self._free_slot(adapter, limit, token))
+        return await _first_success({primary, hedge}, remaining)
+
+    async def _limited_attempt(
+        self, adapter: SupplierAdapter, keyword: str
+    ) -> dict[str, Any]:
+        """Wait for a concurrency slot, then run one attempt."""
+        limit = self._limit(adapter)
+        if limit is None:
+            return await self._attempt(adapter, keyword, None)
+        async with limit:
+            token = await self._lease(adapter)
+            try:
+                return await self._attempt(adapter, keyword, limit)
+            finally:
+                await self._release_lease(adapter, token)
+
+    async def call(self, adapter: SupplierAdapter, keyword: str) -> dict[str, Any]:
+        """Call *adapter* honouring its breaker, deadline and retry budget.
+
+        A ``blocked`` outcome counts as a breaker failure but is returned
+        rather than retried. Time spent waiting for a concurrency slot is
+        not part of the deadline. Raises ``CircuitOpen`` when the source is
+        being skipped, or the last error once retries are exhausted.
+        """
+        error: Exception = CircuitOpen(adapter.name)
+        for attempt in range(adapter.retries + 1):
+            if not adapter.breaker.allow():
+                adapter.stats["skipped"] += 1
+                break
+            adapter.stats["calls"] += 1
+            if attempt:
+                adapter.stats["retries"] += 1
+            try:
+                try:
+                    outcome = await self._limited_attempt(adapter, keyword)
+                except Exception as exc:  # noqa: BLE001 (any failure counts)
+                    adapter.stats["failures"] += 1
+                    adapter.breaker.record_failure()
+                    error = exc
+                    continue
+                if outcome.get("status") == "blocked":
+                    adapter.stats["failures"] += 1
+                    adapter.breaker.record_failure()
+                else:
+                    adapter.breaker.record_success()
+                return outcome
+            finally:
+                # A cancelled probe records nothing; let the next call probe
+                adapter.breaker.end_probe()
+        raise error
+
+    async def _run(self, adapter: SupplierAdapter, keyword: str) -> dict[str, Any]:
+        if adapter.lookup is not None:
+            return await adapter.lookup(keyword, lambda: self.call(adapter, keyword))
+        return await self.call(adapter, keyword)
+
+    async def search(self, keyword: str, budget: float | None = None) -> dict[str, Any]:
+        """Query every adapter; return what finished within the budget.
+
+        Returns ``{"results": [...], "sources": {name: status}}`` where status
+        is the adapter's outcome, ``"timeout"``, ``"open"`` or ``"error"``.
+        Adapters still running when the budget expires are left to finish
+        in the background. *budget* overrides the engine default.
+        """
+        tasks = {
+            name: asyncio.ensure_future(self._run(adapter, keyword))
+            for name, adapter in self.adapters.items()
+        }
+        if tasks:
+            await asyncio.wait(
+                tasks.values(), timeout=self.budget if budget is None else budget
+            )
+
+        results: list[dict] = []
+        sources: dict[str, str] = {}
+        for name, task in tasks.items():
+            if not task.done():
+                sources[name] = "timeout"
+                self._background.add(task)
+                task.add_done_callback(self._forget)
+            elif task.exception() is not None:
+                exc = task.exception()
+                sources[name] = "open" if isinstance(exc, CircuitOpen) else "error"
+            else:
+                outcome = task.result()
+                sources[name] = outcome.get("status", "ok")
+                results.extend(outcome.get("results", []))
+        return {"results": results, "sources": sources}
+
+    def _forget(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled():
+            task.exception()  # Mark retrieved; the caller has moved on
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """Per-adapter counters and breaker state for ``/health``."""
+        return {
+            name: {"breaker": adapter.breaker.state, **adapter.stats}
+            for name, adapter in self.adapters.items()
+        }
@@ -0,0 +1,187 @@
+"""PinCart AI — Incremental supplier search-page parsers.
+
+Parsers are fed the response body chunk by chunk (``aiter_bytes``) and
+report when they have enough products, so the caller can stop reading the
+page early. Extraction uses precompiled patterns with bounded character
+classes, searched within fixed windows after each anchor, so parse time is
+linear in the bytes read and adversarial pages cannot cause backtracking
+blow-ups.
+"""
+import codecs
+import json
+import os
+import re
+from collections.abc import AsyncIterator, Iterable
+
+# Hard cap on bytes read per page, even if the product limit is not reached
+MAX_PAGE_BYTES: int = int(os.getenv("SUPPLIER_MAX_PAGE_BYTES", str(256 * 1024)))
+# Leading text kept for captcha / block-page detection
+HEAD_CHARS = 5000
+
+# AliExpress embeds product JSON in page scripts. The lookaheads only accept
+# a match once the token is complete, so a number split across chunks is
+# never read short.
+_ALI_ID = re.compile(r'"productId":"?(\d{1,20})(?=\D)')
+_ALI_TITLE = re.compile(r'"title":"((?:[^"\\]|\\.){0,400})"')
+_ALI_PRICE = re.compile(r'"salePrice":"?(\d{1,7}(?:\.\d{1,2})?)(?=[^\d.])')
+
+# CJ search results render as HTML cards: a title attribute, then a price
+_CJ_TITLE = re.compile(r'title="([^"<>]{10,80})"')
+_CJ_PRICE = re.compile(r"\$(\d{1,7}(?:\.\d{1,2})?)(?=[^\d.])")
+
+# Returned by ``_field`` when the match may still arrive in a later chunk
+_NEED_MORE = object()
+
+
+def _unescape(value: str) -> str:
+    """Decode JSON string escapes (``\\"``, ``\\u0026``) in an extracted title."""
+    try:
+        return json.loads(f'"{value}"')
+    except ValueError:
+        return value
+
+
+class StreamParser:
+    """Base class: buffers decoded text and scans it as chunks arrive.
+
+    Subclasses implement ``_scan`` to consume complete products from the
+    buffer and return how far they got.
+    """
+
+    # Max chars between an anchor and the fields that belong to it
+    window = 2000
+
+    def __init__(self, limit: int, max_bytes: int = MAX_PAGE_BYTES) -> None:
+        self.limit = limit
+        self.max_bytes = max_bytes
+        self.products: list[dict[str, str]] = []
+        self.bytes_read = 0
+        self.head = ""
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._buf = ""
+
+    @property
+    def done(self) -> bool:
+        return len(self.products) >= self.limit or self.bytes_read >= self.max_bytes
+
+    def feed(self, chunk: bytes, final: bool = False) -> bool:
+        """Consume *chunk*; return *True* once no more input is needed."""
+        self.bytes_read += len(chunk)
+        text = self._decoder.decode(chunk, final=final)
+        if len(self.head) < HEAD_CHARS:
+            self.head += text[: HEAD_CHARS - len(self.head)]
+        self._buf += text
+        final = final or self.bytes_read >= self.max_bytes
+        consumed = self._scan(self._buf, final)
+        self._buf = self._buf[consumed:]
+        return self.done
+
+    def close(self) -> list[dict[str, str]]:
+        """Flush the decoder, scan what is left and return the products."""
+        if not self.done:
+            self.feed(b"", final=True)
+        return self.products[: self.limit]
+
+    def _field(self, pattern: "re.Pattern[str]", buf: str, pos: int, final: bool):
+        """Match *pattern* within ``window`` chars of *pos*.
+
+        Returns the match, *None* if it is not there, or ``_NEED_MORE`` if
+        the window runs past the buffer and more input could still supply it.
+        """
+        end = pos + self.window
+        match = pattern.search(buf, pos, end)
+        if match is None and end > len(buf) and not final:
+            return _NEED_MORE
+        return match
+
+    def _scan(self, buf: str, final: bool) -> int:
+        raise NotImplementedError
+
+
+class AliExpressParser(StreamParser):
+    """Extract ``productId`` / ``title`` / ``salePrice`` triples."""
+
+    def _scan(self, buf: str, final: bool) -> int:
+        pos = 0
+        while len(self.products) < self.limit:
+            anchor = _ALI_ID.search(buf, pos)
+            if anchor is None:
+                # Keep a short tail in case an anchor straddles the chunk edge
+                return max(pos, len(buf) - 64)
+            title = self._field(_ALI_TITLE, buf, anchor.end(), final)
+            if title is _NEED_MORE:
+                return anchor.start()
+            if title is None:
+                pos = anchor.end()
+                continue
+            price = self._field(_ALI_PRICE, buf, title.end(), final)
+            if price is _NEED_MORE:
+                return anchor.start()
+            if price is None:
+                pos = anchor.end()
+                continue
+            self.products.append(
+                {
+                    "id": anchor.group(1),
+                    "title": _unescape(title.group(1)),
+                    "price": price.group(1),
+                }
+            )
+            pos = price.end()
+        return pos
+
+
+class CJParser(StreamParser):
+    """Pair each product title with the first price that follows it."""
+
+    window = 1500
+
+    def _scan(self, buf: str, final: bool) -> int:
+        pos = 0
+        while len(self.products) < self.limit:
+            anchor = _CJ_TITLE.search(buf, pos)
+            if anchor is None:
+                return max(pos, len(buf) - 96)
+            price = self._field(_CJ_PRICE, buf, anchor.end(), final)
+            if price is _NEED_MORE:
+                return anchor.start()
+            if price is None:
+                pos = anchor.end()
+                continue
+            # A later title before the price means this one had no price
+            later = _CJ_TITLE.search(buf, anchor.end(), price.start())
+            if later is not None:
+                pos = later.start()
+                continue
+            self.products.append({"title": anchor.group(1), "price": price.group(1)})
+            pos = price.end()
+        return pos
+
+
+async def parse_stream(
+    parser: StreamParser, chunks: AsyncIterator[bytes]
+) -> list[dict[str, str]]:
+    """Feed *chunks* into *parser* until it is satisfied or input ends."""
+    async for chunk in chunks:
+        if parser.feed(chunk):
+            break
+    return parser.close()
+
+
+def parse_chunks(parser: StreamParser, chunks: Iterable[bytes]) -> list[dict[str, str]]:
+    """Synchronous ``parse_stream`` for saved pages and benchmarks."""
+    for chunk in chunks:
+        if parser.feed(chunk):
+            break
+    return parser.close()
+
+
+def iter_chunks(data: bytes, size: int | None = 16 * 1024) -> Iterable[bytes]:
+    """Split *data* into network-sized chunks."""
+    size = size or len(data) or 1
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+# Corpus / benchmark lookup by supplier name
+PARSERS = {"aliexpress": AliExpressParser, "cj": CJParser}
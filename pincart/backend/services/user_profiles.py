@@ -0,0 +1,148 @@
+"""PinCart AI — Cached user billing profile.
+
+Billing and metered endpoints read a user's ``plan_tier``,
+``stripe_customer_id`` and ``usage_reset_at`` through ``ProfileCache``: a
+short-TTL in-process LRU in front of Redis, loaded from ``users`` on a miss.
+Whatever changes those columns (checkout, Stripe webhook handlers) calls
+``invalidate``, which clears Redis and this process's copy. Other
+processes may serve their in-process copy for up to ``PROFILE_L1_TTL``
+seconds afterwards. Invalidation leaves a short-lived marker in Redis so a
+load that read the row before the change does not cache the old values.
+"""
+import asyncio
+import json
+import os
+import time
+from collections.abc import Iterable
+from typing import Any
+
+from core.cache import REDIS_ERRORS, _cache_key, cache_get, cache_set, get_redis
+from core.singleflight import SingleFlight
+from core.tiered_cache import LRUCache
+
+PROFILE_L1_TTL: int = int(os.getenv("PROFILE_L1_TTL_SECONDS", "30"))
+PROFILE_CACHE_TTL: int = int(os.getenv("PROFILE_CACHE_TTL_SECONDS", "3600"))
+PROFILE_L1_SIZE: int = int(os.getenv("PROFILE_L1_SIZE", "2048"))
+PROFILE_COLUMNS = ("plan_tier", "stripe_customer_id", "usage_reset_at")
+# Longer than any profile load, so an in-flight load always sees the marker
+INVALIDATION_TTL: int = 60
+
+_PREFIX = "profile"
+
+# Write ARGV[1] unless KEYS[1] holds an invalidation marker at or after ARGV[3],
+# checked and written in one step so an invalidation can't land in between
+_SET_UNLESS_INVALIDATED = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    local ok, value = pcall(cjson.decode, current)
+    if ok and type(value) == 'table' and value.invalidated_at
+            and tonumber(value.invalidated_at) >= tonumber(ARGV[3]) then
+        return 0
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+
+
+def load_profile(user_id: str) -> dict[str, Any] | None:
+    """Read *user_id*'s profile columns from ``users`` (blocking; *None* if unknown)."""
+    from db import supabase
+
+    rows = (
+        supabase.table("users")
+        .select(", ".join(PROFILE_COLUMNS))
+        .eq("id", user_id)
+        .limit(1)
+        .execute()
+        .data
+        or []
+    )
+    if not rows:
+        return None
+    return {column: rows[0].get(column) for column in PROFILE_COLUMNS}
+
+
+async def _cache_unless_invalidated(
+    user_id: str, profile: dict[str, Any], ttl: int, since: float
+) -> bool:
+    """Cache *profile* in Redis unless it was invalidated at or after *since*.
+
+    Returns *False* only when an invalidation won; without Redis the
+    profile counts as cached.
+    """
+    try:
+        r = await get_redis()
+        stored = await r.eval(
+            _SET_UNLESS_INVALIDATED,
+            1,
+            _cache_key(_PREFIX, user_id),
+            json.dumps(profile),
+            ttl,
+            since,
+        )
+    except REDIS_ERRORS:
+        return True
+    return bool(stored)
+
+
+class ProfileCache:
+    """In-process LRU (L1, *l1_ttl* seconds) in front of Redis (*ttl* seconds)."""
+
+    def __init__(
+        self,
+        l1_ttl: int = PROFILE_L1_TTL,
+        ttl: int = PROFILE_CACHE_TTL,
+        maxsize: int = PROFILE_L1_SIZE,
+    ) -> None:
+        self.l1_ttl = l1_ttl
+        self.ttl = ttl
+        self.l1 = LRUCache(maxsize)
+        self._flight = SingleFlight()
+        self.stats = {"l1_hits": 0, "l2_hits": 0, "loads": 0, "invalidations": 0}
+
+    async def get(self, user_id: str | None) -> dict[str, Any] | None:
+        """*user_id*'s profile, or *None* for anonymous or unknown users.
+
+        Raises if the profile has to be loaded and the database fails.
+        """
+        if not user_id:
+            return None
+        entry = self.l1.get(user_id)
+        if entry is not None and time.time() - entry[0] < self.l1_ttl:
+            self.stats["l1_hits"] += 1
+            return entry[1]
+
+        cached = await cache_get(_PREFIX, user_id)
+        if isinstance(cached, dict) and "invalidated_at" not in cached:
+            self.stats["l2_hits"] += 1
+            self.l1.set(user_id, (time.time(), cached))
+            return cached
+        return await self._flight.do(user_id, lambda: self._load(user_id))
+
+    async def _load(self, user_id: str) -> dict[str, Any] | None:
+        self.stats["loads"] += 1
+        started = time.time()
+        profile = await asyncio.to_thread(load_profile, user_id)
+        # Skipped if an invalidation landed after the read began
+        if profile is not None and await _cache_unless_invalidated(
+            user_id, profile, self.ttl, started
+        ):
+            self.l1.set(user_id, (time.time(), profile))
+        return profile
+
+    async def invalidate(self, user_ids: Iterable[str]) -> None:
+        """Drop cached profiles after their ``users`` row changed."""
+        for user_id in user_ids:
+            self.stats["invalidations"] += 1
+            self.l1.delete(user_id)
+            await cache_set(
+                _PREFIX, user_id, {"invalidated_at": time.time()}, ttl=INVALIDATION_TTL
+            )
+
+    def snapshot(self) -> dict:
+        """Return counters for ``/health``."""
+        return {"l1_size": len(self.l1), "l1_max": self.l1.maxsize, **self.stats}
+
+
+profiles = ProfileCache()
@@ -0,0 +1,101 @@
+"""Tests for the warm Chromium browser pool (fake browsers, no Chromium)."""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+from core.browser_pool import BrowserPool
+
+
+class FakeContext:
+    def __init__(self) -> None:
+        self.closed = False
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self) -> None:
+        self.connected = True
+        self.contexts: list[FakeContext] = []
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    async def new_context(self, **kwargs) -> FakeContext:
+        ctx = FakeContext()
+        self.contexts.append(ctx)
+        return ctx
+
+    async def close(self) -> None:
+        self.connected = False
+
+
+def _pool(**kwargs) -> tuple[BrowserPool, list[FakeBrowser]]:
+    launched: list[FakeBrowser] = []
+
+    async def launcher() -> FakeBrowser:
+        b = FakeBrowser()
+        launched.append(b)
+        return b
+
+    return BrowserPool(launcher=launcher, **kwargs), launched
+
+
+@pytest.mark.asyncio
+async def test_contexts_are_closed_and_browser_reused():
+    pool, launched = _pool(size=1, max_pages=10)
+    for _ in range(3):
+        async with pool.context() as ctx:
+            assert not ctx.closed
+        assert ctx.closed
+    assert len(launched) == 1
+    assert pool.stats()["contexts_served"] == 3
+
+
+@pytest.mark.asyncio
+async def test_browser_recycled_after_max_pages():
+    pool, launched = _pool(size=1, max_pages=2)
+    for _ in range(5):
+        async with pool.context():
+            pass
+    assert len(launched) == 3
+    assert pool.stats()["recycles"] == 2
+
+
+@pytest.mark.asyncio
+async def test_crashed_browser_is_relaunched():
+    pool, launched = _pool(size=1)
+    async with pool.context():
+        launched[0].connected = False
+    async with pool.context():
+        pass
+    assert len(launched) == 2
+    assert pool.stats()["crashes"] == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_capped():
+    pool, _ = _pool(size=1, max_contexts=2)
+    peak = 0
+
+    async def worker() -> None:
+        nonlocal peak
+        async with pool.context():
+            peak = max(peak, pool.stats()["in_use"])
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(worker() for _ in range(6)))
+    assert peak == 2
+    assert pool.stats()["in_use"] == 0
+
+
+def test_health_reports_pool_stats(client):
+    """/health exposes browser pool counters once the app has started."""
+    resp = client.get("/health")
+    assert resp.status_code == 200
+    assert resp.json()["browser_pool"]["size"] >= 1
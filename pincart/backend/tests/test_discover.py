@@ -51,3 +51,168 @@ def test_discover_no_results(client):
         mock_scrape.return_value = []
         resp = client.get("/discover", params={"keyword": "xyznonexistent"})
     assert resp.status_code == 404
+
+
+def _fake_browser_context(page):
+    """Patch target for ``browser_context`` that yields a context with *page*."""
+    from contextlib import asynccontextmanager
+    from unittest.mock import MagicMock
+
+    context = MagicMock()
+    context.route = AsyncMock()
+    context.new_page = AsyncMock(return_value=page)
+
+    @asynccontextmanager
+    async def fake(**kwargs):
+        yield context
+
+    return fake, context
+
+
+def test_fast_scrape_waits_on_dom_and_blocks_resources():
+    """Fast mode routes heavy resources away and never uses fixed sleeps."""
+    import asyncio
+    from unittest.mock import MagicMock
+
+    from routers import discover
+
+    page = MagicMock()
+    page.goto = AsyncMock()
+    page.wait_for_function = AsyncMock()
+    page.wait_for_timeout = AsyncMock()
+    page.evaluate = AsyncMock(side_effect=[20, None, [dict(p) for p in MOCK_PINS]])
+    fake, context = _fake_browser_context(page)
+
+    with patch("routers.discover.browser_context", fake):
+        pins = asyncio.run(discover._fetch_pins("test", mode="fast"))
+
+    assert [p["image"] for p in pins] == [p["image"] for p in MOCK_PINS]
+    context.route.assert_awaited_once()
+    page.wait_for_timeout.assert_not_called()
+    assert page.wait_for_function.await_count == 2
+    stats = discover.scrape_stats()
+    assert {"goto", "ready", "scroll", "extract", "total"} <= set(stats["fast"])
+
+
+def test_stream_extracts_only_pins_each_scroll_adds():
+    """Every streamed round asks the page for unseen pin nodes only, uncapped."""
+    import asyncio
+    from unittest.mock import MagicMock
+
+    from routers import discover
+
+    page = MagicMock()
+    page.goto = AsyncMock()
+    page.wait_for_function = AsyncMock()
+    first, second = [dict(MOCK_PINS[0])], [dict(MOCK_PINS[1])]
+    page.evaluate = AsyncMock(side_effect=[first, 60, None, second])
+    fake, _ = _fake_browser_context(page)
+
+    async def collect():
+        return [pins async for pins in discover._stream_pins("test", scrolls=1)]
+
+    with patch("routers.discover.browser_context", fake):
+        assert asyncio.run(collect()) == [first, second]
+    calls = page.evaluate.await_args_list
+    extracts = [c for c in calls if c.args[0] == discover._EXTRACT_PINS_JS]
+    assert [c.args[1:] for c in extracts] == [(True,), (True,)]
+
+
+def test_discover_job_returns_cached_result(client):
+    """POST /discover/jobs answers from the cache without queueing a task."""
+    import time
+
+    from routers import discover
+
+    with patch.object(
+        discover._cache, "peek", AsyncMock(return_value=(time.time(), MOCK_PINS))
+    ), patch("routers.discover.scrape_pinterest_task") as task:
+        resp = client.post("/discover/jobs", json={"keyword": "test"})
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "complete"
+    assert resp.json()["result"]["count"] == 2
+    task.delay.assert_not_called()
+
+
+def test_discover_job_queues_on_miss(client):
+    """A cache miss enqueues the Celery task and returns its job id."""
+    from unittest.mock import MagicMock
+
+    from routers import discover
+
+    with patch.object(discover._cache, "peek", AsyncMock(return_value=None)), patch(
+        "routers.discover.scrape_pinterest_task"
+    ) as task:
+        task.delay.return_value = MagicMock(id="job-123")
+        resp = client.post(
+            "/discover/jobs", json={"keyword": "test", "notify_email": "a@b.co"}
+        )
+    assert resp.status_code == 202
+    assert resp.json() == {"job_id": "job-123", "status": "queued"}
+    task.delay.assert_called_once_with("test", "a@b.co")
+
+
+def test_discover_job_events_stream_until_complete(client):
+    """The SSE endpoint emits status frames and closes once the job is done."""
+    states = iter(
+        [
+            {"job_id": "j", "state": "STARTED", "status": "running"},
+            {"job_id": "j", "state": "SUCCESS", "status": "complete", "result": {}},
+        ]
+    )
+    with patch("routers.discover.job_status", lambda job_id: next(states)), patch(
+        "routers.discover.JOB_POLL_INTERVAL", 0
+    ):
+        resp = client.get("/discover/jobs/j/events")
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    assert resp.text.count("event: status") == 2
+    assert '"status": "complete"' in resp.text
+
+
+def test_discover_stream_dedupes_batches_and_ends_with_summary(client):
+    """GET /discover/stream sends only unseen pins, then a ranked summary."""
+    import json
+
+    from routers import discover
+
+    async def fake_stream(keyword, scrolls):
+        yield [dict(MOCK_PINS[0])]
+        yield [dict(MOCK_PINS[0]), dict(MOCK_PINS[1])]
+
+    with patch.object(discover._cache, "peek", AsyncMock(return_value=None)), patch.object(
+        discover._cache, "set", AsyncMock()
+    ) as cache_set, patch("routers.discover._stream_pins", fake_stream):
+        resp = client.get("/discover/stream", params={"keyword": "test"})
+
+    frames = [f for f in resp.text.split("\n\n") if f]
+    events = [(f.split("\n")[0][7:], json.loads(f.split("\n")[1][6:])) for f in frames]
+    assert [e for e, _ in events] == ["batch", "batch", "summary"]
+    assert len(events[1][1]["products"]) == 1
+    assert events[2][1]["count"] == 2
+    cache_set.assert_awaited_once()
+
+
+def test_discover_batch_serves_hits_and_merges_shared_pins(client):
+    """POST /discover/batch scrapes only misses and dedupes pins across keywords."""
+    import time
+
+    from routers import discover
+
+    async def peek(key):
+        return (time.time(), [dict(MOCK_PINS[0])]) if key == "lamps" else None
+
+    scrape = AsyncMock(return_value={"Desk  Lamps": [dict(p) for p in MOCK_PINS]})
+    with patch.object(discover._cache, "peek", peek), patch(
+        "routers.discover._scrape_batch", scrape
+    ):
+        resp = client.post(
+            "/discover/batch", json={"keywords": ["lamps", "Desk  Lamps", "desk lamps"]}
+        )
+    assert resp.status_code == 200
+    data = resp.json()
+    scrape.assert_awaited_once_with(["Desk  Lamps"])
+    assert data["results"]["lamps"]["cached"] is True
+    assert data["unique_count"] == 2
+    shared = data["unique_products"][0]
+    assert shared["image"] == MOCK_PINS[0]["image"]
+    assert len(shared["keywords"]) == 2
@@ -0,0 +1,301 @@
+"""Tests for Shopify CSV exports."""
+import csv
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from routers import export
+from services.export_artifacts import FilesystemArtifactStore
+from services.shopify_export import (
+    SHOPIFY_COLUMNS,
+    ProductRow,
+    csv_chunks,
+    jsonl_chunks,
+)
+
+
+def _generation(i, name=None, price=5.0):
+    return {
+        "id": f"g{i:04d}",
+        "product_name": name or f"Product {i}",
+        "supplier_data": {"price": price},
+        "generated_copy": {
+            "seo_title": f"Product {i} | Shop",
+            "description": "<p>Great.</p>",
+            "bullets": ["Fast"],
+            "faq": [{"q": "Why?", "a": "Because"}],
+            "meta_description": "Meta",
+        },
+    }
+
+
+class FakeTable:
+    """Enough of the Supabase query builder for ``generations`` and ``exports``."""
+
+    def __init__(self, rows=()):
+        self.tables = {"generations": list(rows), "exports": []}
+        self.queries = []
+        self.inserted = []
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+
+class FakeQuery:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.rows = list(db.tables[name])
+        self.payload = None
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.rows = [r for r in self.rows if r.get(column, value) == value]
+        return self
+
+    def gte(self, column, value):
+        return self
+
+    def order(self, column, desc=False):
+        return self
+
+    def in_(self, column, values):
+        self.rows = [r for r in self.rows if r[column] in values]
+        return self
+
+    def range(self, start, end):
+        self.rows = self.rows[start : end + 1]
+        return self
+
+    def limit(self, count):
+        self.rows = self.rows[:count]
+        return self
+
+    def insert(self, payload):
+        self.payload = payload
+        return self
+
+    def execute(self):
+        if self.payload is not None:
+            self.db.tables[self.name].append(self.payload)
+            self.db.inserted.append((self.name, self.payload))
+            return SimpleNamespace(data=[self.payload])
+        self.db.queries.append(len(self.rows))
+        return SimpleNamespace(data=self.rows)
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path):
+    store = FilesystemArtifactStore(str(tmp_path), "/exports/artifacts")
+    with patch("routers.export.get_artifact_store", return_value=store):
+        yield store
+
+
+def _read(resp):
+    return list(csv.DictReader(io.StringIO(resp.text)))
+
+
+def test_single_export_has_every_column(client):
+    resp = client.post(
+        "/export", json={"product_name": "Sunset Lamp", "bullets": ["Warm"]}
+    )
+    assert resp.status_code == 200
+    assert 'filename="pincart-sunset-lamp.csv"' in resp.headers["content-disposition"]
+    rows = _read(resp)
+    assert list(rows[0]) == SHOPIFY_COLUMNS
+    assert rows[0]["Handle"] == "sunset-lamp"
+    assert "<li>Warm</li>" in rows[0]["Body (HTML)"]
+
+
+def test_repeat_single_export_is_served_from_stored_file(client, store):
+    db = FakeTable()
+    body = {"product_name": "Sunset Lamp", "price": 24.99, "user_id": "u1"}
+    with patch.object(export, "supabase", db):
+        first = client.post("/export", json=body)
+        second = client.post("/export", json=body)
+    # Same stored bytes, SKU included
+    assert second.content == first.content
+    assert second.headers["accept-ranges"] == "bytes"
+    assert len(db.inserted) == 2
+    assert db.inserted[0][1]["csv_url"] == db.inserted[1][1]["csv_url"]
+    assert db.inserted[0][1]["csv_url"].startswith("/exports/artifacts/")
+
+
+def test_bulk_export_pages_rows_and_records_export(client):
+    db = FakeTable([_generation(i) for i in range(5)] + [_generation(9, "Product 1")])
+    with patch.object(export, "supabase", db), patch.object(
+        export, "EXPORT_PAGE_SIZE", 2
+    ):
+        resp = client.post("/export/bulk", json={"user_id": "u1", "since_days": 7})
+    assert resp.status_code == 200
+    rows = _read(resp)
+    # The later duplicate of "Product 1" is dropped; newest-first order is kept
+    assert [r["Handle"] for r in rows] == [f"product-{i}" for i in range(5)]
+    assert rows[0]["Variant Price"] == "14.0"
+    assert rows[0]["Cost per item"] == "5.0"
+    assert rows[0]["SEO Description"] == "Meta"
+    # Ids are listed page by page, then the rows are fetched by id
+    assert db.queries == [2, 2, 2, 0, 6]
+    [(table, record)] = db.inserted
+    assert table == "exports"
+    assert record["product_count"] == 5
+    assert record["filters"] == {"generation_ids": None, "since_days": 7}
+
+    # Same selection again: served from the stored file, with Range support
+    url = record["csv_url"]
+    with patch.object(export, "supabase", db), patch.object(
+        export, "EXPORT_PAGE_SIZE", 2
+    ):
+        again = client.post("/export/bulk", json={"user_id": "u1", "since_days": 7})
+    assert again.content == resp.content
+    # Id listing plus the product-count lookup; no generation rows are read
+    assert db.queries[5:] == [2, 2, 2, 0, 1]
+    assert db.inserted[1][1]["product_count"] == 5
+    assert db.inserted[1][1]["csv_url"] == url
+
+    part = client.get(url, headers={"Range": "bytes=0-5"})
+    assert part.status_code == 206
+    assert part.content == resp.content[:6]
+
+
+def test_new_generation_changes_the_bulk_artifact(client):
+    db = FakeTable([_generation(i) for i in range(2)])
+    with patch.object(export, "supabase", db):
+        client.post("/export/bulk", json={"user_id": "u1", "since_days": 7})
+        db.tables["generations"].insert(0, _generation(7))
+        resp = client.post("/export/bulk", json={"user_id": "u1", "since_days": 7})
+    assert _read(resp)[0]["Handle"] == "product-7"
+    urls = [record["csv_url"] for _, record in db.inserted]
+    assert urls[0] != urls[1]
+
+
+def test_bulk_export_by_ids_in_chunks(client):
+    db = FakeTable([_generation(i, price=0) for i in range(250)])
+    ids = [f"g{i:04d}" for i in range(0, 250, 2)]
+    with patch.object(export, "supabase", db):
+        resp = client.post(
+            "/export/bulk",
+            json={"user_id": "u1", "generation_ids": ids, "default_price": 19.0},
+        )
+    rows = _read(resp)
+    assert len(rows) == 125
+    assert {r["Variant Price"] for r in rows} == {"19.0"}
+    assert db.queries == [100, 25, 100, 25]
+
+
+def test_bulk_export_requires_a_filter_and_database(client):
+    assert client.post("/export/bulk", json={"user_id": "u1"}).status_code == 400
+
+    class Down:
+        def table(self, name):
+            raise ConnectionError("supabase down")
+
+    with patch.object(export, "supabase", Down()):
+        resp = client.post("/export/bulk", json={"user_id": "u1", "since_days": 7})
+    assert resp.status_code == 503
+
+
+def test_history_lists_exports_and_unknown_artifacts_404(client):
+    db = FakeTable()
+    db.tables["exports"].append(
+        {"user_id": "u1", "csv_url": "/exports/artifacts/x.csv"}
+    )
+    with patch.object(export, "supabase", db):
+        history = client.get("/exports", params={"user_id": "u1"}).json()
+    assert history["exports"][0]["csv_url"] == "/exports/artifacts/x.csv"
+    assert client.get("/exports/artifacts/" + "a" * 64 + ".csv").status_code == 404
+    assert client.get("/exports/artifacts/..%2Fsecret.csv").status_code == 404
+
+
+def _product(**overrides):
+    fields = {
+        "handle": "sunset-lamp",
+        "title": "Sunset Lamp",
+        "body_html": "<p>Glow</p>",
+        "vendor": "My Store",
+        "tags": "lamps, decor",
+        "price": 24.0,
+        "sku": "PCA-1",
+        "cost": 6.5,
+    }
+    return ProductRow(**{**fields, **overrides})
+
+
+def test_writers_share_one_product_model():
+    products = [_product(), _product(handle="cat-bed", title="Cat Bed", cost=None)]
+    rows = list(csv.DictReader(io.StringIO("".join(csv_chunks(products)))))
+    assert [r["Handle"] for r in rows] == ["sunset-lamp", "cat-bed"]
+    assert rows[0]["Variant Price"] == "24.0" and rows[0]["Cost per item"] == "6.5"
+    assert rows[1]["Option1 Value"] == "Default Title" and rows[1]["Status"] == "active"
+
+    lines = [json.loads(line) for line in jsonl_chunks(products)]
+    product = lines[0]["input"]
+    assert product["handle"] == "sunset-lamp"
+    assert product["tags"] == ["lamps", "decor"]
+    assert product["variants"] == [
+        {
+            "price": "24.00",
+            "sku": "PCA-1",
+            "inventoryPolicy": "CONTINUE",
+            "taxable": True,
+            "inventoryItem": {"cost": "6.50", "tracked": False},
+        }
+    ]
+    assert "inventoryItem" not in lines[1]["input"]["variants"][0]
+
+
+def test_bulk_export_as_jsonl(client):
+    db = FakeTable([_generation(i) for i in range(3)])
+    with patch.object(export, "supabase", db):
+        resp = client.post(
+            "/export/bulk", json={"user_id": "u1", "since_days": 7, "format": "jsonl"}
+        )
+    assert resp.headers["content-type"] == "application/x-ndjson"
+    assert resp.headers["content-disposition"].endswith('.jsonl"')
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert [line["input"]["handle"] for line in lines] == [
+        "product-0",
+        "product-1",
+        "product-2",
+    ]
+    assert lines[0]["input"]["seo"] == {
+        "title": "Product 0 | Shop",
+        "description": "Meta",
+    }
+    assert db.inserted[0][1]["csv_url"].endswith(".jsonl")
+
+
+def test_bulk_export_of_an_empty_selection_is_404(client):
+    db = FakeTable([_generation(i) for i in range(5)])
+    with patch.object(export, "supabase", db):
+        resp = client.post(
+            "/export/bulk", json={"user_id": "u1", "generation_ids": ["nope"]}
+        )
+    assert resp.status_code == 404
+    assert db.inserted == []
+    # Only the id lookup ran; the user's history was never paged
+    assert db.queries == [0]
+    assert list(export._generation_pages("u1", [])) == []
+
+
+def test_artifact_file_is_opened_on_first_write(store, tmp_path):
+    name = "a" * 64 + ".csv"
+    unused = store.writer(name)
+    unused.abort()
+    assert [p for p in tmp_path.rglob("*") if p.is_file()] == []
+
+    pending = store.writer(name)
+    pending.write(b"id\n")
+    pending.commit()
+    with open(store.path(name), "rb") as f:
+        assert f.read() == b"id\n"
@@ -0,0 +1,333 @@
+"""Tests for /generate output caching."""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from routers import generate
+
+PAGE = {"seo_title": "Sunset Lamp", "bullets": ["Warm glow"]}
+USAGE = {
+    "model": "gpt-4o",
+    "prompt_tokens": 300,
+    "completion_tokens": 700,
+    "total_tokens": 1000,
+}
+
+
+def _served(page, model="gpt-4o"):
+    return page, {**USAGE, "model": model}
+
+
+@pytest.fixture(autouse=True)
+def no_plan_lookup():
+    """Treat every user as a paying customer without touching Supabase."""
+    with patch("routers.generate._plan_tier", return_value="pro"):
+        yield
+
+
+@pytest.fixture()
+def fake_cache():
+    """Back the generate cache with a plain dict and skip the Redis lease."""
+    store: dict = {}
+
+    async def fake_get(prefix, identifier):
+        return store.get((prefix, identifier))
+
+    async def fake_set(prefix, identifier, value, ttl=0):
+        store[(prefix, identifier)] = value
+
+    async def local_flight(namespace, key, fn, **kwargs):
+        return await fn()
+
+    generate._cache.l1._data.clear()
+    with patch("core.tiered_cache.cache_get", fake_get), patch(
+        "core.tiered_cache.cache_set", fake_set
+    ), patch("routers.generate.redis_singleflight", local_flight):
+        yield store
+
+
+def test_identifier_normalizes_inputs():
+    key = generate._cache_identifier("  Sunset  LAMP ", "Gen Z", "unknown", 4.999)
+    assert key == generate._cache_identifier("sunset lamp", "gen z", "standard", 5.0)
+    assert key != generate._cache_identifier("sunset lamp", "gen z", "luxury", 5.0)
+    assert key != generate._cache_identifier(
+        "sunset lamp", "gen z", "standard", 5.0, "gpt-3.5-turbo"
+    )
+    with patch.object(generate, "PROMPT_VERSION", "next"):
+        assert key != generate._cache_identifier(
+            "sunset lamp", "gen z", "standard", 5.0
+        )
+
+
+def test_repeat_request_served_from_cache(client, fake_cache):
+    with patch(
+        "routers.generate._complete_with_usage", AsyncMock(return_value=_served(PAGE))
+    ) as complete:
+        first = client.post("/generate", json={"product_name": "Sunset Lamp"})
+        second = client.post("/generate", json={"product_name": "sunset  lamp"})
+    assert first.json()["cached"] is False
+    assert second.json() == {
+        "product_name": "sunset  lamp",
+        "generated": PAGE,
+        "cached": True,
+        "model": "gpt-4o",
+    }
+    complete.assert_awaited_once()
+
+
+def test_regenerate_bypasses_and_replaces_cache(client, fake_cache):
+    fresh = {"seo_title": "Sunset Lamp v2"}
+    with patch(
+        "routers.generate._complete_with_usage",
+        AsyncMock(side_effect=[_served(PAGE), _served(fresh)]),
+    ) as complete:
+        client.post("/generate", json={"product_name": "Sunset Lamp"})
+        regen = client.post(
+            "/generate", json={"product_name": "Sunset Lamp", "regenerate": True}
+        )
+        again = client.post("/generate", json={"product_name": "Sunset Lamp"})
+    assert regen.json()["generated"] == fresh
+    assert again.json()["generated"] == fresh
+    assert complete.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_requests_share_one_call(fake_cache):
+    async def slow_complete(prompt, plan=None):
+        await asyncio.sleep(0.05)
+        return _served(PAGE)
+
+    with patch(
+        "routers.generate._complete_with_usage", AsyncMock(side_effect=slow_complete)
+    ) as complete:
+        req = generate.GenerateRequest(product_name="Sunset Lamp")
+        results = await asyncio.gather(*(generate.generate_page(req) for _ in range(3)))
+    assert all(r["generated"] == PAGE for r in results)
+    assert sum(not r["cached"] for r in results) == 1
+    complete.assert_awaited_once()
+
+
+def test_invalid_model_output_is_not_cached(client, fake_cache):
+    import json
+
+    bad = AsyncMock(side_effect=json.JSONDecodeError("x", "", 0))
+    with patch("routers.generate._complete_with_usage", bad):
+        resp = client.post("/generate", json={"product_name": "Sunset Lamp"})
+    assert resp.status_code == 500
+    assert fake_cache == {}
+
+
+def _sse(text):
+    import json
+
+    frames = [f for f in text.split("\n\n") if f]
+    return [(f.split("\n")[0][7:], json.loads(f.split("\n")[1][6:])) for f in frames]
+
+
+def test_stream_pushes_sections_then_done_and_caches(client, fake_cache):
+    import json
+
+    text = json.dumps(PAGE)
+
+    async def deltas():
+        for i in range(0, len(text), 5):
+            yield text[i : i + 5]
+
+    opened = AsyncMock(return_value=("gpt-4o", deltas()))
+    with patch("routers.generate._stream_completion", opened), patch(
+        "routers.generate._save_generation"
+    ) as save:
+        resp = client.post(
+            "/generate/stream", json={"product_name": "Sunset Lamp", "user_id": "u1"}
+        )
+    events = _sse(resp.text)
+    assert [e for e, _ in events] == ["section", "section", "done"]
+    assert events[0][1] == {"key": "seo_title", "value": "Sunset Lamp"}
+    assert events[-1][1] == {
+        "product_name": "Sunset Lamp",
+        "generated": PAGE,
+        "cached": False,
+        "model": "gpt-4o",
+    }
+    assert save.call_args.kwargs == {"model": "gpt-4o"}
+
+    with patch("routers.generate._complete_with_usage", AsyncMock()) as complete:
+        again = client.post("/generate", json={"product_name": "Sunset Lamp"})
+    assert again.json()["cached"] is True
+    complete.assert_not_awaited()
+
+
+def test_stream_reports_invalid_output(client, fake_cache):
+    async def deltas():
+        yield '{"seo_title": "Lamp", "bullets": ['
+
+    opened = AsyncMock(return_value=("gpt-4o", deltas()))
+    with patch("routers.generate._stream_completion", opened):
+        resp = client.post("/generate/stream", json={"product_name": "Sunset Lamp"})
+    events = _sse(resp.text)
+    assert [e for e, _ in events] == ["section", "error"]
+    assert fake_cache == {}
+
+
+CURRENT = {
+    "seo_title": "Sunset Lamp",
+    "description": "<p>Glow.</p>",
+    "faq": [{"q": "Old?", "a": "Yes"}],
+    "meta_description": "Old meta",
+}
+
+
+def test_partial_regeneration_rewrites_only_requested_sections(client):
+    rewritten = {"faq": [{"q": "New?", "a": "Yes"}], "seo_title": "Ignored"}
+    with patch(
+        "routers.generate._complete_with_usage",
+        AsyncMock(return_value=_served(rewritten)),
+    ) as complete:
+        resp = client.post(
+            "/generate/sections",
+            json={
+                "product_name": "Sunset Lamp",
+                "generated": CURRENT,
+                "sections": ["faq"],
+            },
+        )
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["generated"] == {**CURRENT, "faq": rewritten["faq"]}
+    assert data["regenerated"] == ["faq"]
+    prompt = complete.await_args.args[0]
+    assert '"faq"' in prompt and '"description":' not in prompt
+    assert complete.await_args.kwargs["max_tokens"] < 1500
+
+
+def test_partial_regeneration_from_stored_generation_saves_revision(client):
+    parent = {
+        "id": "g1",
+        "user_id": "u1",
+        "product_name": "Sunset Lamp",
+        "tone_preset": "luxury",
+        "supplier_data": {"price": 4.5},
+        "generated_copy": CURRENT,
+        "revision": 2,
+    }
+    rewritten = {"meta_description": "New meta"}
+    with patch("routers.generate._load_generation", return_value=parent) as load, patch(
+        "routers.generate._complete_with_usage",
+        AsyncMock(return_value=_served(rewritten, "gpt-3.5-turbo")),
+    ) as complete, patch(
+        "routers.generate._save_generation", return_value="g2"
+    ) as save:
+        resp = client.post(
+            "/generate/sections",
+            json={
+                "generation_id": "g1",
+                "user_id": "u1",
+                "sections": ["meta_description"],
+            },
+        )
+    load.assert_called_once_with("g1", "u1")
+    data = resp.json()
+    assert data["generation_id"] == "g2"
+    assert data["revision"] == 3
+    assert data["generated"]["meta_description"] == "New meta"
+    assert data["model"] == "gpt-3.5-turbo"
+    assert "elevated, premium tone" in complete.await_args.args[0]
+    kwargs = save.call_args.kwargs
+    assert kwargs["parent_id"] == "g1"
+    assert kwargs["generation_cost"] == 0.25
+    assert kwargs["regenerated_sections"] == ["meta_description"]
+    assert kwargs["model"] == "gpt-3.5-turbo" and kwargs["total_tokens"] == 1000
+
+
+def test_partial_regeneration_of_stored_page_needs_its_owner(client):
+    parent = {"id": "g1", "user_id": "u1", "product_name": "Lamp"}
+    parent.update(tone_preset="luxury", generated_copy=CURRENT)
+    body = {"generation_id": "g1", "sections": ["faq"]}
+    with patch("routers.generate._load_generation", return_value=parent) as load, patch(
+        "routers.generate._complete_with_usage",
+        AsyncMock(return_value=_served({"faq": []})),
+    ) as complete, patch(
+        "routers.generate._save_generation", return_value="g2"
+    ) as save:
+        assert client.post("/generate/sections", json=body).status_code == 400
+        load.assert_not_called()
+
+        body.update(user_id="u2", tone="playful")
+        resp = client.post("/generate/sections", json=body)
+    assert resp.status_code == 200
+    load.assert_called_once_with("g1", "u2")
+    # The caller's tone wins; the revision is saved under the caller, not the parent
+    assert "fun, energetic tone" in complete.await_args.args[0]
+    assert save.call_args.args[0].user_id == "u2"
+
+    with patch("routers.generate._load_generation", return_value=None):
+        assert client.post("/generate/sections", json=body).status_code == 404
+
+
+def test_partial_regeneration_costs_per_section_and_inline_gaps_cost_a_page(client):
+    full = {
+        **CURRENT,
+        "bullets": ["Warm glow"],
+        "tiktok_hook": "Old hook",
+        "pinterest_caption": "Old caption",
+    }
+    every = list(generate.SECTION_SPECS)
+    cases = [
+        (full, ["faq", "bullets"], 0.5),
+        (full, every, 1),
+        # An inline page without the sections it keeps is a fresh page
+        (CURRENT, ["faq"], 1),
+        ({}, every, 1),
+    ]
+    for current, sections, cost in cases:
+        rewritten = {key: full[key] for key in sections}
+        with patch(
+            "routers.generate._complete_with_usage",
+            AsyncMock(return_value=_served(rewritten)),
+        ), patch("routers.generate._save_generation", return_value="g2") as save:
+            resp = client.post(
+                "/generate/sections",
+                json={
+                    "product_name": "Lamp",
+                    "user_id": "u1",
+                    "generated": current,
+                    "sections": sections,
+                },
+            )
+        assert resp.status_code == 200
+        assert save.call_args.kwargs["generation_cost"] == cost, sections
+
+
+def test_partial_regeneration_validates_sections_and_output(client):
+    resp = client.post(
+        "/generate/sections",
+        json={"product_name": "Lamp", "generated": CURRENT, "sections": ["price"]},
+    )
+    assert resp.status_code == 400
+    with patch(
+        "routers.generate._complete_with_usage", AsyncMock(return_value=_served({}))
+    ):
+        resp = client.post(
+            "/generate/sections",
+            json={"product_name": "Lamp", "generated": CURRENT, "sections": ["faq"]},
+        )
+    assert resp.status_code == 500
+
+
+def test_free_plan_pages_are_cached_apart_from_paid(client, fake_cache):
+    cheap = _served({"seo_title": "Lamp"}, "gpt-3.5-turbo")
+    complete = AsyncMock(side_effect=[cheap, _served(PAGE)])
+    with patch("routers.generate._complete_with_usage", complete), patch(
+        "routers.generate._plan_tier", side_effect=["free", "pro"]
+    ):
+        free = client.post("/generate", json={"product_name": "Lamp", "user_id": "f"})
+        paid = client.post("/generate", json={"product_name": "Lamp", "user_id": "p"})
+    assert free.json()["model"] == "gpt-3.5-turbo"
+    assert (paid.json()["model"], paid.json()["cached"]) == ("gpt-4o", False)
+    assert [c.kwargs["plan"] for c in complete.await_args_list] == ["free", "pro"]
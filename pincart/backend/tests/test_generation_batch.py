@@ -0,0 +1,267 @@
+"""Tests for batch page generation and the shared OpenAI budget."""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import openai
+import pytest
+
+from routers import generate
+from services import generation_batch, openai_budget
+
+PAGE = {"seo_title": "Sunset Lamp", "bullets": ["Warm glow"]}
+USAGE = {
+    "model": "gpt-4o",
+    "prompt_tokens": 300,
+    "completion_tokens": 700,
+    "total_tokens": 1000,
+}
+
+
+class FakeRedis:
+    """The handful of Redis commands the budget and batch state use."""
+
+    def __init__(self):
+        self.data: dict = {}
+
+    async def incr(self, key):
+        return await self.incrby(key, 1)
+
+    async def incrby(self, key, amount):
+        self.data[key] = int(self.data.get(key, 0)) + amount
+        return self.data[key]
+
+    async def decr(self, key):
+        return await self.incrby(key, -1)
+
+    async def decrby(self, key, amount):
+        return await self.incrby(key, -amount)
+
+    async def set(self, key, value):
+        self.data[key] = value
+
+    async def exists(self, key):
+        return int(key in self.data)
+
+    async def expire(self, key, ttl):
+        return True
+
+    async def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+
+    async def zrem(self, key, member):
+        self.data.get(key, {}).pop(member, None)
+
+    async def zremrangebyscore(self, key, low, high):
+        entry = self.data.get(key, {})
+        for member in [m for m, score in entry.items() if score <= high]:
+            del entry[member]
+
+    async def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    async def hset(self, key, field=None, value=None, mapping=None):
+        entry = self.data.setdefault(key, {})
+        if field is not None:
+            entry[field] = str(value)
+        for name, item in (mapping or {}).items():
+            entry[name] = str(item)
+
+    async def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    async def hincrby(self, key, field, amount):
+        entry = self.data.setdefault(key, {})
+        entry[field] = str(int(entry.get(field, 0)) + amount)
+        return int(entry[field])
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls: list = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+
+        return queue
+
+    async def execute(self):
+        return [
+            await getattr(self.redis, name)(*args, **kwargs)
+            for name, args, kwargs in self.calls
+        ]
+
+
+@pytest.fixture()
+def redis():
+    fake = FakeRedis()
+    store: dict = {}
+
+    async def fake_get(prefix, identifier):
+        return store.get((prefix, identifier))
+
+    async def fake_set(prefix, identifier, value, ttl=0):
+        store[(prefix, identifier)] = value
+
+    get_fake = AsyncMock(return_value=fake)
+    generate._cache.l1._data.clear()
+    with patch("services.openai_budget.get_redis", get_fake), patch(
+        "services.generation_batch.get_redis", get_fake
+    ), patch("core.tiered_cache.cache_get", fake_get), patch(
+        "core.tiered_cache.cache_set", fake_set
+    ), patch(
+        "routers.generate._plan_tier", return_value="pro"
+    ):
+        yield fake
+
+
+def _rate_limit_error(retry_after="7"):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(
+        429, headers={"retry-after": retry_after}, request=request
+    )
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+def _slots(redis):
+    return len(redis.data.get(openai_budget._ACTIVE_KEY, {}))
+
+
+@pytest.mark.asyncio
+async def test_budget_caps_concurrency_and_settles_tokens(redis):
+    first = await openai_budget.acquire(1000, wait=0, concurrency=1, tpm=5000)
+    with pytest.raises(openai_budget.BudgetUnavailable):
+        await openai_budget.acquire(1000, wait=0, concurrency=1, tpm=5000)
+    assert _slots(redis) == 1
+
+    await openai_budget.release(first, used_tokens=400)
+    assert _slots(redis) == 0
+    assert redis.data[f"{openai_budget._TPM_KEY}:{first.minute}"] == 400
+
+
+@pytest.mark.asyncio
+async def test_budget_caps_tokens_per_minute(redis):
+    await openai_budget.acquire(3000, wait=0, concurrency=5, tpm=5000)
+    with pytest.raises(openai_budget.BudgetUnavailable) as exc:
+        await openai_budget.acquire(3000, wait=0, concurrency=5, tpm=5000)
+    assert 0 < exc.value.retry_after <= 60
+    # The rejected reservation was rolled back
+    assert _slots(redis) == 1
+
+
+@pytest.mark.asyncio
+async def test_slot_of_a_dead_worker_expires(redis):
+    await openai_budget.acquire(1000, wait=0, concurrency=1, tpm=5000)
+    # The holder was killed and never released; its lease runs out
+    [slot] = redis.data[openai_budget._ACTIVE_KEY]
+    redis.data[openai_budget._ACTIVE_KEY][slot] = time.time() - 1
+    reservation = await openai_budget.acquire(1000, wait=0, concurrency=1, tpm=5000)
+    assert reservation.slot != slot and _slots(redis) == 1
+
+
+@pytest.mark.asyncio
+async def test_budget_is_open_without_redis():
+    with patch(
+        "services.openai_budget.get_redis", AsyncMock(side_effect=ConnectionError)
+    ):
+        assert await openai_budget.acquire(1000, wait=0) is None
+
+
+@pytest.mark.asyncio
+async def test_batch_records_usage_and_reports_completion(redis):
+    items = [{"product_name": "Sunset Lamp", "user_id": "u1"}] * 2
+    batch_id = await generation_batch.create_batch(items, "u1", "me@example.com")
+    complete = AsyncMock(return_value=(PAGE, USAGE))
+    save = MagicMock(return_value="gen-1")
+
+    with patch("routers.generate._complete_with_usage", complete), patch(
+        "routers.generate._save_generation", save
+    ):
+        first = await generation_batch.run_item(batch_id, 0, items[0], 0, False)
+        second = await generation_batch.run_item(batch_id, 1, items[1], 0, False)
+
+    # The duplicate is served from the generation cache at no token cost
+    complete.assert_awaited_once()
+    assert first["batch_done"] is False
+    assert second["batch_done"] is True and second["cached"] is True
+    assert second["batch"]["notify_email"] == "me@example.com"
+    assert save.call_args_list[0].kwargs == {"batch_id": batch_id, **USAGE}
+    assert save.call_args_list[1].kwargs == {"batch_id": batch_id, "model": "gpt-4o"}
+
+    batch = await generation_batch.get_batch(batch_id)
+    assert batch["status"] == "complete"
+    assert (batch["completed"], batch["failed"], batch["cached"]) == (2, 0, 1)
+    assert batch["usage"] == {"prompt_tokens": 300, "completion_tokens": 700}
+    assert [item["generation_id"] for item in batch["items"]] == ["gen-1", "gen-1"]
+    assert _slots(redis) == 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_retries_with_retry_after_then_fails(redis):
+    item = {"product_name": "Cat Bed"}
+    batch_id = await generation_batch.create_batch([item], None, None)
+    failing = AsyncMock(side_effect=_rate_limit_error())
+
+    with patch("routers.generate._complete_with_usage", failing):
+        with pytest.raises(generation_batch.RetryLater) as exc:
+            await generation_batch.run_item(batch_id, 0, item, 0, False)
+        assert 7 <= exc.value.countdown <= 9
+        # Rate limits back off on the same model instead of failing over
+        errors = failing.call_args.kwargs["failover_errors"]
+        assert openai.RateLimitError not in errors
+        result = await generation_batch.run_item(batch_id, 0, item, 6, True)
+
+    assert result["status"] == "failed" and result["batch_done"] is True
+    assert _slots(redis) == 0
+    batch = await generation_batch.get_batch(batch_id)
+    assert batch["failed"] == 1 and batch["items"][0]["status"] == "failed"
+
+
+def test_backoff_grows_and_is_capped():
+    assert 10 <= generation_batch.backoff(0) <= 15
+    assert 40 <= generation_batch.backoff(2) <= 45
+    assert generation_batch.backoff(10) <= generation_batch.MAX_BACKOFF + 5
+
+
+def test_batch_endpoint_queues_one_task_per_item(client, redis):
+    with patch("routers.generate.generate_page_task") as task:
+        resp = client.post(
+            "/generate/batch",
+            json={
+                "items": [{"product_name": "Sunset Lamp"}, {"product_name": "Cat Bed"}],
+                "user_id": "u1",
+            },
+        )
+    assert resp.status_code == 202
+    body = resp.json()
+    assert body["total"] == 2
+    assert task.delay.call_count == 2
+    batch_id, index, item = task.delay.call_args_list[1].args
+    assert (batch_id, index) == (body["batch_id"], 1)
+    assert item["product_name"] == "Cat Bed" and item["user_id"] == "u1"
+
+    progress = client.get(f"/generate/batch/{body['batch_id']}").json()
+    assert progress["status"] == "running"
+    assert [i["status"] for i in progress["items"]] == ["queued", "queued"]
+
+
+def test_batch_endpoint_rejects_oversized_and_unknown(client, redis):
+    items = [{"product_name": f"Item {i}"} for i in range(generate.BATCH_MAX_ITEMS + 1)]
+    assert client.post("/generate/batch", json={"items": items}).status_code == 422
+    assert client.get("/generate/batch/missing").status_code == 404
@@ -0,0 +1,40 @@
+"""Tests for the shared per-host outbound HTTP client manager."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+
+from services.http_client import HTTPClientManager
+
+
+@pytest.mark.asyncio
+async def test_clients_are_pooled_per_host_with_config():
+    manager = HTTPClientManager({"a.example": {"timeout": 3, "max_connections": 2}})
+    first = manager.client("https://a.example/search?q=1")
+    assert manager.client("https://a.example/other") is first
+    assert manager.client("https://b.example/") is not first
+    assert first.timeout.read == 3
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_requests_are_counted_per_host():
+    manager = HTTPClientManager({})
+    ok = httpx.Response(200, request=httpx.Request("GET", "https://a.example/"))
+    with patch.object(httpx.AsyncClient, "request", AsyncMock(return_value=ok)):
+        await manager.get("https://a.example/x")
+        await manager.get("https://a.example/y")
+    with patch.object(
+        httpx.AsyncClient, "request", AsyncMock(side_effect=httpx.ConnectError("x"))
+    ), pytest.raises(httpx.ConnectError):
+        await manager.get("https://a.example/z")
+    stats = manager.stats()["a.example"]
+    assert stats["requests"] == 3
+    assert stats["errors"] == 1
+    assert stats["in_flight"] == 0
+    await manager.close()
@@ -0,0 +1,46 @@
+"""Tests for incremental JSON section parsing."""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+from core.json_stream import JSONSectionParser
+
+PAGE = {
+    "seo_title": 'Sunset Lamp — "Golden Hour" {all day}',
+    "description": "<p>Warm, glowing, cozy.</p>\\n<p>Line two, with a comma.</p>",
+    "bullets": ["Bright, [adjustable] light", "USB powered"],
+    "faq": [{"q": "Is it dimmable?", "a": "Yes, 3 levels."}],
+    "meta_description": "Sunset \\u2600 lamp",
+    "price": 19.99,
+    "in_stock": True,
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 17, 10_000])
+def test_sections_emitted_in_order_for_any_chunking(chunk_size):
+    text = json.dumps(PAGE, indent=2, ensure_ascii=False)
+    parser = JSONSectionParser()
+    sections = []
+    for start in range(0, len(text), chunk_size):
+        sections.extend(parser.feed(text[start : start + chunk_size]))
+    assert sections == list(PAGE.items())
+    assert parser.result() == PAGE
+
+
+def test_section_emitted_as_soon_as_it_closes():
+    parser = JSONSectionParser()
+    assert parser.feed('{"seo_title": "Lamp", "bullets": ["a", "b"') == [
+        ("seo_title", "Lamp")
+    ]
+    assert parser.feed("]}") == [("bullets", ["a", "b"])]
+
+
+def test_result_raises_on_truncated_output():
+    parser = JSONSectionParser()
+    parser.feed('{"seo_title": "Lamp", "faq": [')
+    with pytest.raises(json.JSONDecodeError):
+        parser.result()
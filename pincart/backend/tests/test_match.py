@@ -0,0 +1,223 @@
+"""Tests for supplier match result caching."""
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from routers import match
+from services.http_client import HTTPClientManager
+
+CORPUS = Path(__file__).parent / "fixtures" / "suppliers"
+
+
+def _serving(host: str, status: int, page: str) -> HTTPClientManager:
+    """Client manager whose *host* returns a saved corpus page."""
+    body = (CORPUS / page).read_bytes()
+    manager = HTTPClientManager({})
+    manager._clients[host] = httpx.AsyncClient(
+        transport=httpx.MockTransport(
+            lambda request: httpx.Response(status, content=body)
+        )
+    )
+    manager._stats[host] = {"requests": 0, "errors": 0, "in_flight": 0}
+    return manager
+
+
+@pytest.fixture()
+def fake_redis():
+    """Back the match caches with a plain dict and start them empty."""
+    store: dict = {}
+
+    async def fake_get(prefix, identifier):
+        return store.get((prefix, identifier))
+
+    async def fake_set(prefix, identifier, value, ttl=0):
+        store[(prefix, identifier)] = value
+
+    for cache in match._caches.values():
+        cache.l1._data.clear()
+    with patch("core.tiered_cache.cache_get", fake_get), patch(
+        "core.tiered_cache.cache_set", fake_set
+    ):
+        yield store
+
+
+def test_normalize_title():
+    assert match._normalize_title("  LED  Desk-Lamp!! ") == "led desk lamp"
+
+
+@pytest.mark.asyncio
+async def test_results_cached_per_normalized_title(fake_redis):
+    calls = []
+
+    async def load():
+        calls.append(1)
+        return {"status": "ok", "results": [{"unit_cost": 4.0}]}
+
+    first = await match._cached_search("cj", "LED desk lamp", load)
+    second = await match._cached_search("cj", "led  desk lamp!", load)
+    assert first["results"] == second["results"] == [{"unit_cost": 4.0}]
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_empty_results_use_short_ttl(fake_redis):
+    calls = []
+
+    async def load():
+        calls.append(1)
+        return {"status": "empty", "results": []}
+
+    for _ in range(2):
+        outcome = await match._cached_search("aliexpress", "rare item", load)
+        assert outcome == {"status": "empty", "results": []}
+    assert len(calls) == 1
+
+    # Past the negative TTL the miss is retried in the background
+    cache = match._caches["aliexpress"]
+    ts, value = cache.l1.get("rare item")
+    cache.l1.set(
+        "rare item", (ts - match.SOURCE_TTLS["aliexpress"]["empty"] - 1, value)
+    )
+    fake_redis.clear()
+    await match._cached_search("aliexpress", "rare item", load)
+    for task in list(cache._background):
+        await task
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_blocked_refresh_keeps_last_good_results(fake_redis):
+    cache = match._caches["aliexpress"]
+    good = {"status": "ok", "results": [{"unit_cost": 2.0}]}
+    cache.l1.set("mug", (time.time() - match.SOURCE_TTLS["aliexpress"]["ok"] - 1, good))
+
+    async def load():
+        return {"status": "blocked", "results": []}
+
+    served = await match._cached_search("aliexpress", "mug", load)
+    assert served["results"] == good["results"]
+    for task in list(cache._background):
+        await task
+    _, value = cache.l1.get("mug")
+    assert value["status"] == "blocked"
+    assert value["results"] == good["results"]
+
+
+@pytest.mark.asyncio
+async def test_fetch_aliexpress_parses_streamed_page():
+    manager = _serving("www.aliexpress.com", 200, "aliexpress_search.html")
+    with patch.object(match, "get_http_clients", return_value=manager):
+        outcome = await match._fetch_aliexpress("sunset lamp")
+    assert outcome["status"] == "ok"
+    assert len(outcome["results"]) == 5
+    first = outcome["results"][0]
+    assert first["unit_cost"] == 3.42
+    assert first["product_url"].endswith("/1005006000000000.html")
+    await manager.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "status,page,expected",
+    [
+        (200, "aliexpress_captcha.html", "blocked"),
+        (403, "aliexpress_captcha.html", "blocked"),
+        (200, "cj_empty.html", "empty"),
+    ],
+)
+async def test_fetch_cj_classifies_outcome(status, page, expected):
+    manager = _serving("cjdropshipping.com", status, page)
+    with patch.object(match, "get_http_clients", return_value=manager):
+        outcome = await match._fetch_cj("mug")
+    assert outcome == {"status": expected, "results": []}
+    await manager.close()
+
+
+def test_dedupe_merges_near_identical_titles():
+    groups = match._dedupe_titles(
+        [
+            "LED Desk Lamp, Dimmable",
+            "led desk lamp dimmable!",
+            "Dimmable LED desk lamp",
+            "Cat bed",
+            "  ",
+            "LED desk lamp with USB charger port",
+        ]
+    )
+    assert groups == [
+        ("LED Desk Lamp, Dimmable", [0, 1, 2]),
+        ("Cat bed", [3]),
+        ("LED desk lamp with USB charger port", [5]),
+    ]
+
+
+def test_match_products_streams_one_event_per_distinct_title(client):
+    import json
+    from unittest.mock import AsyncMock
+
+    found = {"results": [{"unit_cost": 2.0}], "sources": {"cj": "ok"}}
+    with patch.object(match.engine, "search", AsyncMock(return_value=found)) as search:
+        resp = client.post(
+            "/match-products",
+            json={
+                "products": [
+                    {"product_title": "Cat bed"},
+                    {"product_title": "cat bed!"},
+                    {"product_title": "Desk lamp"},
+                ]
+            },
+        )
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    frames = [f for f in resp.text.split("\n\n") if f]
+    events = [(f.split("\n")[0][7:], json.loads(f.split("\n")[1][6:])) for f in frames]
+    assert [e for e, _ in events] == ["match", "match", "summary"]
+    assert sorted(data["requests"] for _, data in events[:2]) == [[0, 1], [2]]
+    assert events[2][1]["unique_titles"] == 2
+    assert search.await_count == 2
+
+
+def test_large_match_batch_is_queued(client):
+    from unittest.mock import MagicMock
+
+    titles = [
+        {"product_title": f"product {i}"} for i in range(match.BATCH_SYNC_MAX + 1)
+    ]
+    with patch("routers.match.match_products_task") as task:
+        task.delay.return_value = MagicMock(id="job-9")
+        resp = client.post("/match-products", json={"products": titles})
+    assert resp.status_code == 202
+    assert resp.json() == {"job_id": "job-9", "status": "queued"}
+    assert len(task.delay.call_args.args[0]) == match.BATCH_SYNC_MAX + 1
+
+
+def test_profit_calculator_applies_custom_rules(client):
+    resp = client.post(
+        "/profit-calculator",
+        json={
+            "offers": [
+                {"unit_cost": 3.42, "region": "US"},
+                {"unit_cost": 10},
+                {"unit_cost": 50},
+            ],
+            "markup_tiers": [[5, 3.0], [20, 2.5]],
+            "markup": 1.0,
+            "shipping": {"US": 2.5},
+            "charm_cents": 99,
+        },
+    )
+    assert resp.status_code == 200
+    data = resp.json()
+    first = data["rows"][0]
+    assert first["retail"] == 10.99
+    assert first["shipping"] == 2.5
+    assert first["net_profit"] == round(10.99 - 3.42 - 2.5 - (10.99 * 0.029 + 0.30), 2)
+    assert data["rows"][2]["break_even_roas"] is None  # Loses money before ads
+    assert data["summary"]["unprofitable"] == 1
@@ -0,0 +1,186 @@
+"""Tests for the model router against a local OpenAI-compatible stub server."""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import openai
+import pytest
+from openai import AsyncOpenAI
+
+from services.model_router import UNKNOWN_PLAN, ModelRouter
+
+PARAMS = {"messages": [{"role": "user", "content": "hi"}], "max_tokens": 50}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """``POST /v1/chat/completions``; ``server.behavior[model]`` picks the reply."""
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        model = request["model"]
+        self.server.calls.append(model)
+        behavior = self.server.behavior.get(model, "ok")
+        if behavior == "error":
+            error = {"error": {"message": "overloaded", "type": "server_error"}}
+            return self._send(500, json.dumps(error).encode())
+        if behavior == "ratelimit":
+            error = {"error": {"message": "slow down", "type": "rate_limit"}}
+            return self._send(429, json.dumps(error).encode())
+        if behavior == "bad":
+            error = {"error": {"message": "bad request", "type": "invalid_request"}}
+            return self._send(400, json.dumps(error).encode())
+        if behavior == "slow":
+            time.sleep(1)
+        content = json.dumps({"served_by": model})
+        if request.get("stream"):
+            chunk = {
+                "id": "c1",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": content}}],
+            }
+            body = f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode()
+            return self._send(200, body, "text/event-stream")
+        reply = {
+            "id": "c1",
+            "object": "chat.completion",
+            "created": 0,
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 7, "total_tokens": 12},
+        }
+        self._send(200, json.dumps(reply).encode())
+
+
+@pytest.fixture()
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.behavior = {}
+    server.calls = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _router(stub, **kwargs):
+    client = AsyncOpenAI(
+        api_key="test",
+        base_url=f"http://127.0.0.1:{stub.server_address[1]}/v1",
+        max_retries=0,
+    )
+    options = {"economy_plans": {"free"}, "min_samples": 2, **kwargs}
+    return ModelRouter(client, "gpt-4o", "gpt-3.5-turbo", **options)
+
+
+@pytest.mark.asyncio
+async def test_routes_paid_plans_to_primary_and_free_to_fallback(stub):
+    router = _router(stub)
+    response, model = await router.create(PARAMS, "pro")
+    assert model == "gpt-4o"
+    assert json.loads(response.choices[0].message.content) == {"served_by": "gpt-4o"}
+    _, model = await router.create(PARAMS, "free")
+    assert model == "gpt-3.5-turbo"
+    _, model = await router.create(PARAMS, None)
+    assert model == "gpt-3.5-turbo"
+    # A paying user whose profile could not be read is not downgraded
+    _, model = await router.create(PARAMS, UNKNOWN_PLAN)
+    assert model == "gpt-4o"
+
+
+@pytest.mark.asyncio
+async def test_fails_over_on_errors_then_routes_around_unhealthy_model(stub):
+    stub.behavior["gpt-4o"] = "error"
+    router = _router(stub)
+    for _ in range(2):
+        _, model = await router.create(PARAMS, "pro")
+        assert model == "gpt-3.5-turbo"
+    assert stub.calls == ["gpt-4o", "gpt-3.5-turbo"] * 2
+    assert router.failovers == 2
+    assert router.healthy("gpt-4o") is False
+
+    # The degraded primary is now tried last, so requests skip it entirely
+    stub.calls.clear()
+    _, model = await router.create(PARAMS, "pro")
+    assert (model, stub.calls) == ("gpt-3.5-turbo", ["gpt-3.5-turbo"])
+    snapshot = router.snapshot()["models"]["gpt-4o"]
+    assert snapshot["error_rate"] == 1.0 and snapshot["healthy"] is False
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_times_out_and_high_p95_demotes_it(stub):
+    stub.behavior["gpt-4o"] = "slow"
+    router = _router(stub, attempt_timeout=0.3)
+    _, model = await router.create(PARAMS, "pro")
+    assert model == "gpt-3.5-turbo"
+
+    # Successful but slow calls push the P95 over the limit
+    router = _router(stub, slow_p95=0.5)
+    for _ in range(2):
+        _, model = await router.create(PARAMS, "pro")
+        assert model == "gpt-4o"
+    assert router.candidates("pro") == ["gpt-3.5-turbo", "gpt-4o"]
+
+
+def test_attempt_timeout_scales_with_reply_length(stub):
+    router = _router(stub, timeout_base=3, min_tokens_per_second=100)
+    assert router.timeout(300) == 6
+    # A full page gets the whole ceiling, not a short fixed cap
+    assert router.timeout(1500) == router.attempt_timeout == 18
+    assert router.timeout(None) == 18
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_is_raised_when_not_a_failover_error(stub):
+    stub.behavior["gpt-4o"] = "ratelimit"
+    router = _router(stub)
+    _, model = await router.create(PARAMS, "pro")
+    assert model == "gpt-3.5-turbo"
+
+    stub.calls.clear()
+    errors = (openai.APITimeoutError, openai.InternalServerError)
+    with pytest.raises(openai.RateLimitError):
+        await router.create(PARAMS, "pro", failover_errors=errors)
+    assert stub.calls == ["gpt-4o"]
+
+
+@pytest.mark.asyncio
+async def test_stream_fails_over_before_first_token(stub):
+    stub.behavior["gpt-4o"] = "error"
+    router = _router(stub)
+    stream, model = await router.create(PARAMS, "pro", stream=True)
+    text = "".join([chunk.choices[0].delta.content async for chunk in stream])
+    assert model == "gpt-3.5-turbo"
+    assert json.loads(text) == {"served_by": "gpt-3.5-turbo"}
+
+
+@pytest.mark.asyncio
+async def test_request_errors_do_not_fail_over(stub):
+    stub.behavior["gpt-4o"] = "bad"
+    router = _router(stub)
+    with pytest.raises(openai.BadRequestError):
+        await router.create(PARAMS, "pro")
+    assert stub.calls == ["gpt-4o"]
@@ -0,0 +1,96 @@
+"""Tests for discover cache pre-warming selection and scheduling."""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from services import prewarm
+
+
+@pytest.mark.asyncio
+async def test_due_keywords_picks_missing_and_expiring_entries():
+    now = time.time()
+    entries = {
+        "fresh": (now - 60, ["pin"]),
+        "expiring": (now - prewarm.CACHE_TTL + 60, ["pin"]),
+    }
+
+    async def peek(keyword):
+        return entries.get(keyword)
+
+    with patch.object(prewarm._cache, "peek", peek):
+        due = await prewarm.due_keywords(["fresh", "expiring", "missing"], lead=600)
+    assert due == ["expiring", "missing"]
+
+
+@pytest.mark.asyncio
+async def test_plan_spreads_refreshes_across_interval():
+    keywords = ["a", "b", "c", "d"]
+    with patch.object(
+        prewarm, "top_keywords", AsyncMock(return_value=keywords)
+    ), patch.object(prewarm, "due_keywords", AsyncMock(return_value=keywords)), patch(
+        "services.prewarm.get_redis", AsyncMock(side_effect=ConnectionError)
+    ):
+        plan = await prewarm.plan_refreshes(interval=800)
+    assert plan == [("a", 0), ("b", 200), ("c", 400), ("d", 600)]
+
+
+class FakeRedis:
+    """Sorted-set commands behind the shared pre-warm slots."""
+
+    def __init__(self):
+        self.slots: dict = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def zrem(self, key, member):
+        self.slots.pop(member, None)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def zremrangebyscore(self, key, low, high):
+        for member, score in list(self.redis.slots.items()):
+            if score <= high:
+                del self.redis.slots[member]
+
+    def zadd(self, key, mapping):
+        self.redis.slots.update(mapping)
+
+    def zcard(self, key):
+        pass
+
+    def expire(self, key, ttl):
+        pass
+
+    async def execute(self):
+        return [None, None, len(self.redis.slots), None]
+
+
+@pytest.mark.asyncio
+async def test_slots_are_capped_and_a_dead_workers_slot_expires():
+    redis = FakeRedis()
+    with patch("services.prewarm.get_redis", AsyncMock(return_value=redis)):
+        first = await prewarm.acquire_slot(limit=1)
+        assert first and await prewarm.acquire_slot(limit=1) is None
+
+        # The holder was killed and never released; its lease runs out
+        redis.slots[first] = time.time() - 1
+        second = await prewarm.acquire_slot(limit=1)
+        assert second and second != first
+        await prewarm.release_slot(second)
+        assert redis.slots == {}
@@ -0,0 +1,62 @@
+"""Tests for the vectorized pricing engine."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+
+from services.pricing import PricingRules, apply_pricing, price_offers
+
+
+def test_default_rules_match_fixed_markup_math():
+    costs = np.arange(1, 5001) / 100
+    priced = price_offers(costs)
+    for cost, retail, margin in zip(
+        costs.tolist(), priced["retail"].tolist(), priced["gross_margin_pct"].tolist()
+    ):
+        expected = round(cost * 2.8, 2)
+        assert retail == expected
+        assert margin == round((expected - cost) / expected * 100, 1)
+
+
+def test_markup_tiers_choose_by_cost():
+    rules = PricingRules(markup=2.0, markup_tiers=[(20, 2.5), (5, 3.0)])
+    priced = price_offers([1, 5, 5.01, 20, 80], rules=rules)
+    assert priced["markup"].tolist() == [3.0, 3.0, 2.5, 2.5, 2.0]
+
+
+def test_charm_rounding_rounds_up_to_ending():
+    rules = PricingRules(charm_cents=99)
+    priced = price_offers([1.0, 3.21, 3.925], rules=rules)
+    # 2.80 -> 2.99, 8.988 -> 8.99, 10.99 stays 10.99
+    assert priced["retail"].tolist() == [2.99, 8.99, 10.99]
+
+
+def test_fees_shipping_and_break_even_roas():
+    rules = PricingRules(
+        payment_fee_pct=3,
+        payment_fee_fixed=0.5,
+        platform_fee_pct=2,
+        shipping={"US": 4},
+        default_shipping=6,
+    )
+    priced = price_offers([10, 10], ["US", "AU"], rules)
+    # retail 28.00, fees 28 * 5 % + 0.50 = 1.90
+    assert priced["fees"].tolist() == [1.9, 1.9]
+    assert priced["net_profit"].tolist() == [12.1, 10.1]
+    assert priced["break_even_roas"].tolist() == [
+        round(28 / 12.1, 2),
+        round(28 / 10.1, 2),
+    ]
+
+
+def test_apply_pricing_fills_offers_and_handles_losses():
+    offers = [
+        {"unit_cost": 4.0, "shipping_regions": ["US"]},
+        {"unit_cost": 0.1},
+    ]
+    apply_pricing(offers, PricingRules(markup=1.0, payment_fee_fixed=0.3))
+    assert offers[0]["suggested_retail"] == 4.0
+    assert offers[1]["estimated_net_profit"] < 0
+    assert offers[1]["break_even_roas"] is None
@@ -0,0 +1,105 @@
+"""Tests for request coalescing (in-process and Redis lease variants)."""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from unittest.mock import patch
+
+import pytest
+
+from core.singleflight import SingleFlight, SingleFlightTimeout, redis_singleflight
+
+
+class FakeRedis:
+    """Just enough of redis.asyncio for lease handling (TTL is ignored)."""
+
+    def __init__(self) -> None:
+        self.data: dict[str, str] = {}
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def eval(self, script, numkeys, key, token):
+        if self.data.get(key) == token:
+            del self.data[key]
+            return 1
+        return 0
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return ["pin"]
+
+    results = await asyncio.gather(*(flight.do("k", work) for _ in range(10)))
+    assert calls == 1
+    assert all(r == ["pin"] for r in results)
+    assert flight.stats["coalesced"] == 9
+    assert flight.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_errors_propagate_to_every_caller():
+    flight = SingleFlight()
+
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("scrape failed")
+
+    results = await asyncio.gather(
+        *(flight.do("k", boom) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_redis_followers_reuse_leader_result():
+    fake = FakeRedis()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.3)
+        return {"count": 1}
+
+    async def get_fake():
+        return fake
+
+    with patch("core.singleflight.get_redis", get_fake):
+        results = await asyncio.gather(
+            *(redis_singleflight("t", "kw", work) for _ in range(3))
+        )
+    assert calls == 1
+    assert results == [{"count": 1}] * 3
+
+
+@pytest.mark.asyncio
+async def test_redis_follower_times_out_cleanly():
+    fake = FakeRedis()
+    fake.data["sf-lease:t"] = "token-of-a-stuck-leader"
+
+    async def get_fake():
+        return fake
+
+    async def work():
+        return "never"
+
+    with patch("core.singleflight.get_redis", get_fake), patch(
+        "core.singleflight._cache_key", lambda prefix, key: prefix
+    ), pytest.raises(SingleFlightTimeout):
+        await redis_singleflight("t", "kw", work, wait_timeout=0.3)
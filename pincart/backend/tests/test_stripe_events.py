@@ -0,0 +1,280 @@
+"""Tests for Stripe webhook ingestion and per-customer event processing."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import json
+from datetime import UTC, datetime
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from routers import billing
+from services import stripe_events
+
+
+class FakeDB:
+    """Enough of the Supabase query builder for ``users`` and ``stripe_events``."""
+
+    def __init__(self):
+        self.tables = {
+            "users": [{"id": "u1", "stripe_customer_id": "cus_1", "plan_tier": "free"}],
+            "stripe_events": [],
+        }
+        self.fail_users = False
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def event(self, event_id):
+        return next(r for r in self.tables["stripe_events"] if r["id"] == event_id)
+
+
+class FakeQuery:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.filters = []
+        self.action = "select"
+        self.payload = None
+        self.sort = []
+        self.count = None
+
+    def select(self, columns):
+        return self
+
+    def upsert(self, payload, on_conflict="", ignore_duplicates=False):
+        self.action, self.payload = "upsert", payload
+        return self
+
+    def update(self, payload):
+        self.action, self.payload = "update", payload
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda r: r.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        self.filters.append(lambda r: r.get(column) in values)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda r: r[column] >= value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda r: r[column] < value)
+        return self
+
+    def order(self, column, desc=False):
+        self.sort.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self.count = count
+        return self
+
+    def execute(self):
+        rows = self.db.tables[self.name]
+        if self.name == "users" and self.db.fail_users:
+            raise ConnectionError("supabase down")
+        if self.action == "upsert":
+            if any(r["id"] == self.payload["id"] for r in rows):
+                return SimpleNamespace(data=[])
+            rows.append(
+                {
+                    "status": "pending",
+                    "attempts": 0,
+                    "received_at": "2000-01-01T00:00:00+00:00",
+                    **self.payload,
+                }
+            )
+            return SimpleNamespace(data=[self.payload])
+        matched = [r for r in rows if all(f(r) for f in self.filters)]
+        if self.action == "update":
+            for row in matched:
+                row.update(self.payload)
+            return SimpleNamespace(data=matched)
+        for column, desc in reversed(self.sort):
+            matched.sort(key=lambda r: r[column], reverse=desc)
+        return SimpleNamespace(data=[dict(r) for r in matched[: self.count]])
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+
+def _event(event_id, event_type, created, customer="cus_1", **obj):
+    return {
+        "id": event_id,
+        "type": event_type,
+        "created": created,
+        "data": {"object": {"customer": customer, **obj}},
+    }
+
+
+def _subscription(event_id, created, price="price_pro", status="active"):
+    return _event(
+        event_id,
+        "customer.subscription.updated",
+        created,
+        status=status,
+        items={"data": [{"price": {"id": price}}]},
+    )
+
+
+@pytest.fixture()
+def db():
+    db = FakeDB()
+    redis = FakeRedis()
+
+    async def get_redis():
+        return redis
+
+    with patch.object(stripe_events, "supabase", db), patch.object(
+        stripe_events, "get_redis", get_redis
+    ), patch.object(
+        billing, "PLAN_PRICES", {"starter": "price_st", "pro": "price_pro"}
+    ):
+        db.redis = redis
+        yield db
+
+
+def _post(client, event):
+    return client.post(
+        "/stripe-webhook",
+        content=json.dumps(event),
+        headers={"stripe-signature": "t=1,v1=sig"},
+    )
+
+
+def test_webhook_stores_event_and_acks_redeliveries_once(client, db):
+    task = MagicMock()
+    event = _subscription("evt_1", 100)
+    with patch.object(billing.stripe.Webhook, "construct_event"), patch.object(
+        billing, "process_stripe_events_task", task
+    ):
+        first = _post(client, event)
+        again = _post(client, event)
+    assert first.json() == {"received": True}
+    assert again.json() == {"received": True, "duplicate": True}
+    task.delay.assert_called_once_with("cus_1", "evt_1")
+    [row] = db.tables["stripe_events"]
+    assert row["customer_id"] == "cus_1" and row["payload"] == event
+    assert row["created"] == "1970-01-01T00:01:40+00:00"
+    # Nothing is applied on the request path
+    assert db.tables["users"][0]["plan_tier"] == "free"
+
+
+def test_webhook_rejects_bad_signatures_and_asks_for_retry_without_store(client, db):
+    assert _post(client, _subscription("evt_1", 100)).status_code == 400
+
+    class Down:
+        def table(self, name):
+            raise ConnectionError("supabase down")
+
+    with patch.object(billing.stripe.Webhook, "construct_event"), patch.object(
+        stripe_events, "supabase", Down()
+    ):
+        assert _post(client, _subscription("evt_1", 100)).status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_events_apply_in_created_order_and_late_ones_do_not_roll_back(db):
+    checkout = _event(
+        "evt_c",
+        "checkout.session.completed",
+        100,
+        metadata={"user_id": "u1", "plan": "starter"},
+    )
+    deleted = _event("evt_d", "customer.subscription.deleted", 300)
+    # Delivered out of order: the deletion first, then the checkout
+    for event in (deleted, checkout):
+        stripe_events.record_event(event)
+    counts = await stripe_events.process_events("cus_1", "evt_d")
+    assert counts == {"processed": 2, "skipped": 0}
+    assert db.tables["users"][0]["plan_tier"] == "free"
+
+    # An upgrade created before the deletion arrives late and is skipped
+    stripe_events.record_event(_subscription("evt_u", 200))
+    assert await stripe_events.process_events("cus_1", "evt_u") == {
+        "processed": 0,
+        "skipped": 1,
+    }
+    assert db.tables["users"][0]["plan_tier"] == "free"
+    assert db.event("evt_u")["status"] == "skipped"
+    assert not db.redis.data  # lock released
+
+
+@pytest.mark.asyncio
+async def test_failed_event_holds_back_later_events(db):
+    stripe_events.record_event(_subscription("evt_1", 100, price="price_st"))
+    stripe_events.record_event(_event("evt_2", "customer.subscription.deleted", 200))
+    db.fail_users = True
+    with pytest.raises(stripe_events.EventFailed):
+        await stripe_events.process_events("cus_1", "evt_1")
+    assert db.event("evt_1")["status"] == "failed"
+    assert db.event("evt_1")["attempts"] == 1
+    assert db.event("evt_2")["status"] == "pending"
+    assert stripe_events.stuck_events(age=0) == [("cus_1", "evt_1")]
+
+    db.fail_users = False
+    await stripe_events.process_events("cus_1", "evt_2")
+    assert db.event("evt_1")["attempts"] == 2
+    assert db.tables["users"][0]["plan_tier"] == "free"
+
+
+@pytest.mark.asyncio
+async def test_busy_customer_is_retried(db):
+    stripe_events.record_event(_subscription("evt_1", 100))
+    db.redis.data["pincart:stripe:lock:cus_1"] = "other-worker"
+    with pytest.raises(stripe_events.CustomerBusy):
+        await stripe_events.process_events("cus_1", "evt_1")
+    assert db.event("evt_1")["status"] == "pending"
+
+
+@pytest.mark.asyncio
+async def test_replay_reapplies_a_time_range(db):
+    stripe_events.record_event(_subscription("evt_1", 100, price="price_st"))
+    stripe_events.record_event(_subscription("evt_2", 200))
+    await stripe_events.process_events("cus_1", "evt_1")
+    db.tables["users"][0]["plan_tier"] = "free"  # e.g. clobbered by a bad deploy
+
+    since = datetime.fromtimestamp(150, UTC)
+    until = datetime.fromtimestamp(250, UTC)
+    assert stripe_events.reset_range(since, until, dry_run=True) == [("cus_1", "evt_2")]
+    assert db.event("evt_2")["status"] == "processed"
+
+    work = stripe_events.reset_range(since, until)
+    with patch("core.cache.close_redis"):
+        totals = await stripe_events.replay(work)
+    assert totals == {"processed": 1, "skipped": 0, "failed": []}
+    assert db.tables["users"][0]["plan_tier"] == "pro"
+    assert db.event("evt_1")["attempts"] == 1
+    assert db.event("evt_2")["attempts"] == 2
+
+
+@pytest.mark.asyncio
+async def test_updated_users_are_dropped_from_the_profile_cache(db):
+    stripe_events.record_event(_event("evt_1", "customer.subscription.deleted", 100))
+    stripe_events.record_event(_event("evt_2", "invoice.payment_failed", 200))
+    with patch.object(stripe_events.profiles, "invalidate") as invalidate:
+        await stripe_events.process_events("cus_1", "evt_1")
+    invalidate.assert_awaited_once_with({"u1"})
+    assert db.event("evt_2")["status"] == "skipped"
@@ -0,0 +1,273 @@
+"""Tests for the supplier adapter engine and circuit breaker."""
+import asyncio
+import os
+import sys
+import time
+from unittest.mock import AsyncMock, patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+from services.supplier_engine import CircuitBreaker, SupplierAdapter, SupplierEngine
+
+
+def _ok(*costs):
+    return {"status": "ok", "results": [{"unit_cost": c} for c in costs]}
+
+
+class FakeLeaseRedis:
+    """The sorted-set commands ``core.leases`` uses."""
+
+    def __init__(self):
+        self.data: dict = {}
+
+    async def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+
+    async def zrem(self, key, member):
+        self.data.get(key, {}).pop(member, None)
+
+    async def zremrangebyscore(self, key, low, high):
+        entry = self.data.get(key, {})
+        for member in [m for m, score in entry.items() if score <= high]:
+            del entry[member]
+
+    async def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    async def expire(self, key, ttl):
+        return True
+
+    def pipeline(self, transaction=True):
+        return FakeLeasePipeline(self)
+
+
+class FakeLeasePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls: list = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+
+        return queue
+
+    async def execute(self):
+        return [
+            await getattr(self.redis, name)(*args, **kwargs)
+            for name, args, kwargs in self.calls
+        ]
+
+
+def test_breaker_opens_and_half_opens():
+    breaker = CircuitBreaker(threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    breaker.opened_at = time.monotonic() - 61
+    assert breaker.state == "half_open"
+    assert breaker.allow()  # One probe
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_search_returns_what_finished_within_budget():
+    async def fast(keyword):
+        return _ok(3.0)
+
+    async def slow(keyword):
+        await asyncio.sleep(0.5)
+        return _ok(1.0)
+
+    engine = SupplierEngine(
+        [
+            SupplierAdapter("fast", fast, hedge_after=None),
+            SupplierAdapter("slow", slow, hedge_after=None),
+        ],
+        budget=0.05,
+    )
+    started = time.monotonic()
+    found = await engine.search("mug")
+    assert time.monotonic() - started < 0.3
+    assert found["results"] == [{"unit_cost": 3.0}]
+    assert found["sources"] == {"fast": "ok", "slow": "timeout"}
+    await asyncio.gather(*engine._background)
+
+
+@pytest.mark.asyncio
+async def test_retries_then_trips_breaker():
+    calls = []
+
+    async def failing(keyword):
+        calls.append(keyword)
+        raise ConnectionError("boom")
+
+    adapter = SupplierAdapter(
+        "flaky",
+        failing,
+        retries=1,
+        hedge_after=None,
+        breaker=CircuitBreaker(threshold=3, reset_timeout=60),
+    )
+    engine = SupplierEngine([adapter], budget=1)
+
+    assert (await engine.search("mug"))["sources"] == {"flaky": "error"}
+    assert len(calls) == 2
+    assert (await engine.search("mug"))["sources"] == {"flaky": "error"}
+    assert adapter.breaker.state == "open"
+    assert (await engine.search("mug"))["sources"] == {"flaky": "open"}
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_hedge_takes_first_response():
+    delays = [0.5, 0.0]
+
+    async def fetch(keyword):
+        await asyncio.sleep(delays.pop(0))
+        return _ok(2.0)
+
+    adapter = SupplierAdapter("hedged", fetch, deadline=1, hedge_after=0.02)
+    found = await SupplierEngine([adapter], budget=0.3).search("mug")
+    assert found["sources"] == {"hedged": "ok"}
+    assert adapter.stats["hedges"] == 1
+
+
+@pytest.mark.asyncio
+async def test_blocked_counts_as_failure_without_retry():
+    calls = []
+
+    async def blocked(keyword):
+        calls.append(keyword)
+        return {"status": "blocked", "results": []}
+
+    adapter = SupplierAdapter("cj", blocked, hedge_after=None)
+    found = await SupplierEngine([adapter]).search("mug")
+    assert found["sources"] == {"cj": "blocked"}
+    assert len(calls) == 1
+    assert adapter.breaker.failures == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_is_per_supplier_across_searches():
+    active = []
+    peak = []
+
+    async def fetch(keyword):
+        active.append(keyword)
+        peak.append(len(active))
+        await asyncio.sleep(0.01)
+        active.remove(keyword)
+        return _ok(1.0)
+
+    adapter = SupplierAdapter("cj", fetch, hedge_after=None, max_concurrency=2)
+    engine = SupplierEngine([adapter], budget=1)
+    results = await asyncio.gather(*(engine.search(f"item {i}") for i in range(6)))
+    assert all(r["sources"] == {"cj": "ok"} for r in results)
+    assert max(peak) == 2
+
+
+@pytest.mark.asyncio
+async def test_shared_limit_caps_a_supplier_across_workers():
+    active = []
+    peak = []
+
+    async def fetch(keyword):
+        active.append(keyword)
+        peak.append(len(active))
+        await asyncio.sleep(0.06)
+        active.remove(keyword)
+        return _ok(1.0)
+
+    def worker():
+        # Each engine has its own semaphores, like a separate process
+        adapter = SupplierAdapter("cj", fetch, hedge_after=0.02, max_concurrency=2)
+        return adapter, SupplierEngine([adapter], shared_limits=True)
+
+    workers = [worker() for _ in range(3)]
+    redis = FakeLeaseRedis()
+    with patch("services.supplier_engine.get_redis", AsyncMock(return_value=redis)):
+        outcomes = await asyncio.gather(
+            *(
+                engine.call(adapter, f"item {i}")
+                for adapter, engine in workers
+                for i in range(4)
+            )
+        )
+    assert all(o["status"] == "ok" for o in outcomes)
+    assert max(peak) == 2
+    # No hedge got a shared slot while the other workers held them
+    assert redis.data["pincart:supplier:slots:cj"] == {}
+
+    # Without Redis each worker falls back to its own semaphore
+    peak.clear()
+    down = AsyncMock(side_effect=ConnectionError)
+    with patch("services.supplier_engine.get_redis", down):
+        await asyncio.gather(
+            *(
+                engine.call(adapter, f"item {i}")
+                for adapter, engine in workers
+                for i in range(4)
+            )
+        )
+    assert max(peak) == 2 * len(workers)
+
+
+@pytest.mark.asyncio
+async def test_queue_wait_is_not_counted_against_the_deadline():
+    active = []
+    peak = []
+
+    async def fetch(keyword):
+        active.append(keyword)
+        peak.append(len(active))
+        await asyncio.sleep(0.06)
+        active.remove(keyword)
+        return _ok(1.0)
+
+    # Healthy source, but 25 titles queue well past the deadline for a slot
+    adapter = SupplierAdapter(
+        "cj", fetch, deadline=0.12, hedge_after=0.04, max_concurrency=4
+    )
+    engine = SupplierEngine([adapter])
+    outcomes = await asyncio.gather(
+        *(engine.call(adapter, f"item {i}") for i in range(25))
+    )
+    assert all(o["status"] == "ok" for o in outcomes)
+    assert adapter.stats["failures"] == 0 and adapter.stats["skipped"] == 0
+    assert adapter.breaker.state == "closed"
+    assert max(peak) <= 4
+
+
+@pytest.mark.asyncio
+async def test_cancelled_probe_does_not_wedge_the_breaker():
+    async def hang(keyword):
+        await asyncio.sleep(10)
+
+    adapter = SupplierAdapter(
+        "cj", hang, hedge_after=None, breaker=CircuitBreaker(threshold=1)
+    )
+    adapter.breaker.record_failure()
+    adapter.breaker.opened_at = time.monotonic() - 61
+    engine = SupplierEngine([adapter])
+
+    probe = asyncio.ensure_future(engine.call(adapter, "mug"))
+    await asyncio.sleep(0.01)
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+    assert adapter.breaker.state == "half_open"
+    assert adapter.breaker.allow()  # The next call may probe again
@@ -0,0 +1,87 @@
+"""Tests for the incremental supplier parsers against the saved-page corpus."""
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+from services.supplier_parsers import (
+    PARSERS,
+    AliExpressParser,
+    CJParser,
+    iter_chunks,
+    parse_chunks,
+    parse_stream,
+)
+
+CORPUS = Path(__file__).parent / "fixtures" / "suppliers"
+EXPECTED = json.loads((CORPUS / "expected.json").read_text())
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096, None])
+@pytest.mark.parametrize("page", sorted(EXPECTED))
+def test_corpus_parses_identically_for_any_chunking(page, chunk_size):
+    case = EXPECTED[page]
+    parser = PARSERS[case["parser"]](limit=10)
+    data = (CORPUS / page).read_bytes()
+    assert parse_chunks(parser, iter_chunks(data, chunk_size)) == case["products"]
+
+
+def test_stops_reading_once_limit_reached():
+    data = (CORPUS / "aliexpress_search.html").read_bytes()
+    parser = AliExpressParser(limit=2)
+    chunks = list(iter_chunks(data, 1024))
+    consumed = 0
+    for chunk in chunks:
+        consumed += 1
+        if parser.feed(chunk):
+            break
+    assert len(parser.close()) == 2
+    assert consumed < len(chunks)
+
+
+def test_byte_cap_bounds_reading():
+    data = (CORPUS / "aliexpress_search.html").read_bytes()
+    parser = AliExpressParser(limit=5, max_bytes=8192)
+    assert parse_chunks(parser, iter_chunks(data, 1024)) == []
+    assert parser.bytes_read == 8192
+
+
+def test_adversarial_page_parses_in_linear_time():
+    data = (CORPUS / "aliexpress_adversarial.html").read_bytes() * 2
+    started = time.perf_counter()
+    parse_chunks(AliExpressParser(limit=5, max_bytes=len(data)), iter_chunks(data))
+    assert time.perf_counter() - started < 1.0
+
+
+def test_cj_skips_cards_without_price():
+    html = (
+        b'<a title="Card without a listed price"></a><div>Login</div>'
+        b'<a title="Card with its own price tag"></a><div>$4.50</div>'
+    )
+    assert parse_chunks(CJParser(limit=5), [html]) == [
+        {"title": "Card with its own price tag", "price": "4.50"}
+    ]
+
+
+def test_head_kept_for_block_detection():
+    data = (CORPUS / "aliexpress_captcha.html").read_bytes()
+    parser = AliExpressParser(limit=5)
+    parse_chunks(parser, iter_chunks(data, 16))
+    assert "captcha" in parser.head
+
+
+@pytest.mark.asyncio
+async def test_parse_stream_from_async_chunks():
+    data = (CORPUS / "cj_search.html").read_bytes()
+
+    async def body():
+        for chunk in iter_chunks(data, 2048):
+            yield chunk
+
+    products = await parse_stream(CJParser(limit=3), body())
+    assert products == EXPECTED["cj_search.html"]["products"][:3]
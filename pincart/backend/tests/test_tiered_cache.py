@@ -0,0 +1,162 @@
+"""Tests for the two-tier (LRU + Redis) stale-while-revalidate cache."""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from unittest.mock import patch
+
+import pytest
+
+from core.tiered_cache import LRUCache, TieredCache
+
+
+@pytest.fixture()
+def fake_redis():
+    """Replace the Redis-backed L2 helpers with a plain dict."""
+    store: dict = {}
+
+    async def fake_get(prefix, identifier):
+        return store.get((prefix, identifier))
+
+    async def fake_set(prefix, identifier, value, ttl=0):
+        store[(prefix, identifier)] = value
+
+    with patch("core.tiered_cache.cache_get", fake_get), patch(
+        "core.tiered_cache.cache_set", fake_set
+    ):
+        yield store
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(2)
+    lru.set("a", (0, 1))
+    lru.set("b", (0, 2))
+    lru.get("a")
+    lru.set("c", (0, 3))
+    assert lru.get("b") is None
+    assert lru.get("a") == (0, 1)
+    assert len(lru) == 2
+
+
+@pytest.mark.asyncio
+async def test_fresh_entry_skips_loader(fake_redis):
+    cache = TieredCache("t", fresh_ttl=60, stale_ttl=60)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        return ["pin"]
+
+    assert await cache.get_or_load("k", loader) == ["pin"]
+    assert await cache.get_or_load("k", loader) == ["pin"]
+    assert calls == 1
+    assert cache.stats["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_served_while_refreshing(fake_redis):
+    cache = TieredCache("t", fresh_ttl=60, stale_ttl=3600)
+    cache.l1.set("k", (time.time() - 120, ["old"]))
+
+    async def loader():
+        return ["new"]
+
+    assert await cache.get_or_load("k", loader) == ["old"]
+    await asyncio.sleep(0.01)
+    assert await cache.get_or_load("k", loader) == ["new"]
+    assert cache.stats["stale_served"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_stale_entry(fake_redis):
+    cache = TieredCache("t", fresh_ttl=60, stale_ttl=3600)
+    cache.l1.set("k", (time.time() - 120, ["old"]))
+
+    async def loader():
+        return []
+
+    assert await cache.get_or_load("k", loader) == ["old"]
+    await asyncio.sleep(0.01)
+    assert cache.l1.get("k")[1] == ["old"]
+
+
+@pytest.mark.asyncio
+async def test_l2_hit_is_promoted_to_l1(fake_redis):
+    fake_redis[("t", "k")] = {"ts": time.time(), "value": ["shared"]}
+    cache = TieredCache("t", fresh_ttl=60, stale_ttl=60)
+
+    async def loader():
+        raise AssertionError("should not scrape")
+
+    assert await cache.get_or_load("k", loader) == ["shared"]
+    assert cache.l1.get("k")[1] == ["shared"]
+    assert cache.stats["l2_hits"] == 1
+
+
+class FakeStore:
+    def __init__(self, entries=None) -> None:
+        self.entries = dict(entries or {})
+        self.saved: dict = {}
+
+    async def load(self, identifier):
+        return self.entries.get(identifier)
+
+    async def save(self, identifier, value):
+        self.saved[identifier] = value
+
+
+@pytest.mark.asyncio
+async def test_durable_store_serves_cold_start(fake_redis):
+    store = FakeStore({"k": (time.time() - 30, ["durable"])})
+    cache = TieredCache("t", fresh_ttl=60, stale_ttl=60, store=store)
+
+    async def loader():
+        raise AssertionError("should not scrape")
+
+    assert await cache.get_or_load("k", loader) == ["durable"]
+    assert cache.stats["store_hits"] == 1
+    assert fake_redis[("t", "k")]["value"] == ["durable"]
+
+
+@pytest.mark.asyncio
+async def test_fresh_results_are_persisted_to_store(fake_redis):
+    store = FakeStore()
+    cache = TieredCache("t", fresh_ttl=60, stale_ttl=60, store=store)
+
+    async def loader():
+        return ["pin"]
+
+    await cache.get_or_load("k", loader)
+    await asyncio.sleep(0)
+    assert store.saved == {"k": ["pin"]}
+
+
+@pytest.mark.asyncio
+async def test_empty_result_is_cached_briefly_without_hiding_stale_data(fake_redis):
+    cache = TieredCache("t", fresh_ttl=60, stale_ttl=3600, empty_ttl=30)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        return []
+
+    assert await cache.get_or_load("dead", loader) == []
+    assert await cache.get_or_load("dead", loader) == []
+    assert calls == 1
+    assert cache._ttls(cache.l1.get("dead")) == (30, 0)
+
+    # Once the short TTL runs out the keyword is tried again
+    cache.l1.set("dead", (time.time() - 31, []))
+    fake_redis.clear()
+    assert await cache.get_or_load("dead", loader) == [] and calls == 2
+
+    # A stale good entry is still served, not replaced by the empty reload
+    cache.l1.set("k", (time.time() - 120, ["old"]))
+    assert await cache.get_or_load("k", loader) == ["old"]
+    await asyncio.sleep(0.01)
+    assert cache.l1.get("k")[1] == ["old"]
@@ -0,0 +1,154 @@
+"""Tests for the cached user billing profile."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from routers import billing, generate
+from services import user_profiles
+from services.user_profiles import ProfileCache
+
+PROFILE = {
+    "plan_tier": "pro",
+    "stripe_customer_id": "cus_1",
+    "usage_reset_at": "2026-10-01T00:00:00+00:00",
+}
+
+
+@pytest.fixture()
+def redis():
+    """Fake L2: ``core.cache`` get/set backed by a dict."""
+    data = {}
+
+    async def cache_get(prefix, identifier):
+        return data.get((prefix, identifier))
+
+    async def cache_set(prefix, identifier, value, ttl=0):
+        data[(prefix, identifier)] = value
+
+    async def cache_unless_invalidated(user_id, profile, ttl, since):
+        marker = data.get(("profile", user_id))
+        if isinstance(marker, dict) and marker.get("invalidated_at", 0) >= since:
+            return False
+        data[("profile", user_id)] = profile
+        return True
+
+    with patch.object(user_profiles, "cache_get", cache_get), patch.object(
+        user_profiles, "cache_set", cache_set
+    ), patch.object(
+        user_profiles, "_cache_unless_invalidated", cache_unless_invalidated
+    ):
+        yield data
+
+
+@pytest.fixture()
+def loads():
+    calls = []
+
+    def load_profile(user_id):
+        calls.append(user_id)
+        return dict(PROFILE) if user_id == "u1" else None
+
+    with patch.object(user_profiles, "load_profile", load_profile):
+        yield calls
+
+
+@pytest.mark.asyncio
+async def test_profile_is_served_from_memory_then_redis(redis, loads):
+    cache = ProfileCache(l1_ttl=30)
+    assert await cache.get("u1") == PROFILE
+    assert await cache.get("u1") == PROFILE
+    assert loads == ["u1"]
+    assert redis[("profile", "u1")] == PROFILE
+
+    # Another process (empty L1) reads it from Redis
+    other = ProfileCache(l1_ttl=30)
+    assert await other.get("u1") == PROFILE
+    assert loads == ["u1"]
+    assert other.stats["l2_hits"] == 1
+
+    assert await cache.get(None) is None
+    assert await cache.get("nobody") is None
+    assert ("profile", "nobody") not in redis
+
+
+@pytest.mark.asyncio
+async def test_invalidate_forces_a_reload(redis, loads):
+    cache = ProfileCache()
+    await cache.get("u1")
+    await cache.invalidate(["u1"])
+    assert "invalidated_at" in redis[("profile", "u1")]
+    assert await cache.get("u1") == PROFILE
+    assert loads == ["u1", "u1"]
+
+
+@pytest.mark.asyncio
+async def test_load_racing_an_invalidation_is_not_cached(redis):
+    cache = ProfileCache()
+    started = asyncio.Event()
+    proceed = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    def slow_load(user_id):
+        loop.call_soon_threadsafe(started.set)
+        asyncio.run_coroutine_threadsafe(proceed.wait(), loop).result()
+        return {**PROFILE, "plan_tier": "starter"}  # read before the upgrade
+
+    with patch.object(user_profiles, "load_profile", slow_load):
+        pending = asyncio.ensure_future(cache.get("u1"))
+        await started.wait()
+        await cache.invalidate(["u1"])
+        proceed.set()
+        assert (await pending)["plan_tier"] == "starter"
+    assert len(cache.l1) == 0
+    assert "invalidated_at" in redis[("profile", "u1")]
+
+
+@pytest.mark.asyncio
+async def test_profile_write_checks_the_marker_inside_redis():
+    redis = AsyncMock()
+    redis.eval.return_value = 0  # an invalidation landed first
+    with patch.object(user_profiles, "get_redis", AsyncMock(return_value=redis)):
+        stored = await user_profiles._cache_unless_invalidated("u1", PROFILE, 60, 5.0)
+    assert stored is False
+    script, keys, key, value, ttl, since = redis.eval.await_args.args
+    assert script == user_profiles._SET_UNLESS_INVALIDATED and keys == 1
+    assert key == user_profiles._cache_key("profile", "u1")
+    assert (json.loads(value), ttl, since) == (PROFILE, 60, 5.0)
+
+
+@pytest.mark.asyncio
+async def test_plan_tier_reads_the_profile_cache(redis, loads):
+    with patch.object(generate, "profiles", ProfileCache()):
+        assert await generate._plan_tier("u1") == "pro"
+        assert await generate._plan_tier(None) is None
+
+    def down(user_id):
+        raise ConnectionError("supabase down")
+
+    with patch.object(generate, "profiles", ProfileCache()), patch.object(
+        user_profiles, "load_profile", down
+    ):
+        assert await generate._plan_tier("u2") == generate.UNKNOWN_PLAN
+
+
+def test_portal_uses_cached_customer(client, redis, loads):
+    body = {"user_id": "u1", "email": "a@b.co", "plan": "pro"}
+    session = SimpleNamespace(url="https://billing.stripe.test/p")
+    with patch.object(billing, "profiles", ProfileCache()), patch.object(
+        billing.stripe.billing_portal.Session, "create", return_value=session
+    ) as create:
+        for _ in range(2):
+            resp = client.post("/create-portal", json=body)
+            assert resp.json() == {"portal_url": session.url}
+        missing = client.post("/create-portal", json={**body, "user_id": "nobody"})
+    assert create.call_args.kwargs["customer"] == "cus_1"
+    assert loads == ["u1", "nobody"]
+    assert missing.status_code == 400
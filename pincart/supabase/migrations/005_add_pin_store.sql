@@ -0,0 +1,70 @@
+-- PinCart AI — Durable pin store
+-- Third cache tier behind the in-process and Redis caches for /discover.
+-- One row per pin (keyed by a hash of its image URL), linked to the keywords
+-- it was found under.
+
+CREATE TABLE IF NOT EXISTS public.pins (
+  image_hash text PRIMARY KEY,               -- sha256(image_url)
+  image_url text NOT NULL,
+  title text,
+  pin_url text,
+  first_seen_at timestamp with time zone NOT NULL DEFAULT now(),
+  scraped_at timestamp with time zone NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS public.pin_keywords (
+  keyword text NOT NULL,                     -- normalized keyword
+  image_hash text NOT NULL REFERENCES public.pins(image_hash) ON DELETE CASCADE,
+  rank integer NOT NULL,
+  demand_score integer NOT NULL DEFAULT 0,
+  scraped_at timestamp with time zone NOT NULL DEFAULT now(),
+  PRIMARY KEY (keyword, image_hash)
+);
+
+-- Keyword lookup is a single index range scan
+CREATE INDEX idx_pin_keywords_lookup
+  ON public.pin_keywords (keyword, rank, scraped_at);
+
+CREATE INDEX idx_pins_scraped ON public.pins (scraped_at);
+CREATE INDEX idx_searches_keyword_created ON public.searches (keyword, created_at);
+
+-- RLS — written and read by the backend service role only
+ALTER TABLE public.pins ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.pin_keywords ENABLE ROW LEVEL SECURITY;
+
+-- Atomically replace the pins stored for a keyword.
+-- p_pins: [{"image_hash", "image_url", "title", "pin_url", "rank", "demand_score"}]
+CREATE OR REPLACE FUNCTION public.save_keyword_pins(
+  p_keyword text,
+  p_pins jsonb
+)
+RETURNS void AS $$
+BEGIN
+  INSERT INTO public.pins (image_hash, image_url, title, pin_url, scraped_at)
+  SELECT p->>'image_hash', p->>'image_url', p->>'title', p->>'pin_url', now()
+    FROM jsonb_array_elements(p_pins) AS p
+  ON CONFLICT (image_hash) DO UPDATE
+     SET title = EXCLUDED.title,
+         pin_url = EXCLUDED.pin_url,
+         scraped_at = EXCLUDED.scraped_at;
+
+  DELETE FROM public.pin_keywords WHERE keyword = p_keyword;
+
+  INSERT INTO public.pin_keywords (keyword, image_hash, rank, demand_score, scraped_at)
+  SELECT p_keyword, p->>'image_hash', (p->>'rank')::integer,
+         COALESCE((p->>'demand_score')::integer, 0), now()
+    FROM jsonb_array_elements(p_pins) AS p;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Cleanup: remove pins no keyword has referenced for 30 days
+CREATE OR REPLACE FUNCTION public.cleanup_pins()
+RETURNS void AS $$
+BEGIN
+  DELETE FROM public.pin_keywords
+   WHERE scraped_at < now() - interval '30 days';
+  DELETE FROM public.pins p
+   WHERE p.scraped_at < now() - interval '30 days'
+     AND NOT EXISTS (SELECT 1 FROM public.pin_keywords k WHERE k.image_hash = p.image_hash);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
@@ -0,0 +1,32 @@
+-- PinCart AI — Generation revisions and usage metering
+-- Partial regenerations (POST /generate/sections) are stored as new rows
+-- pointing at the generation they revise, and cost a fraction of a full
+-- generation against the plan limit (PRD 5.3: 0.25 per section rewrite).
+
+ALTER TABLE public.generations
+  ADD COLUMN IF NOT EXISTS parent_id uuid REFERENCES public.generations(id) ON DELETE SET NULL,
+  ADD COLUMN IF NOT EXISTS revision integer NOT NULL DEFAULT 1,
+  ADD COLUMN IF NOT EXISTS regenerated_sections text[],
+  ADD COLUMN IF NOT EXISTS generation_cost numeric NOT NULL DEFAULT 1;
+
+CREATE INDEX IF NOT EXISTS idx_generations_parent
+  ON public.generations (parent_id);
+CREATE INDEX IF NOT EXISTS idx_generations_user_created
+  ON public.generations (user_id, created_at DESC);
+
+-- Atomically charge generation usage (supports 0.25 increments)
+CREATE OR REPLACE FUNCTION public.increment_generations_used(
+  p_user_id uuid,
+  p_amount numeric DEFAULT 1
+)
+RETURNS numeric AS $$
+DECLARE
+  used numeric;
+BEGIN
+  UPDATE public.users
+     SET generations_used = COALESCE(generations_used, 0) + p_amount
+   WHERE id = p_user_id
+  RETURNING generations_used INTO used;
+  RETURN used;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
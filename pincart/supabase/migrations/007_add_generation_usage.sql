@@ -0,0 +1,13 @@
+-- PinCart AI — Per-generation token usage and batch membership
+-- Pages generated through POST /generate/batch record the OpenAI tokens they
+-- used (0 when served from the generation cache) and the batch they belong to.
+
+ALTER TABLE public.generations
+  ADD COLUMN IF NOT EXISTS prompt_tokens integer,
+  ADD COLUMN IF NOT EXISTS completion_tokens integer,
+  ADD COLUMN IF NOT EXISTS total_tokens integer,
+  ADD COLUMN IF NOT EXISTS batch_id text;
+
+CREATE INDEX IF NOT EXISTS idx_generations_batch
+  ON public.generations (batch_id)
+  WHERE batch_id IS NOT NULL;
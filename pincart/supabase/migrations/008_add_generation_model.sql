@@ -0,0 +1,7 @@
+-- PinCart AI — Record the model that wrote each generation
+-- /generate routes between a primary and a cheaper fallback model (by plan
+-- and upstream health); the serving model is stored for cost and quality
+-- reporting.
+
+ALTER TABLE public.generations
+  ADD COLUMN IF NOT EXISTS model text;
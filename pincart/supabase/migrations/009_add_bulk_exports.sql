@@ -0,0 +1,10 @@
+-- PinCart AI — Bulk export bookkeeping
+-- POST /export/bulk writes one exports row per file covering many
+-- generations; record how many products it held and how they were picked.
+
+ALTER TABLE public.exports
+  ADD COLUMN IF NOT EXISTS product_count integer NOT NULL DEFAULT 1,
+  ADD COLUMN IF NOT EXISTS filters jsonb;
+
+CREATE INDEX IF NOT EXISTS idx_exports_user_created
+  ON public.exports (user_id, created_at DESC);
@@ -0,0 +1,7 @@
+-- PinCart AI — Stored export artifacts
+-- Export files are stored under a content hash and exports.csv_url points at
+-- the stored file; repeat exports reuse it, so look rows up by URL.
+
+CREATE INDEX IF NOT EXISTS idx_exports_csv_url
+  ON public.exports (csv_url)
+  WHERE csv_url IS NOT NULL;
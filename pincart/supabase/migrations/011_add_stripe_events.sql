@@ -0,0 +1,33 @@
+-- PinCart AI — Durable Stripe webhook event log
+-- POST /stripe-webhook stores each verified event here by its Stripe id and
+-- acks straight away; a Celery worker applies the events per customer in
+-- the order Stripe created them. Redelivered events hit the primary key
+-- and are dropped.
+
+CREATE TABLE IF NOT EXISTS public.stripe_events (
+  id text PRIMARY KEY,                       -- Stripe event id (evt_...)
+  type text NOT NULL,
+  customer_id text,                          -- Stripe customer (cus_...), when the event has one
+  created timestamp with time zone NOT NULL, -- Stripe's event.created
+  payload jsonb NOT NULL,
+  status text NOT NULL DEFAULT 'pending'
+    CHECK (status IN ('pending', 'processed', 'skipped', 'failed')),
+  attempts integer NOT NULL DEFAULT 0,
+  error text,
+  received_at timestamp with time zone NOT NULL DEFAULT now(),
+  processed_at timestamp with time zone
+);
+
+-- Per-customer processing walks events in creation order
+CREATE INDEX IF NOT EXISTS idx_stripe_events_customer_created
+  ON public.stripe_events (customer_id, created);
+
+-- Sweeps for stuck events and range replays
+CREATE INDEX IF NOT EXISTS idx_stripe_events_unprocessed
+  ON public.stripe_events (received_at)
+  WHERE status IN ('pending', 'failed');
+CREATE INDEX IF NOT EXISTS idx_stripe_events_created
+  ON public.stripe_events (created);
+
+-- RLS — written and read by the backend service role only
+ALTER TABLE public.stripe_events ENABLE ROW LEVEL SECURITY;